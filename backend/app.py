@@ -1,90 +1,123 @@
 # app.py
-from flask import Flask, jsonify, request, g, send_from_directory
+from flask import Flask, jsonify, current_app
 from flask_cors import CORS                         # -> CORS pour que le front (5173) appelle l'API (5000)
 from pymongo import MongoClient
-from bson import ObjectId
-from datetime import datetime, date, timezone
-from logging.handlers import RotatingFileHandler
-import logging, os, uuid
+import os
 from pathlib import Path
 
-# =============================
-# 1) App + JSON provider
-# =============================
-app = Flask(__name__)
-
-class MongoJSON(app.json_provider_class):
-    def default(self, o):
-        if isinstance(o, ObjectId):
-            return str(o)
-        if isinstance(o, (datetime, date)):
-            if isinstance(o, datetime) and o.tzinfo is None:
-                o = o.replace(tzinfo=timezone.utc)
-            return o.isoformat().replace("+00:00", "Z")
-        return super().default(o)
-
-app.json = MongoJSON(app)
+import compression
+import conditional
+import indexes
+import invalidation
+import json_codec
+import logging_pipeline
+import metrics
+import migrations
+import mongo_timing
+import softdelete
+import static_assets
 
 STATIC_DIR = Path(__file__).resolve().parent / "static"
 
-@app.route("/", defaults={"path": ""})
-@app.route("/<path:path>")
-def frontend(path):
-    target = STATIC_DIR / path
-    if path and target.exists():
-        return send_from_directory(STATIC_DIR, path)
-    return send_from_directory(STATIC_DIR, "index.html")
-
-CORS(app, resources={r"/api/*": {"origins": "*"}})
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+DB_NAME   = os.getenv("MONGO_DB", "hospital")
 
 
 # =============================
-# 2) Logs avec rotation (évite d'avoir un fichier énorme)
+# 1) JSON provider (orjson + types Mongo, cf. json_codec.py)
 # =============================
-os.makedirs("logs", exist_ok=True)
-handler = RotatingFileHandler("logs/backend_run.log", maxBytes=5_000_000, backupCount=5)
-handler.setLevel(logging.INFO)
-handler.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s in %(module)s: %(message)s"))
-
-# IMPORTANT : ne pas empiler plusieurs handlers si le reloader relance l'app
-if not app.logger.handlers:
-    app.logger.setLevel(logging.INFO)
-    app.logger.addHandler(handler)
+def init_json(app):
+    app.json = json_codec.make_provider(app)
 
-@app.before_request
-def _request_id():
-    # Un ID de requête pour tracer côté logs
-    g.request_id = request.headers.get("X-Request-ID", str(uuid.uuid4()))
-    app.logger.info(f"-> {g.request_id} {request.method} {request.path}")
 
-@app.after_request
-def _after(resp):
-    # On renvoie l'ID dans la réponse (utile côté front/outils)
-    resp.headers["X-Request-ID"] = g.get("request_id", "")
-    app.logger.info(f"<- {g.request_id} {request.method} {request.path} {resp.status_code}")
-    return resp
+# =============================
+# 2) Logs JSON via queue + thread listener (cf. logging_pipeline.py)
+# =============================
+def init_logging(app):
+    logging_pipeline.init_app(app)
+    # enregistré après les logs : son after_request passe avant (champs mongo_* dans la ligne)
+    mongo_timing.init_app(app)
 
 
 # =============================
-# 3) Connexion MongoDB
+# 3) Connexion MongoDB (une par processus)
 # =============================
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
-DB_NAME   = os.getenv("MONGO_DB", "hospital")
+def init_mongo(app):
+    """
+    Crée le MongoClient du processus courant.
+    MongoClient n'est pas fork-safe : chaque worker doit créer le sien APRÈS le fork
+    (cf. post_fork dans gunicorn.conf.py). connect=False -> aucune socket ni thread
+    de monitoring tant qu'aucune requête n'est faite ; bootstrap() ferme celui qui a servi
+    au démarrage (le master en preload reste propre).
+    """
+    # Timeouts courts = fail fast si Mongo est down
+    client = MongoClient(
+        MONGO_URI,
+        connect=False,
+        maxPoolSize=int(os.getenv("MONGO_MAX_POOL", "50")),
+        event_listeners=[mongo_timing.listener, metrics.pool_listener],
+        serverSelectionTimeoutMS=5000,
+        connectTimeoutMS=5000,
+        socketTimeoutMS=10000,
+    )
+    app.mongo_client = client
+    app.db = client[DB_NAME]
+    app.extensions["mongo_pid"] = os.getpid()
+
 
-# Timeouts courts = fail fast si Mongo est down
-client = MongoClient(
-    MONGO_URI,
-    serverSelectionTimeoutMS=5000,
-    connectTimeoutMS=5000,
-    socketTimeoutMS=10000,
-)
-app.db = client[DB_NAME]
+def init_process(app):
+    """
+    (Ré)initialise les ressources propres à un processus après un fork.
+    Idempotent : ne fait rien si le processus courant les possède déjà.
+    """
+    if app.extensions.get("mongo_pid") != os.getpid():
+        init_mongo(app)
+    logging_pipeline.start(app)
+    # suivi des changements pour les caches en mémoire (thread du worker, cf. invalidation.py)
+    invalidation.start(app)
+    # migrations de données en attente, par lots bornés (thread du worker, cf. migrations.py) ;
+    # index appliqués dès que les migrations bloquantes sont terminées
+    migrations.start(app, on_blocking_done=lambda: apply_indexes(app))
 
 
 # =============================
 # 4) Index & Seed
 # =============================
-def bootstrap():
+def apply_indexes(app):
+    """
+    Migrations bloquantes (deleted explicite) terminées ? -> filtre strict des documents
+    vivants (cf. softdelete.py) puis registre d'index (no-op si sa version est déjà appliquée,
+    cf. indexes.py). Sinon rien : elles tournent hors du démarrage (cf. migrations.py), qui
+    rappelle cette fonction.
+    """
+    try:
+        waiting = migrations.pending(app.db, blocking_only=True)
+    except Exception as exc:
+        app.logger.warning("[indexes] skipped: %s", exc)
+        return False
+    if waiting:
+        app.logger.warning("[indexes] skipped: %d migration(s) bloquante(s) en attente (%s…), "
+                           "cf. python migrations.py run", len(waiting), waiting[0])
+        return False
+    softdelete.backfilled()
+    if os.getenv("INDEXES_ON_START", "true").lower() not in ("1", "true", "yes"):
+        return False
+    try:
+        indexes.apply(app.db, log=app.logger.info)
+        return True
+    except Exception as exc:
+        app.logger.warning("[indexes] skipped: %s", exc)
+        return False
+
+
+def bootstrap(app):
+    """
+    Index et seed au démarrage. En preload, ce code tourne dans le master : le client
+    qui a servi est fermé puis remplacé par un client neuf (connect=False), pour
+    qu'aucune socket ni thread de monitoring ne traverse le fork (cf. init_mongo).
+    """
+    apply_indexes(app)
+
     if os.getenv("SEED_ON_START", "false").lower() in ("1", "true", "yes"):
         try:
             import seed
@@ -93,86 +126,134 @@ def bootstrap():
         except Exception as exc:
             app.logger.warning("[seed] skipped: %s", exc)
 
-bootstrap()
+    app.mongo_client.close()
+    init_mongo(app)
+
 
 # =============================
 # 5) Health / Ready
 # =============================
-@app.get("/health")
-def health():
-    return {"status": "ok"}, 200
+def register_core_routes(app):
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}, 200
 
-@app.get("/api/health")
-def api_health():
-    return health()
+    @app.get("/api/health")
+    def api_health():
+        return health()
 
-@app.get("/ready")
-def ready():
-    try:
-        client.admin.command("ping")
-        return {"status": "ready"}, 200
-    except Exception as e:
-        app.logger.exception(e)
-        return {"status": "not-ready", "error": str(e)}, 503
+    @app.get("/ready")
+    def ready():
+        try:
+            current_app.mongo_client.admin.command("ping")
+            return {"status": "ready"}, 200
+        except Exception as e:
+            app.logger.exception(e)
+            return {"status": "not-ready", "error": str(e)}, 503
+
+    # build du front indexé une fois (variantes .br/.gz, cache immutable, cf. static_assets.py)
+    manifest = static_assets.Manifest(STATIC_DIR)
+    app.extensions["static_manifest"] = manifest
+
+    @app.route("/", defaults={"path": ""})
+    @app.route("/<path:path>")
+    def frontend(path):
+        return static_assets.serve(manifest, path)
 
 
 # =============================
 # 6) Error handlers uniformes
 # =============================
-@app.errorhandler(404)
-def not_found(e):
-    return jsonify({"error": "Not Found", "details": str(e)}), 404
+def register_error_handlers(app):
+    @app.errorhandler(404)
+    def not_found(e):
+        return jsonify({"error": "Not Found", "details": str(e)}), 404
 
-@app.errorhandler(400)
-def bad_request(e):
-    return jsonify({"error": "Bad Request", "details": str(e)}), 400
+    @app.errorhandler(400)
+    def bad_request(e):
+        return jsonify({"error": "Bad Request", "details": str(e)}), 400
 
-@app.errorhandler(405)
-def method_not_allowed(e):
-    return jsonify({"error": "Method Not Allowed"}), 405
+    @app.errorhandler(405)
+    def method_not_allowed(e):
+        return jsonify({"error": "Method Not Allowed"}), 405
 
-@app.errorhandler(422)
-def unprocessable(e):
-    return jsonify({"error": "Unprocessable Entity", "details": str(e)}), 422
+    @app.errorhandler(422)
+    def unprocessable(e):
+        return jsonify({"error": "Unprocessable Entity", "details": str(e)}), 422
 
-@app.errorhandler(500)
-def server_error(e):
-    app.logger.exception(e)
-    return jsonify({"error": "Internal Server Error"}), 500
+    @app.errorhandler(500)
+    def server_error(e):
+        app.logger.exception(e)
+        return jsonify({"error": "Internal Server Error"}), 500
 
 
 # =============================
 # 7) Blueprints (routes)
 # =============================
-from routes.patients import bp as patients_bp
-from routes.doctors import bp as doctors_bp
-from routes.appointments import bp as appointments_bp
-from routes.prescriptions import bp as prescriptions_bp
-from routes.consultations import bp as consultations_bp
-from routes.laboratories import bp as laboratories_bp
-from routes.pharmacies import bp as pharmacies_bp
-from routes.payments import bp as payments_bp
-from routes.notifications import bp as notifications_bp
-from routes.health_authorities import bp as ha_bp
-from routes.contacts import bp as contacts_bp
-
-app.register_blueprint(patients_bp,        url_prefix="/api/patients")
-app.register_blueprint(doctors_bp,         url_prefix="/api/doctors")
-app.register_blueprint(appointments_bp,    url_prefix="/api/appointments")
-app.register_blueprint(prescriptions_bp,   url_prefix="/api/prescriptions")
-app.register_blueprint(consultations_bp,   url_prefix="/api/consultations")
-app.register_blueprint(laboratories_bp,    url_prefix="/api/laboratories")
-app.register_blueprint(pharmacies_bp,      url_prefix="/api/pharmacies")
-app.register_blueprint(payments_bp,        url_prefix="/api/payments")
-app.register_blueprint(notifications_bp,   url_prefix="/api/notifications")
-app.register_blueprint(ha_bp,              url_prefix="/api/health_authorities")
-app.register_blueprint(contacts_bp,        url_prefix="/api/contacts")
-
-
-# =============================
-# 8) Main
+def register_blueprints(app):
+    from routes.patients import bp as patients_bp
+    from routes.doctors import bp as doctors_bp
+    from routes.appointments import bp as appointments_bp
+    from routes.prescriptions import bp as prescriptions_bp
+    from routes.consultations import bp as consultations_bp
+    from routes.laboratories import bp as laboratories_bp
+    from routes.pharmacies import bp as pharmacies_bp
+    from routes.payments import bp as payments_bp
+    from routes.notifications import bp as notifications_bp
+    from routes.health_authorities import bp as ha_bp
+    from routes.contacts import bp as contacts_bp
+
+    app.register_blueprint(patients_bp,        url_prefix="/api/patients")
+    app.register_blueprint(doctors_bp,         url_prefix="/api/doctors")
+    app.register_blueprint(appointments_bp,    url_prefix="/api/appointments")
+    app.register_blueprint(prescriptions_bp,   url_prefix="/api/prescriptions")
+    app.register_blueprint(consultations_bp,   url_prefix="/api/consultations")
+    app.register_blueprint(laboratories_bp,    url_prefix="/api/laboratories")
+    app.register_blueprint(pharmacies_bp,      url_prefix="/api/pharmacies")
+    app.register_blueprint(payments_bp,        url_prefix="/api/payments")
+    app.register_blueprint(notifications_bp,   url_prefix="/api/notifications")
+    app.register_blueprint(ha_bp,              url_prefix="/api/health_authorities")
+    app.register_blueprint(contacts_bp,        url_prefix="/api/contacts")
+
+
+# =============================
+# 8) App factory
+# =============================
+def create_app():
+    """
+    Construit l'application Flask.
+    Utilisée par `flask run` (découverte auto de create_app), par wsgi.py (gunicorn)
+    et par le mode __main__ ci-dessous.
+    """
+    app = Flask(__name__)
+    init_json(app)
+
+    CORS(app, resources={r"/api/*": {"origins": "*"}},
+         expose_headers=["X-Request-ID", "X-Next-Cursor", "Link", "ETag"])
+
+    # premier enregistré -> son after_request passe en dernier (logs et métriques voient la taille brute)
+    compression.init_app(app)
+    init_logging(app)
+    metrics.init_app(app)
+    init_mongo(app)
+    conditional.init_app(app)
+
+    @app.before_request
+    def _ensure_process():
+        # Filet de sécurité si l'app est forkée sans passer par le hook post_fork
+        init_process(app)
+
+    bootstrap(app)
+    register_core_routes(app)
+    register_error_handlers(app)
+    register_blueprints(app)
+    return app
+
+
+# =============================
+# 9) Main (serveur de dev)
 # =============================
 if __name__ == "__main__":
     debug = os.getenv("FLASK_DEBUG", "0").lower() in ("1", "true", "yes")
-    # use_reloader=debug : pratique en dev. En prod -> False.
-    app.run(host="0.0.0.0", port=5000, debug=debug, use_reloader=debug)
+    # use_reloader=debug : pratique en dev. En prod -> gunicorn (voir wsgi.py / gunicorn.conf.py).
+    create_app().run(host="0.0.0.0", port=5000, debug=debug, use_reloader=debug)
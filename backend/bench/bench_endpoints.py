@@ -0,0 +1,291 @@
+# ===========================================================
+#  bench_endpoints.py — benchmark des routes par taille de jeu de données
+#
+#  Usage (depuis backend/, avec un mongod local) :
+#    python bench/bench_endpoints.py --sizes 1000 10000 100000
+#    python bench/bench_endpoints.py --sizes 10000 --baseline bench/baseline_endpoints.json
+#    python bench/bench_endpoints.py --sizes 10000 --save-baseline
+#
+#  Pour chaque taille (nombre de patients, cf. gen_data.py) :
+#    - vide la base de bench (MONGO_DB, doit contenir "bench") et la peuple
+#      avec gen_data (index du registre appliqués)
+#    - passe par l'app Flask complète (test client, sans réseau) sur
+#      list / get_one / create / patch de chaque blueprint
+#    - mesure req/s, p50, p99 et commandes Mongo par requête (lues dans
+#      l'en-tête Server-Timing, cf. mongo_timing.py)
+#
+#  Résultats : JSON (--out, défaut bench/results/endpoints-<date>.json).
+#  --baseline compare à un résultat de référence et sort en code 1 si une
+#  route régresse (p50 au-delà de --tolerance, ou plus de commandes Mongo).
+# ===========================================================
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+RESULTS_DIR = BACKEND_DIR / "bench" / "results"
+BASELINE = BACKEND_DIR / "bench" / "baseline_endpoints.json"
+
+_MONGO_CMDS = re.compile(r'mongo;dur=[\d.]+;desc="(\d+) cmds"')
+
+
+# -------------------------------
+# Scénarios : corps des requêtes
+# -------------------------------
+class Ctx:
+    """Identifiants échantillonnés dans la base + générateur pseudo-aléatoire reproductible."""
+
+    def __init__(self, db, seed, sample=500):
+        self.rng = random.Random(seed)
+        self.ids = {}
+        self._n = 0
+        for coll in ("facilities", "patients", "doctors", "appointments", "consultations", "prescriptions",
+                     "laboratories", "pharmacies", "payments", "notifications", "health_authorities"):
+            self.ids[coll] = [str(d["_id"]) for d in
+                              db[coll].aggregate([{"$sample": {"size": sample}}, {"$project": {"_id": 1}}])]
+
+    def pick(self, coll):
+        ids = self.ids.get(coll)
+        return self.rng.choice(ids) if ids else None
+
+    def seq(self):
+        self._n += 1
+        return f"{os.getpid()}-{self._n}"
+
+    def when(self):
+        return (datetime.now(timezone.utc) + timedelta(days=self.rng.randint(1, 60))).isoformat()
+
+
+CREATE = {
+    "patients": lambda c: {
+        "facility_id": c.pick("facilities"), "email": f"bench{c.seq()}@example.org",
+        "identite": {"prenom": "Bench", "nom": "Patient", "date_naissance": "1990-01-01T00:00:00Z", "sexe": "F"},
+    },
+    "doctors": lambda c: {
+        "facility_id": c.pick("facilities"), "license_number": f"BENCH-{c.seq()}",
+        "identite": {"prenom": "bench", "nom": "doctor"}, "specialites": ["General Medicine"],
+    },
+    "appointments": lambda c: {
+        "patient_id": c.pick("patients"), "doctor_id": c.pick("doctors"),
+        "facility_id": c.pick("facilities"), "date_time": c.when(), "reason": "bench",
+    },
+    "consultations": lambda c: {
+        "patient_id": c.pick("patients"), "doctor_id": c.pick("doctors"),
+        "facility_id": c.pick("facilities"), "date_time": c.when(), "diagnostic": "bench",
+    },
+    "prescriptions": lambda c: {
+        "patient_id": c.pick("patients"), "doctor_id": c.pick("doctors"),
+        "consultation_id": c.pick("consultations"),
+        "items": [{"dci": "Paracétamol", "forme": "cp", "posologie": "1 x3/j", "duree_j": 5}],
+    },
+    "laboratories": lambda c: {
+        "patient_id": c.pick("patients"), "doctor_id": c.pick("doctors"), "status": "ordered",
+        "tests": [{"code": "GLY", "name": "Glycémie", "status": "ordered"}],
+    },
+    "pharmacies": lambda c: {
+        "patient_id": c.pick("patients"), "doctor_id": c.pick("doctors"), "status": "requested",
+        "prescription_id": c.pick("prescriptions"), "items": [{"dci": "Paracétamol", "qty": 12}],
+    },
+    "payments": lambda c: {
+        "patient_id": c.pick("patients"), "amount": 5000, "currency": "XAF", "status": "pending",
+    },
+    "notifications": lambda c: {
+        "channel": "sms", "status": "queued", "template": "bench", "to_patient_id": c.pick("patients"),
+    },
+    "health_authorities": lambda c: {
+        "facility_id": c.pick("facilities"), "report_type": "case_summary", "status": "draft",
+        "period_start": "2025-01-01T00:00:00Z", "period_end": "2025-01-31T00:00:00Z",
+    },
+}
+
+PATCH = {
+    "patients":      lambda c: {"notes": "bench"},
+    "doctors":       lambda c: {"specialites": ["General Medicine", "Pediatrics"]},
+    "appointments":  lambda c: {"notes": "bench"},
+    "consultations": lambda c: {"notes": "bench"},
+    "prescriptions": lambda c: {"notes": "bench"},
+    "laboratories":  lambda c: {"notes": "bench"},
+    "pharmacies":    lambda c: {"status": "prepared"},
+    "payments":      lambda c: {"notes": "bench"},
+}
+
+
+def scenarios(ctx):
+    """(route, scénario, fabrique de requête) ; fabrique -> (méthode, url, corps)."""
+    out = []
+    for route in CREATE:
+        base = f"/api/{route}"
+        out.append((route, "list", lambda c, b=base: ("GET", f"{b}?limit=50", None)))
+        if ctx.ids.get(route):
+            out.append((route, "get_one", lambda c, b=base, r=route: ("GET", f"{b}/{c.pick(r)}", None)))
+        out.append((route, "create", lambda c, b=base, r=route: ("POST", b, CREATE[r](c))))
+        if route in PATCH and ctx.ids.get(route):
+            out.append((route, "patch", lambda c, b=base, r=route: ("PATCH", f"{b}/{c.pick(r)}", PATCH[r](c))))
+    return out
+
+
+# -------------------------------
+# Mesure
+# -------------------------------
+def _pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_scenario(client, ctx, make, requests, warmup):
+    lat, ops, errors = [], [], 0
+    for i in range(warmup + requests):
+        method, url, body = make(ctx)
+        t0 = time.perf_counter()
+        resp = client.open(url, method=method, json=body)
+        dt = (time.perf_counter() - t0) * 1000
+        if i < warmup:
+            continue
+        if resp.status_code >= 400:
+            errors += 1
+        lat.append(dt)
+        m = _MONGO_CMDS.search(resp.headers.get("Server-Timing", ""))
+        if m:
+            ops.append(int(m.group(1)))
+    total_s = sum(lat) / 1000
+    return {
+        "rps": round(len(lat) / total_s, 1) if total_s else 0.0,
+        "p50_ms": round(_pct(lat, 0.50), 3),
+        "p99_ms": round(_pct(lat, 0.99), 3),
+        "mongo_ops": round(sum(ops) / len(ops), 2) if ops else None,
+        "errors": errors,
+    }
+
+
+def populate(db, size, seed):
+    import gen_data
+
+    for coll in db.list_collection_names():
+        db.drop_collection(coll)
+    gen_data.main(["--patients", str(size), "--seed", str(seed), "--tag", "bec0"])
+
+
+# -------------------------------
+# Baseline
+# -------------------------------
+def _key(r):
+    return f"{r['size']}|{r['route']}|{r['scenario']}"
+
+
+def compare(results, baseline, tolerance):
+    """Affiche les écarts ; -> liste des régressions."""
+    base = {_key(r): r for r in baseline["results"]}
+    regressions = []
+    print(f"\n{'size|route|scenario':<40} {'p50 ms':>16} {'mongo ops':>14}")
+    for r in results:
+        b = base.get(_key(r))
+        if b is None:
+            continue
+        slower = r["p50_ms"] > b["p50_ms"] * (1 + tolerance)
+        more_ops = (r["mongo_ops"] or 0) > (b["mongo_ops"] or 0) + 0.01
+        flag = "  <-- régression" if slower or more_ops else ""
+        print(f"{_key(r):<40} {b['p50_ms']:>7.2f} -> {r['p50_ms']:<7.2f} "
+              f"{b['mongo_ops'] or 0:>5} -> {r['mongo_ops'] or 0:<5}{flag}")
+        if flag:
+            regressions.append(_key(r))
+    return regressions
+
+
+def _git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="nombre de patients")
+    ap.add_argument("--requests", type=int, default=200, help="requêtes mesurées par scénario")
+    ap.add_argument("--warmup", type=int, default=20)
+    ap.add_argument("--routes", nargs="+", help="restreindre à ces blueprints")
+    ap.add_argument("--db", default=os.getenv("MONGO_DB", "hospital_bench"))
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--no-generate", action="store_true", help="utiliser la base telle quelle (une seule taille)")
+    ap.add_argument("--out", type=Path)
+    ap.add_argument("--baseline", type=Path, help="résultat de référence à comparer")
+    ap.add_argument("--tolerance", type=float, default=0.20, help="hausse de p50 tolérée (0.20 = +20%%)")
+    ap.add_argument("--save-baseline", action="store_true", help=f"écrire aussi {BASELINE.name}")
+    args = ap.parse_args()
+
+    if "bench" not in args.db:
+        sys.exit(f"--db {args.db} : la base est vidée à chaque taille, son nom doit contenir 'bench'")
+
+    # Avant l'import de app (lu à l'import) : base dédiée, Server-Timing actif, logs hors du dépôt
+    os.environ["MONGO_DB"] = args.db
+    os.environ["SERVER_TIMING"] = "true"
+    os.environ.setdefault("LOG_FILE", str(Path(tempfile.gettempdir()) / "bench_endpoints.log"))
+    os.environ.setdefault("LOG_SAMPLE_RATE", "0")
+
+    from app import create_app
+
+    app = create_app()
+    client = app.test_client()
+    db = app.db
+
+    sizes = [None] if args.no_generate else args.sizes
+    results = []
+    print(f"{'size':>8} {'route':<20} {'scenario':<8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'ops':>5} {'err':>4}")
+    for size in sizes:
+        if size is not None:
+            populate(db, size, args.seed)
+        else:
+            size = db.patients.estimated_document_count()
+        ctx = Ctx(db, args.seed)
+        for route, scenario, make in scenarios(ctx):
+            if args.routes and route not in args.routes:
+                continue
+            r = run_scenario(client, ctx, make, args.requests, args.warmup)
+            r.update(size=size, route=route, scenario=scenario)
+            results.append(r)
+            print(f"{size:>8} {route:<20} {scenario:<8} {r['rps']:>8.1f} {r['p50_ms']:>8.2f} "
+                  f"{r['p99_ms']:>8.2f} {r['mongo_ops'] or 0:>5} {r['errors']:>4}")
+
+    doc = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(),
+            "git": _git_rev(),
+            "python": platform.python_version(),
+            "mongo": db.client.server_info().get("version"),
+            "requests": args.requests,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    out = args.out or RESULTS_DIR / f"endpoints-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(doc, indent=2, ensure_ascii=False))
+    print(f"\n[bench] résultats : {out}")
+    if args.save_baseline:
+        BASELINE.write_text(json.dumps(doc, indent=2, ensure_ascii=False))
+        print(f"[bench] baseline : {BASELINE}")
+
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+        if regressions:
+            print(f"[bench] {len(regressions)} régression(s)")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
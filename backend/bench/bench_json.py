@@ -0,0 +1,85 @@
+# ===========================================================
+#  bench_json.py — micro-benchmark des providers JSON
+#
+#  Usage (depuis backend/, sans Mongo) :
+#    python bench/bench_json.py -n 500
+#
+#  Encode une liste de 200 documents « type Mongo » (ObjectId, datetime,
+#  sous-documents) comme le ferait une route list_, puis décode un corps
+#  de POST. Compare le provider stdlib et le provider orjson.
+#  --decimal ajoute un Decimal128 par document (rare dans nos collections,
+#  mais coûteux : bson.Decimal128.to_decimal est en Python pur).
+# ===========================================================
+
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bson import ObjectId  # noqa: E402
+from bson.decimal128 import Decimal128  # noqa: E402
+from flask import Flask  # noqa: E402
+
+import json_codec  # noqa: E402
+
+
+def sample_docs(n=200, decimal=False):
+    now = datetime(2025, 10, 15, 18, 0, tzinfo=timezone.utc)
+    return [{
+        "_id": ObjectId(),
+        "patient_id": ObjectId(),
+        "doctor_id": ObjectId(),
+        "facility_id": ObjectId(),
+        "status": "scheduled",
+        "date_time": now + timedelta(minutes=15 * i),
+        "items": [
+            {"dci": "Paracetamol", "forme": "cp", "posologie": "1 cp x3/j", "duree_j": 4},
+            {"dci": "Amoxicilline", "forme": "gel", "posologie": "2 x/j", "duree_j": 7},
+        ],
+        "amount": Decimal128("12500.50") if decimal else 12500.5,
+        "identite": {"prenom": "Alice", "nom": "NDJAMENA", "sexe": "F",
+                     "date_naissance": datetime(1995, 6, 10)},
+        "created_at": now.replace(tzinfo=None),
+        "updated_at": now,
+        "deleted": False,
+    } for i in range(n)]
+
+
+def bench(label, fn, n):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    dt = (time.perf_counter() - t0) / n * 1e6
+    print(f"{label:<34} {dt:>10.1f} µs")
+    return dt
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=500)
+    ap.add_argument("--decimal", action="store_true")
+    args = ap.parse_args()
+
+    docs = sample_docs(decimal=args.decimal)
+    body = b'{"patient_id": "65f0c0ffee0000000000aaaa", "items": [' + b", ".join(
+        [b'{"dci": "Paracetamol", "posologie": "1 cp x3/j", "duree_j": 4}'] * 20) + b"]}"
+
+    for name, cls in json_codec.PROVIDERS.items():
+        if name == "orjson" and json_codec.orjson is None:
+            print("orjson non installé : ignoré")
+            continue
+        app = Flask(__name__)
+        app.json = cls(app)
+        print(f"--- {name}")
+        bench("dumps 200 docs", lambda: app.json.dumps(docs), args.n)
+        with app.app_context():
+            bench("response(200 docs)", lambda: app.json.response(docs), args.n)
+        bench("loads POST body", lambda: app.json.loads(body), args.n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# ===========================================================
+#  bench_logging.py — coût du logging de requêtes par requête
+#
+#  Usage (depuis backend/, pas besoin de Mongo : /health uniquement) :
+#    python bench/bench_logging.py -n 20000 --sample 1.0 0.1 0.0
+#
+#  Affiche, pour chaque taux d'échantillonnage :
+#    - le temps moyen du hook after_request (enqueue compris)
+#    - le temps total moyen d'une requête via le test client
+#    - les records en file / jetés / échantillonnés
+# ===========================================================
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.mkdtemp(), "bench.log"))
+
+import logging_pipeline  # noqa: E402
+from app import create_app  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=20000)
+    ap.add_argument("--sample", type=float, nargs="+", default=[1.0, 0.1, 0.0])
+    args = ap.parse_args()
+
+    app = create_app()
+    client = app.test_client()
+    for _ in range(200):  # warm-up
+        client.get("/health")
+
+    print(f"{'sample':>6} {'hook µs':>8} {'req µs':>8} {'enqueued':>9} {'dropped':>8} {'sampled':>8}")
+    for rate in args.sample:
+        logging_pipeline.LOG_SAMPLE_RATE = rate
+        for k in logging_pipeline._stats:
+            logging_pipeline._stats[k] = 0
+        t0 = time.perf_counter()
+        for _ in range(args.n):
+            client.get("/health")
+        per_req = (time.perf_counter() - t0) / args.n * 1e6
+        st = logging_pipeline.stats()
+        print(f"{rate:>6.2f} {st['hook_us_avg']:>8.2f} {per_req:>8.1f} "
+              f"{st['enqueued']:>9} {st['dropped']:>8} {st['sampled_out']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# ===========================================================
+#  bench_workers.py — débit en fonction du nombre de workers gunicorn
+#
+#  Usage (depuis backend/, avec un mongod local peuplé) :
+#    python bench/bench_workers.py --workers 1 2 4 8 --duration 10
+#
+#  Pour chaque valeur de WEB_CONCURRENCY :
+#    - lance gunicorn (gunicorn.conf.py) sur un port libre
+#    - attend /ready
+#    - envoie des GET keep-alive sur /api/patients et /api/appointments
+#      depuis plusieurs processus clients (pas de GIL partagé avec le serveur)
+#    - affiche req/s, p50 et p99
+# ===========================================================
+
+import argparse
+import http.client
+import multiprocessing as mp
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+PATHS = ("/api/patients", "/api/appointments")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/ready")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"serveur non prêt sur :{port}")
+
+
+def _client(port, path, duration, out):
+    """Boucle GET keep-alive pendant `duration` secondes ; renvoie les latences (ms)."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    lat, errors = [], 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        t0 = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status != 200:
+                errors += 1
+        except OSError:
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            continue
+        lat.append((time.perf_counter() - t0) * 1000)
+    out.put((lat, errors))
+
+
+def _pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_one(workers, threads, clients, duration, path):
+    port = _free_port()
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads),
+               PORT=str(port), GUNICORN_LOG_LEVEL="warning")
+    srv = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    try:
+        _wait_ready(port)
+        out = mp.Queue()
+        procs = [mp.Process(target=_client, args=(port, path, duration, out)) for _ in range(clients)]
+        for p in procs:
+            p.start()
+        lat, errors = [], 0
+        for _ in procs:
+            l, e = out.get()
+            lat += l
+            errors += e
+        for p in procs:
+            p.join()
+        return {
+            "rps": len(lat) / duration,
+            "p50": _pct(lat, 0.50),
+            "p99": _pct(lat, 0.99),
+            "errors": errors,
+        }
+    finally:
+        srv.terminate()
+        srv.wait(timeout=30)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--threads", type=int, default=4)
+    ap.add_argument("--clients", type=int, default=16, help="processus clients concurrents")
+    ap.add_argument("--duration", type=float, default=10.0)
+    args = ap.parse_args()
+
+    print(f"{'path':<20} {'workers':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'err':>5}")
+    for path in PATHS:
+        for w in args.workers:
+            r = run_one(w, args.threads, args.clients, args.duration, path)
+            print(f"{path:<20} {w:>7} {r['rps']:>9.1f} {r['p50']:>8.2f} {r['p99']:>8.2f} {r['errors']:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# ===========================================================
+#  bulk.py — créations en masse (POST /api/<ressource>/bulk)
+#
+#  Corps accepté :
+#    - tableau JSON            [ {...}, {...} ]
+#    - NDJSON                  un objet par ligne (Content-Type: application/x-ndjson)
+#
+#  Chaque élément passe par la même préparation que la création unitaire
+#  (_prepare de la route : validation + normalisation, sans accès base),
+#  puis :
+#    - toutes les références des éléments valides sont vérifiées en UNE requête
+#      (utils.existing_refs)
+#    - réservations éventuelles (créneaux des rendez-vous, cf. scheduling.py),
+#      refusées document par document
+#    - les documents sont écrits par insert_many(ordered=False) : un document
+#      rejeté (validator Mongo) n'empêche pas les autres
+#
+#  Réponse : {"inserted": n, "ids": [...|null], "errors": [{"index", "error", ...}]}
+#    201 tout est inséré, 207 insertion partielle, 400 rien d'inséré.
+#
+#  Transitions de statut en masse (POST /api/<ressource>/bulk/status) :
+#    {"status": "checked_in", "ids": [...]}              liste explicite
+#    {"status": "completed", "filter": {"doctor_id": …,  filtre d'égalité sur les
+#        "status": "in_progress", "date_from": …}}       champs indexés de la liste
+#  Un seul update_many pour tout le lot, avec les mêmes effets de bord que le
+#  PATCH unitaire (date_reported, dispensed_at, paid_at…). Les documents
+#  réellement modifiés sont ceux lus, avant l'update_many, sous son filtre
+#  (relus si un autre appel en a modifié entre-temps) ; aucun marqueur n'est
+#  laissé sur les documents.
+#
+#  BULK_MAX_ITEMS (5000) : taille maximale d'un lot (413 au-delà).
+# ===========================================================
+
+import os
+
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import abort, current_app, request
+from pymongo.errors import BulkWriteError
+
+import indexes
+from softdelete import live
+from streaming import NDJSON
+from utils import existing_refs, iso_to_dt, json_body
+
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "5000"))
+
+
+def read_items():
+    """Éléments du corps (tableau JSON ou NDJSON) ; 400 si illisible, 413 si trop nombreux."""
+    data = request.get_data(cache=True)
+    if request.mimetype == NDJSON or (data.lstrip()[:1] not in (b"[", b"")):
+        loads = current_app.json.loads
+        items = []
+        for n, line in enumerate(data.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                items.append(loads(line))
+            except ValueError:
+                abort(400, description=f"NDJSON invalide (ligne {n})")
+    else:
+        items = json_body()
+        if not isinstance(items, list):
+            abort(400, description="tableau JSON ou NDJSON attendu")
+    if len(items) > BULK_MAX_ITEMS:
+        abort(413, description=f"au plus {BULK_MAX_ITEMS} éléments par lot")
+    return items
+
+
+def create_many(coll, prepare, missing_status=404, enrich=None, reserve=None, release=None):
+    """
+    Crée les éléments du corps dans `coll`.
+    prepare(b) -> (doc, refs) ; lève ValueError(message) si l'élément est invalide.
+    refs : [(collection, _id, message si absent)], comme pour utils.missing_refs.
+    enrich(docs) : complète en une fois les documents retenus (ex. names.fill).
+    reserve(docs) -> {position: {"error", "status", …}} : réservations préalables (ex. créneaux,
+    cf. scheduling.py), refus par document ; release(docs) rend celles des documents non insérés.
+    """
+    items = read_items()
+    errors, prepared = [], []
+    for i, b in enumerate(items):
+        if not isinstance(b, dict):
+            errors.append({"index": i, "error": "objet JSON attendu", "status": 400})
+            continue
+        try:
+            doc, refs = prepare(b)
+        except (ValueError, TypeError) as e:
+            errors.append({"index": i, "error": str(e), "status": 400})
+            continue
+        prepared.append((i, doc, refs))
+
+    # références de tout le lot : un seul aller-retour
+    found = existing_refs([r for _, _, refs in prepared for r in refs])
+    docs, positions = [], []
+    for i, doc, refs in prepared:
+        missing = [msg for c, oid, msg in refs if c is not None and oid is not None and (c, oid) not in found]
+        if missing:
+            errors.append({"index": i, "error": missing[0], "status": missing_status})
+            continue
+        docs.append(doc)
+        positions.append(i)
+
+    ids = [None] * len(items)
+    if docs and reserve is not None:
+        refused = reserve(docs)
+        for k, err in refused.items():
+            errors.append({"index": positions[k], **err})
+        docs = [d for k, d in enumerate(docs) if k not in refused]
+        positions = [p for k, p in enumerate(positions) if k not in refused]
+    if docs:
+        if enrich is not None:
+            enrich(docs)
+        failed = set()
+        try:
+            coll.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            for we in e.details.get("writeErrors", []):
+                failed.add(we["index"])
+                errors.append({"index": positions[we["index"]], "error": "validation_mongo",
+                               "status": 400, "details": we.get("errInfo") or we.get("errmsg")})
+            if release is not None:
+                release([docs[k] for k in failed])
+        # insert_many affecte les _id côté client : ceux des documents non rejetés sont écrits
+        for k, doc in enumerate(docs):
+            if k not in failed:
+                ids[positions[k]] = doc["_id"]
+
+    inserted = sum(1 for x in ids if x is not None)
+    errors.sort(key=lambda e: e["index"])
+    status = 201 if not errors else (207 if inserted else 400)
+    return {"inserted": inserted, "ids": ids, "errors": errors}, status
+
+
+# -----------------------------------------------------------
+# Transitions de statut
+# -----------------------------------------------------------
+def _target_query(coll, b):
+    """Corps {"ids"} ou {"filter"} -> filtre Mongo des documents visés (ValueError si invalide)."""
+    if "ids" in b:
+        ids = b["ids"]
+        if not isinstance(ids, list) or not ids:
+            raise ValueError("ids doit être un tableau non vide")
+        if len(ids) > BULK_MAX_ITEMS:
+            abort(413, description=f"au plus {BULK_MAX_ITEMS} éléments par lot")
+        try:
+            return [ObjectId(x) for x in ids]
+        except (InvalidId, TypeError):
+            raise ValueError("ids : ObjectId invalide")
+
+    f = b.get("filter")
+    if not isinstance(f, dict) or not f:
+        raise ValueError("ids ou filter requis")
+    sort_field, _, eq_fields = indexes.LISTS[coll.name]
+    q = live()
+    for k, v in f.items():
+        if k in ("date_from", "date_to"):
+            rng = q.setdefault(sort_field, {})
+            rng["$gte" if k == "date_from" else "$lte"] = iso_to_dt(v, k)
+        elif k in eq_fields:
+            try:
+                q[k] = ObjectId(v) if k.endswith("_id") else v
+            except (InvalidId, TypeError):
+                raise ValueError(f"{k} invalide")
+        else:
+            raise ValueError(f"filtre non supporté : {k} ({'|'.join(eq_fields + ['date_from', 'date_to'])})")
+    return q
+
+
+def transition_many(coll, allowed, stamps=None, guard=None):
+    """
+    Passe les documents visés au statut demandé.
+    allowed : statuts autorisés ; stamps : {statut: champ date posé à la transition}.
+    guard(statut) -> filtre supplémentaire des documents modifiables (les autres restent "unchanged").
+    -> {"status", "changed": [...], "unchanged": [...], "not_found": [...]}
+    """
+    b = json_body() or {}
+    target = b.get("status")
+    if target not in allowed:
+        return {"error": f"status invalide ({'|'.join(sorted(allowed))})"}, 400
+    try:
+        sel = _target_query(coll, b)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    if isinstance(sel, dict):
+        # filtre -> ids (projection _id seule), borné pour rester un lot
+        ids = [d["_id"] for d in coll.find(sel, {"_id": 1}).limit(BULK_MAX_ITEMS + 1)]
+        if len(ids) > BULK_MAX_ITEMS:
+            return {"error": f"filtre trop large (> {BULK_MAX_ITEMS} documents)"}, 413
+    else:
+        ids = list(dict.fromkeys(sel))
+
+    now = datetime.now(timezone.utc)
+    update = {"status": target, "updated_at": now}
+    if stamps and target in stamps:
+        update[stamps[target]] = now
+
+    changed, unchanged = [], []
+    if ids:
+        # pré-lecture sous le filtre de la mise à jour : documents vivants, puis ceux à modifier
+        found = {d["_id"]: d.get("status") for d in coll.find(live({"_id": {"$in": ids}}), {"status": 1})}
+        extra = guard(target) if guard is not None else None
+
+        def todo_filter(sub):
+            q = live({"_id": {"$in": sub}, "status": {"$ne": target}})
+            return {"$and": [q, extra]} if extra else q
+
+        todo = [i for i in ids if i in found and found[i] != target]
+        if todo and extra:
+            keep = {d["_id"] for d in coll.find(todo_filter(todo), {"_id": 1})}
+            todo = [i for i in todo if i in keep]
+        if todo:
+            res = coll.update_many(todo_filter(todo), {"$set": update})
+            if res.modified_count < len(todo):
+                # modifiés entre-temps par un autre appel : ne garder que ceux au statut demandé
+                now_at = {d["_id"] for d in coll.find(live({"_id": {"$in": todo}, "status": target}), {"_id": 1})}
+                todo = [i for i in todo if i in now_at]
+        changed = todo
+        done = set(todo)
+        unchanged = [i for i in ids if i in found and i not in done]
+
+    seen = set(changed) | set(unchanged)
+    return {
+        "status": target,
+        "changed": changed,
+        "unchanged": unchanged,
+        "not_found": [x for x in ids if x not in seen],
+    }, 200
@@ -0,0 +1,142 @@
+# ===========================================================
+#  compression.py — compression négociée des réponses de l'API
+#
+#  Accept-Encoding: br / gzip (q-values respectées, br préféré à q égal) :
+#    - corps en mémoire (JSON) de plus de COMPRESS_MIN_BYTES : compressés
+#      d'un bloc, Content-Length recalculé
+#    - listes en streaming (NDJSON, ?stream=1) : compressées chunk par chunk
+#      avec un flush à chaque chunk -> le client décode au fil de l'eau
+#    - fichiers (send_file, direct_passthrough) : jamais ici, les assets
+#      statiques ont leurs variantes .br / .gz précalculées (static_assets.py)
+#
+#  Un ETag fort devient faible sur la réponse compressée (même ressource,
+#  autre représentation) ; conditional.py compare en faible : les 304
+#  continuent de fonctionner.
+#
+#  brotli est optionnel : sans le module, seul gzip est proposé.
+#
+#  Réglages : COMPRESS=1, COMPRESS_MIN_BYTES=1024,
+#             COMPRESS_GZIP_LEVEL=6 (1-9), COMPRESS_BR_QUALITY=4 (0-11)
+# ===========================================================
+
+import os
+import zlib
+
+from flask import request
+
+import metrics
+
+try:
+    import brotli
+except ImportError:  # dépendance optionnelle : gzip seulement
+    brotli = None
+
+COMPRESS_ENABLED = os.getenv("COMPRESS", "1").lower() in ("1", "true", "yes")
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BR_QUALITY = int(os.getenv("COMPRESS_BR_QUALITY", "4"))
+
+COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/")
+
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate():
+    """Encodage retenu pour la requête courante (None : identité)."""
+    accept = request.accept_encodings
+    best, best_q = None, 0
+    for enc in ENCODINGS:
+        q = accept[enc]                 # 0 si absent (ou exclu par q=0)
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+# -------------------------------
+# Compresseurs
+# -------------------------------
+def _compressor(enc):
+    """(process, flush, finish) pour un flux."""
+    if enc == "br":
+        c = brotli.Compressor(quality=COMPRESS_BR_QUALITY)
+        return c.process, c.flush, c.finish
+    c = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)   # wbits 31 = en-tête gzip
+    return c.compress, lambda: c.flush(zlib.Z_SYNC_FLUSH), c.flush
+
+
+def compress(data, enc):
+    """Corps complet compressé."""
+    if enc == "br":
+        return brotli.compress(data, quality=COMPRESS_BR_QUALITY)
+    process, _, finish = _compressor(enc)
+    return process(data) + finish()
+
+
+def _stream(chunks, enc):
+    process, flush, finish = _compressor(enc)
+    n_in = n_out = 0
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            out = process(chunk) + flush()
+            n_in, n_out = n_in + len(chunk), n_out + len(out)
+            yield out
+        out = finish()
+        n_out += len(out)
+        yield out
+    finally:
+        close = getattr(chunks, "close", None)      # ferme le générateur (et le curseur Mongo)
+        if close is not None:
+            close()
+        _count(enc, n_in, n_out)
+
+
+def _count(enc, n_in, n_out):
+    metrics.COMPRESSION_BYTES.labels(enc, "in").inc(n_in)
+    metrics.COMPRESSION_BYTES.labels(enc, "out").inc(n_out)
+
+
+# -------------------------------
+# Hook
+# -------------------------------
+def _eligible(resp):
+    if (resp.status_code < 200 or resp.status_code in (204, 206, 304) or resp.direct_passthrough
+            or "Content-Encoding" in resp.headers or request.method == "HEAD"):
+        return False
+    return (resp.mimetype or "").startswith(COMPRESSIBLE)
+
+
+def _weaken_etag(resp):
+    tag, weak = resp.get_etag()
+    if tag and not weak:
+        resp.set_etag(tag, weak=True)
+
+
+def init_app(app):
+    """À enregistrer AVANT les autres hooks : son after_request passe en dernier."""
+    if not COMPRESS_ENABLED:
+        return
+
+    @app.after_request
+    def _compress(resp):
+        if not _eligible(resp):
+            return resp
+        resp.vary.add("Accept-Encoding")
+        enc = negotiate()
+        if enc is None:
+            return resp
+
+        if resp.is_streamed:
+            resp.response = _stream(resp.response, enc)
+            resp.headers.pop("Content-Length", None)
+        else:
+            data = resp.get_data()
+            if len(data) < COMPRESS_MIN_BYTES:
+                return resp
+            out = compress(data, enc)
+            _count(enc, len(data), len(out))
+            resp.set_data(out)                     # recalcule Content-Length
+        resp.headers["Content-Encoding"] = enc
+        _weaken_etag(resp)
+        return resp
@@ -0,0 +1,131 @@
+# ===========================================================
+#  conditional.py — ETag / If-None-Match (GET conditionnels)
+#
+#  Détail (GET /api/<ressource>/<id>) : ETag fort "<_id>-<updated_at ms>".
+#    Avec If-None-Match, on lit d'abord la seule projection {updated_at}
+#    (index _id) : si le client est à jour -> 304 sans relire ni sérialiser
+#    le document. Sinon lecture complète comme avant.
+#
+#  Listes (endpoints list_ et patients.search) : ETag faible calculé AVANT la
+#    requête, à partir de l'URL, du mode de rendu et des versions des
+#    collections lues (versions.py) -> 304 sans exécuter la liste.
+#    Toute écriture réussie sur un blueprint (POST/PATCH/PUT/DELETE 2xx)
+#    incrémente la version de sa collection (hook after_request).
+#    Les écritures hors API (mongo-express, TTL des notifications) ne passent
+#    pas par ce hook : l'ETag de liste change de toute façon toutes les
+#    ETAG_LIST_WINDOW secondes (60), ce qui borne la durée d'un 304 périmé.
+#
+#  Cache-Control: no-cache -> le navigateur garde la réponse mais revalide
+#  à chaque appel (If-None-Match ajouté automatiquement).
+# ===========================================================
+
+import hashlib
+import os
+import time
+from datetime import datetime, timezone
+
+from flask import Response, current_app, g, request
+from werkzeug.http import quote_etag
+
+import streaming
+import versions
+
+ETAG_LIST_WINDOW = int(os.getenv("ETAG_LIST_WINDOW", "60"))
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Collections lues par chaque liste (jointures comprises) ; défaut : celle du blueprint.
+# Rendez-vous / consultations : noms copiés (names.py), la propagation incrémente leur version.
+LIST_DEPS = {
+    "doctors": ("doctors", "facilities"),
+}
+
+# Endpoints de liste traités par le hook (en plus des <blueprint>.list_)
+EXTRA_LIST_ENDPOINTS = {"patients.search"}
+
+# Blueprints sans collection versionnée
+_UNVERSIONED = {"contacts"}
+
+
+def _ms(dt):
+    if not isinstance(dt, datetime):
+        return 0
+    dt = dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    return int((dt - _EPOCH).total_seconds() * 1000)
+
+
+def doc_etag(doc) -> str:
+    """Valeur d'ETag (fort) d'un document : _id + updated_at (created_at à défaut)."""
+    return f"{doc['_id']}-{_ms(doc.get('updated_at') or doc.get('created_at')):x}"
+
+
+def _not_modified(header):
+    resp = Response(status=304)
+    resp.headers["ETag"] = header
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+# -------------------------------
+# Détail
+# -------------------------------
+def detail(coll, oid, missing):
+    """
+    Réponse de get_one : 304 si If-None-Match correspond, sinon le document avec son ETag.
+    `missing` : réponse à renvoyer si le document n'existe pas.
+    """
+    inm = request.if_none_match
+    if inm:
+        head = coll.find_one({"_id": oid}, {"updated_at": 1, "created_at": 1})
+        if head is None:
+            return missing
+        etag = doc_etag(head)
+        if inm.contains_weak(etag):
+            return _not_modified(quote_etag(etag))
+
+    doc = coll.find_one({"_id": oid})
+    if doc is None:
+        return missing
+    return doc, 200, {"ETag": quote_etag(doc_etag(doc)), "Cache-Control": "no-cache"}
+
+
+# -------------------------------
+# Listes (hooks)
+# -------------------------------
+def _list_etag(db, bp):
+    deps = LIST_DEPS.get(bp, (bp,))
+    v = versions.current(db, deps)
+    key = "|".join([
+        request.full_path,
+        streaming.stream_mode() or "",
+        ",".join(f"{d}:{v[d]}" for d in deps),
+        str(int(time.time()) // ETAG_LIST_WINDOW if ETAG_LIST_WINDOW > 0 else 0),
+    ])
+    return hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+
+
+def _is_list(endpoint):
+    return bool(endpoint) and (endpoint.endswith(".list_") or endpoint in EXTRA_LIST_ENDPOINTS)
+
+
+def init_app(app):
+    @app.before_request
+    def _list_not_modified():
+        if request.method != "GET" or not _is_list(request.endpoint):
+            return None
+        etag = _list_etag(current_app.db, request.blueprint)
+        g.list_etag = etag
+        if request.if_none_match.contains_weak(etag):
+            return _not_modified(quote_etag(etag, weak=True))
+        return None
+
+    @app.after_request
+    def _list_etag_and_bump(resp):
+        etag = g.pop("list_etag", None)
+        if etag and resp.status_code == 200:
+            resp.headers["ETag"] = quote_etag(etag, weak=True)
+            resp.headers["Cache-Control"] = "no-cache"
+        elif (request.method in ("POST", "PATCH", "PUT", "DELETE") and 200 <= resp.status_code < 300
+              and request.blueprint and request.blueprint not in _UNVERSIONED):
+            versions.bump(current_app.db, request.blueprint)
+        return resp
@@ -0,0 +1,527 @@
+# ===========================================================
+#  gen_data.py — générateur de données synthétiques (charge / capacité)
+#
+#  Produit un jeu cohérent (toutes les références pointent vers des
+#  documents générés) dans l'ordre des dépendances :
+#    1) facilities
+#    2) patients, doctors            (via seed.normalize_patient / normalize_doctor)
+#    3) rendez-vous et leurs suites : appointments -> consultations ->
+#       prescriptions -> pharmacies, laboratories, payments, notifications
+#
+#  Passage à l'échelle (des milliers aux dizaines de millions de documents) :
+#    - aucun identifiant gardé en mémoire : l'_id d'un document est dérivé
+#      de son rang (ObjectId = horodatage de création | type | run | rang),
+#      la référence vers le patient n°i se recalcule donc à la demande ;
+#    - génération en flux par lots, insert_many(ordered=False) en parallèle
+#      (threads d'écriture, nombre de lots en vol borné) ;
+#    - --procs N : les plages de patients / médecins / rendez-vous sont
+#      réparties sur N processus (un MongoClient chacun).
+#
+#  Exemples :
+#    python gen_data.py --patients 10000
+#    python gen_data.py --patients 2000000 --procs 8 --writers 4
+#    python gen_data.py --patients 1000 --ratio appointments=10 --dry-run
+#    python gen_data.py --purge <tag>      # supprime un jeu généré
+#
+#  Chaque document porte `_gen: <tag>` (tag du run, affiché au démarrage).
+# ===========================================================
+
+import argparse
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from multiprocessing import Pool
+
+from bson import ObjectId
+
+import indexes
+import names
+import scheduling
+import versions
+from seed import normalize_doctor, normalize_patient
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+DB_NAME   = os.getenv("MONGO_DB", "hospital")
+
+# Nombre moyen d'enfants par parent (surchargeable : --ratio appointments=6)
+DEFAULT_RATIOS = {
+    "doctors":       0.02,   # par patient
+    "appointments":  4.0,    # par patient
+    "consultations": 0.7,    # par rendez-vous passé (honoré)
+    "prescriptions": 0.6,    # par consultation
+    "pharmacies":    0.8,    # par ordonnance (délivrance)
+    "laboratories":  0.3,    # par consultation
+    "payments":      0.9,    # par consultation
+    "notifications": 1.0,    # par rendez-vous (rappel)
+}
+
+COLLECTIONS = ["facilities", "patients", "doctors", "appointments", "consultations",
+               "prescriptions", "pharmacies", "laboratories", "payments", "notifications"]
+_KIND = {c: i + 1 for i, c in enumerate(COLLECTIONS)}
+
+# -------------------------------
+# Vocabulaire
+# -------------------------------
+PRENOMS_F = ["Aminata", "Fatimé", "Achta", "Halimé", "Khadija", "Mariam", "Zara", "Hawa",
+             "Aïcha", "Ruth", "Esther", "Clarisse", "Brigitte", "Nadège", "Ramatou", "Sarah"]
+PRENOMS_M = ["Mahamat", "Abakar", "Idriss", "Moussa", "Oumar", "Youssouf", "Ali", "Brahim",
+             "Djimet", "Ngarta", "Jean", "Pierre", "Éric", "Hassane", "Adoum", "Saleh"]
+NOMS = ["Koumba", "Ndjamena", "Mahamat", "Déby", "Ngarlejy", "Abdelkerim", "Doumbia", "Haroun",
+        "Kaltouma", "Nodjitoloum", "Béchir", "Allamine", "Goukouni", "Tchéré", "Moursal", "Ngueté"]
+VILLES = ["N'Djamena", "Moundou", "Abéché", "Sarh", "Kélo", "Koumra", "Pala", "Am Timan",
+          "Bongor", "Mongo", "Doba", "Ati"]
+SPECIALITES = ["General Medicine", "Pediatrics", "Gynecology", "Cardiology", "Internal Medicine",
+               "Surgery", "Dermatology", "Ophthalmology", "Infectious Diseases", "Psychiatry"]
+ALLERGIES = ["penicillin", "sulfonamides", "aspirin", "latex", "peanuts", "ibuprofen"]
+CHRONIQUES = ["hypertension", "diabetes", "asthma", "sickle_cell", "hiv", "epilepsy"]
+MOTIFS = ["Routine check", "Fièvre", "Toux persistante", "Douleurs abdominales", "Suivi grossesse",
+          "Vaccination", "Céphalées", "Contrôle tension", "Suivi diabète", "Plaie"]
+DIAGNOSTICS = ["Paludisme simple", "Infection respiratoire", "Gastro-entérite", "Hypertension",
+               "Diabète type 2", "Grossesse normale", "Otite", "Dermatite", "Anémie", "Typhoïde"]
+MEDICAMENTS = [("Paracétamol", "cp 500mg"), ("Amoxicilline", "gél 500mg"), ("Artéméther-Luméfantrine", "cp"),
+               ("Métronidazole", "cp 250mg"), ("Ibuprofène", "cp 400mg"), ("SRO", "sachet"),
+               ("Metformine", "cp 850mg"), ("Amlodipine", "cp 5mg"), ("Fer-acide folique", "cp")]
+TESTS = [("GE", "Goutte épaisse", "", "négatif|positif"), ("NFS", "Numération formule sanguine", "g/dL", "12-16"),
+         ("GLY", "Glycémie", "g/L", "0.7-1.1"), ("CRP", "Protéine C réactive", "mg/L", "<6"),
+         ("CREA", "Créatinine", "mg/L", "6-12"), ("WIDAL", "Sérodiagnostic de Widal", "", "négatif|positif")]
+
+
+# -------------------------------
+# Identifiants déterministes
+# -------------------------------
+class Ids:
+    """
+    ObjectId dérivé de (collection, rang) : 4 octets d'horodatage (date de création,
+    l'ordre _id suit donc created_at), 1 octet de type, 2 octets de run, 5 octets de rang.
+    """
+
+    def __init__(self, tag):
+        self.run = bytes.fromhex(tag)
+
+    def oid(self, coll, i, ts):
+        return ObjectId(int(ts).to_bytes(4, "big") + bytes([_KIND[coll]]) + self.run + i.to_bytes(5, "big"))
+
+
+class Timeline:
+    """Dates de création des patients / médecins : linéaires sur la période (recalculables)."""
+
+    def __init__(self, start, end, n_patients, n_doctors):
+        self.start, self.end = start, end
+        self.span = (end - start).total_seconds()
+        self.n_patients, self.n_doctors = n_patients, n_doctors
+
+    def _at(self, i, n):
+        return self.start + timedelta(seconds=self.span * i / max(n, 1))
+
+    def patient(self, i):
+        return self._at(i, self.n_patients)
+
+    def doctor(self, i):
+        # les médecins arrivent sur le premier quart de la période
+        return self._at(i, self.n_doctors * 4)
+
+
+# -------------------------------
+# Écriture parallèle par lots
+# -------------------------------
+class Sink:
+    """
+    Tampon par collection + insert_many(ordered=False) dans un pool de threads.
+    Le nombre de lots en vol est borné (mémoire bornée quel que soit le volume).
+    db=None : dry-run (comptage seulement).
+    """
+
+    def __init__(self, db, batch, writers):
+        self.db = db
+        self.batch = batch
+        self.buffers = {c: [] for c in COLLECTIONS}
+        self.counts = dict.fromkeys(COLLECTIONS, 0)
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(writers * 2)
+        self._pool = ThreadPoolExecutor(writers) if db is not None else None
+
+    def add(self, coll, doc):
+        buf = self.buffers[coll]
+        buf.append(doc)
+        if len(buf) >= self.batch:
+            self._flush(coll)
+
+    def _flush(self, coll):
+        docs, self.buffers[coll] = self.buffers[coll], []
+        if not docs:
+            return
+        if self._pool is None:
+            self.counts[coll] += len(docs)
+            return
+        self._slots.acquire()
+        self._pool.submit(self._insert, coll, docs)
+
+    def _insert(self, coll, docs):
+        from pymongo.errors import BulkWriteError
+        try:
+            n = len(self.db[coll].insert_many(docs, ordered=False).inserted_ids)
+            errors = 0
+        except BulkWriteError as e:
+            n = e.details.get("nInserted", 0)
+            errors = len(e.details.get("writeErrors", []))
+        finally:
+            self._slots.release()
+        with self._lock:
+            self.counts[coll] += n
+            self.errors += errors
+
+    def close(self):
+        for coll in COLLECTIONS:
+            self._flush(coll)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+        return self.counts, self.errors
+
+
+# -------------------------------
+# Générateurs de documents
+# -------------------------------
+def _phone(rng):
+    return f"+235 6{rng.randint(0, 9)} {rng.randint(10, 99)} {rng.randint(10, 99)} {rng.randint(10, 99)}"
+
+
+def _facility_index(doctor_i, cfg):
+    return doctor_i % cfg["facilities"]
+
+
+def gen_facilities(cfg, sink):
+    ids = Ids(cfg["tag"])
+    ts = cfg["start"].timestamp()
+    for k in range(cfg["facilities"]):
+        ville = VILLES[k % len(VILLES)]
+        sink.add("facilities", {
+            "_id": ids.oid("facilities", k, ts),
+            "code": f"GEN-{cfg['tag']}-{k:04d}",
+            "name": f"Centre de santé {ville} {k // len(VILLES) + 1}",
+            "city": ville,
+            "created_at": cfg["start"],
+            "_gen": cfg["tag"],
+        })
+
+
+def gen_patients(cfg, rng, lo, hi, sink):
+    ids, tl = Ids(cfg["tag"]), cfg["timeline"]
+    for i in range(lo, hi):
+        created = tl.patient(i)
+        sexe = rng.choice("MF")
+        seq = cfg["ident_start"] + i + 1
+        doc = {
+            "_id": ids.oid("patients", i, created.timestamp()),
+            "identifiant": f"CHADH-PT-{seq:05d}",
+            "email": f"patient{seq}.{cfg['tag']}@example.org",
+            "facility_id": ids.oid("facilities", rng.randrange(cfg["facilities"]), cfg["start"].timestamp()),
+            "identite": {
+                "prenom": rng.choice(PRENOMS_F if sexe == "F" else PRENOMS_M),
+                "nom": rng.choice(NOMS),
+                "date_naissance": datetime(rng.randint(1940, 2023), rng.randint(1, 12), rng.randint(1, 28),
+                                           tzinfo=timezone.utc),
+                "sexe": sexe,
+            },
+            "contacts": {"phone": _phone(rng), "city": rng.choice(VILLES)},
+            "allergies": rng.sample(ALLERGIES, rng.choice((0, 0, 0, 1, 2))),
+            "chronic_diseases": rng.sample(CHRONIQUES, rng.choice((0, 0, 1))),
+            "created_at": created,
+            "updated_at": created,
+            "deleted": False,
+            "_gen": cfg["tag"],
+        }
+        sink.add("patients", normalize_patient(doc, None))
+
+
+def gen_doctors(cfg, rng, lo, hi, sink):
+    ids, tl = Ids(cfg["tag"]), cfg["timeline"]
+    for i in range(lo, hi):
+        created = tl.doctor(i)
+        sexe = rng.choice("MF")
+        doc = {
+            "_id": ids.oid("doctors", i, created.timestamp()),
+            "license_number": f"GEN-DR-{cfg['tag']}-{i:07d}",
+            "facility_id": ids.oid("facilities", _facility_index(i, cfg), cfg["start"].timestamp()),
+            "identite": {
+                "prenom": rng.choice(PRENOMS_F if sexe == "F" else PRENOMS_M),
+                "nom": rng.choice(NOMS).upper(),
+                "sexe": sexe,
+            },
+            "specialites": rng.sample(SPECIALITES, rng.choice((1, 1, 2))),
+            "contacts": {"phone": _phone(rng)},
+            "created_at": created,
+            "updated_at": created,
+            "deleted": False,
+            "_gen": cfg["tag"],
+        }
+        sink.add("doctors", normalize_doctor(doc, None))
+
+
+def gen_encounters(cfg, rng, lo, hi, sink):
+    """Rendez-vous n°lo..hi et leurs suites (tous les enfants d'un rendez-vous ont le même rang j)."""
+    ids, tl, r = Ids(cfg["tag"]), cfg["timeline"], cfg["ratios"]
+    now, tag = cfg["end"], cfg["tag"]
+    horizon = (now + timedelta(days=30)).timestamp()
+    for j in range(lo, hi):
+        p = rng.randrange(cfg["patients"])
+        d = rng.randrange(cfg["doctors"])
+        p_created, d_created = tl.patient(p), tl.doctor(d)
+        pid = ids.oid("patients", p, p_created.timestamp())
+        did = ids.oid("doctors", d, d_created.timestamp())
+        fid = ids.oid("facilities", _facility_index(d, cfg), cfg["start"].timestamp())
+
+        first = max(p_created, d_created).timestamp()
+        dt = datetime.fromtimestamp(rng.uniform(first, horizon), timezone.utc).replace(
+            minute=rng.choice((0, 15, 30, 45)), second=0, microsecond=0)
+        booked = max(dt - timedelta(days=rng.randint(0, 30)), p_created)
+        if dt > now:
+            status = "scheduled"
+        elif rng.random() < r["consultations"]:
+            status = "completed"
+        else:
+            status = rng.choice(("cancelled", "no_show"))
+
+        ap_id = ids.oid("appointments", j, booked.timestamp())
+        sink.add("appointments", {
+            "_id": ap_id, "patient_id": pid, "doctor_id": did, "facility_id": fid,
+            "date_time": dt, "end_at": dt + timedelta(minutes=scheduling.SCHEDULE_SLOT_MINUTES),
+            "status": status, "reason": rng.choice(MOTIFS),
+            "created_at": booked, "updated_at": booked, "deleted": False, "_gen": tag,
+        })
+
+        if rng.random() < r["notifications"]:
+            sent = status != "scheduled"
+            sink.add("notifications", {
+                "_id": ids.oid("notifications", j, booked.timestamp()),
+                "channel": rng.choice(("sms", "sms", "push", "email")),
+                "status": "sent" if sent else "queued",
+                "template": "appt_reminder",
+                "payload": {"date_time": dt.isoformat()},
+                "ref_type": "appointment", "ref_id": ap_id, "to_patient_id": pid,
+                "send_at": dt - timedelta(days=1),
+                **({"sent_at": dt - timedelta(days=1)} if sent else {}),
+                "created_at": booked, "updated_at": booked, "deleted": False, "_gen": tag,
+            })
+
+        if status != "completed":
+            continue
+
+        ts = dt.timestamp()
+        c_id = ids.oid("consultations", j, ts)
+        sink.add("consultations", {
+            "_id": c_id, "patient_id": pid, "doctor_id": did, "facility_id": fid,
+            "appointment_id": ap_id, "date_time": dt,
+            "symptomes": rng.sample(MOTIFS, 2), "diagnostic": rng.choice(DIAGNOSTICS),
+            "vital_signs": {"temp_c": round(rng.uniform(36.2, 39.8), 1),
+                            "tension": f"{rng.randint(10, 16)}/{rng.randint(6, 10)}",
+                            "pouls": rng.randint(55, 120)},
+            "created_at": dt, "updated_at": dt, "deleted": False, "_gen": tag,
+        })
+
+        if rng.random() < r["prescriptions"]:
+            meds = rng.sample(MEDICAMENTS, rng.randint(1, 3))
+            rx_id = ids.oid("prescriptions", j, ts)
+            sink.add("prescriptions", {
+                "_id": rx_id, "patient_id": pid, "doctor_id": did, "consultation_id": c_id,
+                "items": [{"dci": dci, "forme": forme, "posologie": "1 x3/j", "duree_j": rng.choice((3, 5, 7, 30))}
+                          for dci, forme in meds],
+                "renouvellements": rng.choice((0, 0, 0, 1, 2)),
+                "created_at": dt, "updated_at": dt, "deleted": False, "_gen": tag,
+            })
+            if rng.random() < r["pharmacies"]:
+                disp = dt + timedelta(hours=rng.randint(1, 48))
+                sink.add("pharmacies", {
+                    "_id": ids.oid("pharmacies", j, disp.timestamp()),
+                    "patient_id": pid, "doctor_id": did, "facility_id": fid, "prescription_id": rx_id,
+                    "status": "dispensed",
+                    "items": [{"dci": dci, "qty": rng.randint(1, 30), "forme": forme} for dci, forme in meds],
+                    "dispensed_at": disp,
+                    "created_at": dt, "updated_at": disp, "deleted": False, "_gen": tag,
+                })
+
+        if rng.random() < r["laboratories"]:
+            reported = dt + timedelta(hours=rng.randint(2, 72))
+            done = reported <= now
+            tests = []
+            for code, name, unit, ref in rng.sample(TESTS, rng.randint(1, 3)):
+                abnormal = rng.random() < 0.2
+                res = ("positif" if abnormal else "négatif") if "|" in ref else round(rng.uniform(0.5, 15), 2)
+                tests.append({"code": code, "name": name, "status": "completed" if done else "ordered",
+                              **({"result": res, "abnormal": abnormal} if done else {}),
+                              **({"unit": unit} if unit else {}), "ref_range": ref})
+            sink.add("laboratories", {
+                "_id": ids.oid("laboratories", j, ts),
+                "patient_id": pid, "doctor_id": did, "facility_id": fid, "appointment_id": ap_id,
+                "status": "completed" if done else "in_progress",
+                "date_ordered": dt, **({"date_reported": reported} if done else {}),
+                "tests": tests,
+                "created_at": dt, "updated_at": reported if done else dt, "deleted": False, "_gen": tag,
+            })
+
+        if rng.random() < r["payments"]:
+            amount = float(rng.choice((2500, 5000, 7500, 10000, 15000)))
+            paid = rng.random() < 0.85
+            sink.add("payments", {
+                "_id": ids.oid("payments", j, ts),
+                "patient_id": pid, "appointment_id": ap_id, "consultation_id": c_id, "facility_id": fid,
+                "invoice_no": f"GEN-{tag}-{j:09d}",
+                "amount": amount, "currency": "XAF",
+                "method": rng.choice(("cash", "cash", "mobile", "insurance", "card")),
+                "status": "paid" if paid else "pending",
+                "items": [{"ref_type": "consultation", "ref_id": c_id, "amount": amount}],
+                **({"paid_at": dt} if paid else {}),
+                "created_at": dt, "updated_at": dt, "deleted": False, "_gen": tag,
+            })
+
+
+# -------------------------------
+# Exécution (un appel par tranche, éventuellement dans un processus fils)
+# -------------------------------
+_PHASES = {"patients": gen_patients, "doctors": gen_doctors, "encounters": gen_encounters}
+
+
+def _run_slice(args):
+    cfg, phase, k, lo, hi = args
+    db = None
+    if not cfg["dry_run"]:
+        from pymongo import MongoClient
+        db = MongoClient(MONGO_URI, maxPoolSize=cfg["writers"] + 2)[DB_NAME]
+    rng = random.Random(f"{cfg['seed']}:{phase}:{k}")
+    sink = Sink(db, cfg["batch"], cfg["writers"])
+    _PHASES[phase](cfg, rng, lo, hi, sink)
+    return sink.close()
+
+
+def _slices(n, parts):
+    step = -(-n // parts) if n else 0
+    return [(lo, min(lo + step, n)) for lo in range(0, n, step)] if step else []
+
+
+def _run_phase(cfg, phases, pool):
+    jobs = []
+    for phase, n in phases:
+        for k, (lo, hi) in enumerate(_slices(n, cfg["procs"] * 4)):
+            jobs.append((cfg, phase, k, lo, hi))
+    results = pool.imap_unordered(_run_slice, jobs) if pool else map(_run_slice, jobs)
+    counts, errors = dict.fromkeys(COLLECTIONS, 0), 0
+    for c, e in results:
+        for coll, n in c.items():
+            counts[coll] += n
+        errors += e
+    return counts, errors
+
+
+def _parse_ratios(items):
+    ratios = dict(DEFAULT_RATIOS)
+    for item in items or []:
+        name, _, value = item.partition("=")
+        if name not in ratios:
+            raise SystemExit(f"ratio inconnu : {name} ({', '.join(ratios)})")
+        ratios[name] = float(value)
+    return ratios
+
+
+def purge(db, tag):
+    for coll in COLLECTIONS:
+        n = db[coll].delete_many({"_gen": tag}).deleted_count
+        print(f"[gen] {coll}: {n} supprimé(s)")
+    versions.bump(db, "doctors", "facilities")      # instantanés des workers (refcache.py)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Générateur de données synthétiques cohérentes")
+    ap.add_argument("--patients", type=int, default=10000)
+    ap.add_argument("--doctors", type=int, help="défaut : patients x ratio doctors (min 5)")
+    ap.add_argument("--facilities", type=int, default=20)
+    ap.add_argument("--ratio", action="append", metavar="NOM=X", help="ex: appointments=6 (répétable)")
+    ap.add_argument("--days", type=int, default=730, help="profondeur d'historique")
+    ap.add_argument("--procs", type=int, default=1, help="processus de génération")
+    ap.add_argument("--writers", type=int, default=4, help="threads insert_many par processus")
+    ap.add_argument("--batch", type=int, default=1000, help="documents par insert_many")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--tag", help="4 caractères hexa (défaut aléatoire)")
+    ap.add_argument("--no-indexes", action="store_true", help="ne pas appliquer indexes.py en fin de run")
+    ap.add_argument("--dry-run", action="store_true", help="générer sans écrire (mesure du générateur)")
+    ap.add_argument("--purge", metavar="TAG", help="supprime les documents d'un run")
+    a = ap.parse_args(argv)
+
+    db = None
+    if not a.dry_run or a.purge:
+        from pymongo import MongoClient
+        db = MongoClient(MONGO_URI)[DB_NAME]
+    if a.purge:
+        purge(db, a.purge)
+        return 0
+
+    ratios = _parse_ratios(a.ratio)
+    n_doctors = a.doctors or max(5, int(a.patients * ratios["doctors"]))
+    n_appointments = int(a.patients * ratios["appointments"])
+    end = datetime.now(timezone.utc).replace(microsecond=0)
+    start = end - timedelta(days=a.days)
+    tag = (a.tag or secrets.token_hex(2)).lower()
+    if len(tag) != 4:
+        raise SystemExit("--tag : 4 caractères hexa")
+
+    # identifiants lisibles à la suite du compteur des routes (cf. patients._gen_patient_ident)
+    ident_start = 0
+    if db is not None:
+        ident_start = int((db.counters.find_one({"_id": "patient_ident"}) or {}).get("seq", 0))
+
+    cfg = {
+        "tag": tag, "seed": a.seed, "start": start, "end": end, "ratios": ratios,
+        "patients": a.patients, "doctors": n_doctors, "facilities": a.facilities,
+        "timeline": Timeline(start, end, a.patients, n_doctors), "ident_start": ident_start,
+        "procs": a.procs, "writers": a.writers, "batch": a.batch, "dry_run": a.dry_run,
+    }
+    print(f"[gen] tag={tag} patients={a.patients} doctors={n_doctors} facilities={a.facilities} "
+          f"appointments={n_appointments} procs={a.procs}{' (dry-run)' if a.dry_run else ''}")
+
+    t0 = time.perf_counter()
+    totals, errors = dict.fromkeys(COLLECTIONS, 0), 0
+
+    def _add(res):
+        nonlocal errors
+        for coll, n in res[0].items():
+            totals[coll] += n
+        errors += res[1]
+
+    sink = Sink(db, a.batch, a.writers)
+    gen_facilities(cfg, sink)
+    _add(sink.close())
+
+    pool = Pool(a.procs) if a.procs > 1 else None
+    try:
+        for phases in ([("patients", a.patients), ("doctors", n_doctors)], [("encounters", n_appointments)]):
+            t = time.perf_counter()
+            _add(_run_phase(cfg, phases, pool))
+            print(f"[gen] {'+'.join(p for p, _ in phases)} : {time.perf_counter() - t:.1f}s")
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    if db is not None:
+        db.counters.update_one({"_id": "patient_ident"}, {"$max": {"seq": ident_start + a.patients}}, upsert=True)
+        versions.bump(db, "doctors", "facilities")  # instantanés des workers (refcache.py)
+        names.backfill(db, batch=a.batch * 5, touch=False)   # noms copiés dans rendez-vous / consultations
+        scheduling.backfill(db, batch=a.batch * 5)           # cases réservées des rendez-vous à venir
+        if not a.no_indexes:
+            # index construits après le chargement : plus rapide qu'une maintenance à chaque insert
+            indexes.apply(db, force=True)
+
+    elapsed = time.perf_counter() - t0
+    total = sum(totals.values())
+    for coll in COLLECTIONS:
+        print(f"  {coll:14} {totals[coll]:>12,}")
+    print(f"[gen] {total:,} documents en {elapsed:.1f}s ({total / elapsed:,.0f} docs/s), {errors} erreur(s)")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
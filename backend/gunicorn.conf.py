@@ -0,0 +1,59 @@
+# gunicorn.conf.py — serveur WSGI multi-process / multi-thread
+#
+# Tout est réglable par variables d'environnement :
+#   PORT                     (5000)
+#   WEB_CONCURRENCY          nb de processus workers (2 x CPU + 1 par défaut)
+#   GUNICORN_THREADS         threads par worker (4) -> worker gthread
+#   GUNICORN_PRELOAD         charge l'app dans le master avant fork (true)
+#   GUNICORN_MAX_REQUESTS    recyclage d'un worker après N requêtes (2000, 0 = jamais)
+#   GUNICORN_MAX_REQUESTS_JITTER  aléa pour éviter que tous les workers redémarrent ensemble (200)
+#   GUNICORN_TIMEOUT         timeout worker en secondes (30)
+#   PROMETHEUS_MULTIPROC_DIR métriques partagées entre workers (/tmp/prometheus_multiproc)
+import multiprocessing
+import os
+import shutil
+
+# Doit être posé AVANT tout import de prometheus_client (donc avant le preload de l'app).
+# On repart d'un répertoire vide : les fichiers d'un ancien run fausseraient les compteurs.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def _bool(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_class = "gthread"
+
+preload_app = _bool("GUNICORN_PRELOAD", "true")
+
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "200"))
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 20
+keepalive = 5
+
+accesslog = None          # les requêtes sont déjà tracées par l'app
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+
+def child_exit(server, worker):
+    """Retire les gauges 'live' du worker mort de l'agrégat /metrics."""
+    import metrics
+
+    metrics.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    """Chaque worker ouvre son propre MongoClient, après le fork."""
+    from app import init_process
+    from wsgi import app
+
+    init_process(app)
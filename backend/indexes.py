@@ -0,0 +1,277 @@
+# ===========================================================
+#  indexes.py — registre versionné des index MongoDB
+#
+#  Les index sont dérivés des formes de requêtes réellement émises par les
+#  blueprints : chaque route list_ filtre par égalité sur quelques champs
+#  (doctor_id, patient_id, status…) puis trie par (clé, _id) (cf. pagination.py).
+#  Règle ESR : un index (champ d'égalité, clé de tri, _id) par filtre + un
+#  index (clé de tri, _id) pour la liste non filtrée -> ni COLLSCAN ni SORT
+#  en mémoire, y compris pour les pages suivantes (?cursor=…).
+#
+#  Application idempotente :
+#    - au démarrage (app.bootstrap, INDEXES_ON_START=true) : ne fait rien si
+#      la version enregistrée en base (schema_meta) est déjà INDEX_VERSION
+#    - en CLI :
+#        python indexes.py apply [--prune]   crée / recrée / supprime
+#        python indexes.py status            différences sans rien modifier
+#        python indexes.py check             explain() de chaque forme de requête,
+#                                            code retour 1 si COLLSCAN ou SORT
+#
+#  Index des listes PARTIELS sur {deleted: false} (cf. softdelete.py) : les
+#  documents supprimés n'y entrent pas ; seules les requêtes qui contiennent
+#  LIVE peuvent les utiliser.
+#
+#  Toute modification du registre -> incrémenter INDEX_VERSION.
+# ===========================================================
+
+import os
+import sys
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from bson.regex import Regex
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+import scheduling
+from pagination import after_filter
+from softdelete import LIVE
+
+INDEX_VERSION = 4
+
+META_ID = "indexes"
+
+# -------------------------------
+# Formes des routes list_ : collection -> (clé de tri, sens, champs d'égalité)
+# -------------------------------
+LISTS = {
+    "patients":           ("created_at",   DESCENDING, []),
+    "doctors":            ("created_at",   DESCENDING, ["specialites", "facility_id"]),
+    "appointments":       ("date_time",    ASCENDING,  ["doctor_id", "patient_id", "status"]),
+    "consultations":      ("date_time",    DESCENDING, ["patient_id", "doctor_id", "facility_id"]),
+    "prescriptions":      ("created_at",   DESCENDING, ["patient_id", "doctor_id", "consultation_id", "facility_id"]),
+    "laboratories":       ("date_ordered", DESCENDING, ["patient_id", "doctor_id", "facility_id", "status"]),
+    "pharmacies":         ("created_at",   DESCENDING, ["patient_id", "doctor_id", "facility_id", "prescription_id", "status"]),
+    "payments":           ("created_at",   DESCENDING, ["patient_id", "facility_id", "status", "currency", "method"]),
+    "notifications":      ("created_at",   DESCENDING, ["to_patient_id", "to_doctor_id", "status", "channel", "ref_type"]),
+    "health_authorities": ("created_at",   DESCENDING, ["facility_id", "report_type", "status"]),
+}
+
+# -------------------------------
+# Index hors listes (unicité, TTL, recherches par clé métier)
+# -------------------------------
+EXTRA = {
+    "patients": [
+        IndexModel([("email", ASCENDING)], name="uniq_email_not_null", unique=True,
+                   partialFilterExpression={"email": {"$type": "string"}}),
+        # recherche par préfixe (GET /api/patients/search, cf. search_keys.py)
+        IndexModel([("search_keys", ASCENDING)], name="search_keys_1"),
+    ],
+    "doctors": [
+        IndexModel([("license_number", ASCENDING)], name="uniq_license_not_null", unique=True,
+                   partialFilterExpression={"license_number": {"$type": "string"}}),
+    ],
+    "notifications": [
+        IndexModel([("expires_at", ASCENDING)], name="ttl_expires_at", expireAfterSeconds=0),
+    ],
+    # cases réservées des médecins (cf. scheduling.py) : verrou = _id {d, t}
+    scheduling.COLLECTION: [
+        IndexModel([("appointment_id", ASCENDING)], name="appointment_id_1"),
+        IndexModel([("at", ASCENDING)], name="ttl_at", expireAfterSeconds=scheduling.SLOT_RETENTION_SECONDS),
+    ],
+}
+
+# Formes de requêtes hors listes à vérifier par explain() : (collection, filtre)
+LOOKUPS = [
+    ("patients", {"email": "x@example.org"}),
+    ("patients", {"search_keys": {"$in": [Regex("^n:dup"), Regex("^i:dup")]}}),
+    ("doctors", {"license_number": "X-0000"}),
+    # disponibilités d'un médecin (GET /api/doctors/<id>/availability)
+    ("appointments", {**LIVE, "doctor_id": ObjectId(), "date_time": {"$gt": datetime(2025, 1, 1), "$lt": datetime(2025, 2, 1)}}),
+    (scheduling.COLLECTION, {"appointment_id": ObjectId()}),
+]
+
+# Index supprimés du registre (supprimés en base par apply)
+OBSOLETE = {
+    # clé start_at jamais utilisée par les routes (date_time), unicité erronée
+    "appointments": ["uniq_patient_start"],
+}
+
+# Options comparées entre le registre et l'index existant
+_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+
+def _list_models(sort_field, direction, eq_fields):
+    tail = [(sort_field, direction), ("_id", direction)]
+    models = [IndexModel(tail, name=f"{sort_field}_id", partialFilterExpression=LIVE)]
+    for f in eq_fields:
+        models.append(IndexModel([(f, ASCENDING), *tail], name=f"{f}_{sort_field}_id",
+                                 partialFilterExpression=LIVE))
+    return models
+
+
+def registry():
+    """{collection: [IndexModel…]} — source de vérité des index."""
+    out = {}
+    for coll, spec in LISTS.items():
+        out[coll] = _list_models(*spec)
+    for coll, models in EXTRA.items():
+        out.setdefault(coll, []).extend(models)
+    return out
+
+
+# -------------------------------
+# Plan / application
+# -------------------------------
+def _spec(info):
+    """Index (document IndexModel ou entrée d'index_information) -> (clés, options) comparables."""
+    key = info["key"]
+    keys = tuple((k, d if isinstance(d, str) else int(d)) for k, d in (key.items() if hasattr(key, "items") else key))
+    return keys, {o: info[o] for o in _OPTIONS if o in info}
+
+
+def plan(db, prune=False):
+    """
+    Actions nécessaires pour aligner la base sur le registre :
+    [("drop", coll, name) | ("create", coll, IndexModel)], suppressions d'abord.
+    """
+    drops, creates = [], []
+    for coll, models in registry().items():
+        existing = db[coll].index_information()
+        by_keys = {_spec(info)[0]: name for name, info in existing.items()}
+        wanted = set()
+        for m in models:
+            doc = m.document
+            name = doc["name"]
+            wanted.add(name)
+            keys, opts = _spec(doc)
+            cur = existing.get(name)
+            if cur is not None and _spec(cur) == (keys, opts):
+                continue
+            if cur is not None:
+                drops.append(("drop", coll, name))              # options ou clés modifiées
+            other = by_keys.get(keys)
+            if other and other != name and other not in wanted:
+                drops.append(("drop", coll, other))             # même clé sous un autre nom
+            creates.append(("create", coll, m))
+        for name in OBSOLETE.get(coll, []):
+            if name in existing:
+                drops.append(("drop", coll, name))
+        if prune:
+            names = {m.document["name"] for m in models}
+            for name in existing:
+                if name != "_id_" and name not in names and ("drop", coll, name) not in drops:
+                    drops.append(("drop", coll, name))
+    return list(dict.fromkeys(drops)) + creates
+
+
+def apply(db, force=False, prune=False, log=print):
+    """Applique le registre ; no-op si la version en base est à jour (sauf force/prune)."""
+    meta = db.schema_meta.find_one({"_id": META_ID}) or {}
+    if not force and not prune and meta.get("version") == INDEX_VERSION:
+        return []
+
+    actions = plan(db, prune=prune)
+    for action, coll, target in actions:
+        if action == "drop":
+            db[coll].drop_index(target)
+            log(f"[indexes] drop   {coll}.{target}")
+        else:
+            db[coll].create_indexes([target])
+            log(f"[indexes] create {coll}.{target.document['name']}")
+
+    db.schema_meta.update_one(
+        {"_id": META_ID},
+        {"$set": {"version": INDEX_VERSION, "applied_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+    return actions
+
+
+# -------------------------------
+# Vérification par explain()
+# -------------------------------
+def _sample(field):
+    return ObjectId() if field.endswith("_id") else "x"
+
+
+def query_shapes():
+    """
+    (nom, collection, filtre, tri) de chaque forme émise par les routes :
+    liste non filtrée, un filtre d'égalité à la fois, page suivante (cursor).
+    Les listes en aggregate ($match/$sort/$limit + $lookup) sont vérifiées via
+    find() : le préfixe $match/$sort/$limit passe par le même planificateur.
+    """
+    shapes = []
+    for coll, (field, direction, eq_fields) in LISTS.items():
+        sort = [(field, direction), ("_id", direction)]
+        after = after_filter(field, direction, datetime.now(timezone.utc), ObjectId())
+        shapes.append((f"{coll} list", coll, LIVE, sort))
+        shapes.append((f"{coll} list +cursor", coll, {"$and": [LIVE, after]}, sort))
+        for f in eq_fields:
+            q = {**LIVE, f: _sample(f)}
+            shapes.append((f"{coll} list {f}=", coll, q, sort))
+            shapes.append((f"{coll} list {f}= +cursor", coll, {"$and": [q, after]}, sort))
+    for coll, q in LOOKUPS:
+        shapes.append((f"{coll} {','.join(q)}=", coll, q, None))
+    return shapes
+
+
+def _stages(node):
+    """Tous les noms d'étapes d'un plan d'exécution (moteurs classique et SBE)."""
+    if isinstance(node, dict):
+        if "stage" in node:
+            yield node["stage"]
+        for v in node.values():
+            yield from _stages(v)
+    elif isinstance(node, list):
+        for v in node:
+            yield from _stages(v)
+
+
+def check(db):
+    """-> [(nom, étapes fautives)] pour chaque forme qui retombe sur COLLSCAN ou SORT."""
+    failures = []
+    for name, coll, q, sort in query_shapes():
+        cur = db[coll].find(q).limit(201)
+        if sort:
+            cur = cur.sort(sort)
+        winning = cur.explain()["queryPlanner"]["winningPlan"]
+        bad = sorted({s for s in _stages(winning) if s in ("COLLSCAN", "SORT")})
+        if bad:
+            failures.append((name, bad))
+    return failures
+
+
+# -------------------------------
+# CLI
+# -------------------------------
+def main(argv=None):
+    from pymongo import MongoClient
+
+    argv = sys.argv[1:] if argv is None else argv
+    cmd = argv[0] if argv else "apply"
+    db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))[os.getenv("MONGO_DB", "hospital")]
+
+    if cmd == "apply":
+        actions = apply(db, force=True, prune="--prune" in argv)
+        print(f"[indexes] v{INDEX_VERSION} : {len(actions)} action(s)")
+        return 0
+    if cmd == "status":
+        for action, coll, target in plan(db, prune="--prune" in argv):
+            print(f"{action:6} {coll}.{target if action == 'drop' else target.document['name']}")
+        meta = db.schema_meta.find_one({"_id": META_ID}) or {}
+        print(f"[indexes] registre v{INDEX_VERSION}, base v{meta.get('version')}")
+        return 0
+    if cmd == "check":
+        failures = check(db)
+        for name, bad in failures:
+            print(f"[indexes] {name}: {'+'.join(bad)}")
+        print(f"[indexes] {len(query_shapes())} formes, {len(failures)} en échec")
+        return 1 if failures else 0
+
+    print("usage: python indexes.py [apply [--prune] | status [--prune] | check]")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
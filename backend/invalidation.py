@@ -0,0 +1,219 @@
+# ===========================================================
+#  invalidation.py — invalidation des caches par change streams
+#
+#  Les caches en mémoire (refcache.py, cache d'existence de utils.py) sont
+#  propres à chaque worker, alors que les écritures arrivent par les autres
+#  workers, par seed/gen_data ou par mongo-express. Chaque worker lance un
+#  thread qui suit les changements et prévient les caches abonnés :
+#
+#      invalidation.subscribe("doctors", fn)                  fn(coll, {ids}) ou fn(coll, None)
+#      invalidation.subscribe("patients", fn, ops=("delete",))  seulement les suppressions
+#
+#  fn(coll, None) = « tout a pu changer » (reprise impossible, drop, rename…).
+#
+#  Deux sources :
+#    - change stream (replica set / sharded) : db.watch() filtré sur les
+#      collections et opérations abonnées, projeté sur documentKey ; le jeton
+#      de reprise est persisté (collection cache_watch) toutes les
+#      WATCH_CHECKPOINT_SECONDS -> un worker qui (re)démarre rejoue ce qu'il
+#      a pu manquer ; jeton trop ancien -> tous les caches sont vidés
+#    - polling (mongod standalone, sans oplog) : toutes les WATCH_POLL_SECONDS,
+#      documents dont updated_at a avancé. Ne voit ni les suppressions
+#      physiques ni les écritures qui ne posent pas updated_at.
+#
+#  live() est vrai quand le change stream tourne : les caches peuvent alors
+#  espacer leurs contrôles de version (cf. refcache.REFCACHE_WATCHED_SECONDS).
+#
+#  Réglages : WATCH_CHANGES=1 (0 = désactivé), WATCH_POLL_SECONDS=2,
+#             WATCH_CHECKPOINT_SECONDS=5
+# ===========================================================
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+import metrics
+
+WATCH_ENABLED = os.getenv("WATCH_CHANGES", "1").lower() in ("1", "true", "yes")
+WATCH_POLL_SECONDS = float(os.getenv("WATCH_POLL_SECONDS", "2"))
+WATCH_CHECKPOINT_SECONDS = float(os.getenv("WATCH_CHECKPOINT_SECONDS", "5"))
+
+TOKEN_COLLECTION = "cache_watch"
+TOKEN_ID = "resume"
+
+_ALL_OPS = ("insert", "update", "replace", "delete")
+# codes serveur : pas de change stream (standalone) / jeton de reprise inutilisable
+_NO_CHANGE_STREAM = {40573, 40324}
+_RESUME_LOST = {260, 280, 286}
+_POLL_LIMIT = 10000
+
+_subscribers = {}          # collection -> [(fn, ops)]
+_lock = threading.Lock()
+_state = {"pid": None, "thread": None, "mode": None, "stop": None}
+
+
+def subscribe(coll, fn, ops=_ALL_OPS):
+    """Abonne fn(coll, ids | None) aux changements de `coll` (à faire à l'import du module)."""
+    with _lock:
+        _subscribers.setdefault(coll, []).append((fn, tuple(ops)))
+
+
+def live():
+    """Vrai si le change stream de ce processus est actif."""
+    return _state["pid"] == os.getpid() and _state["mode"] == "stream"
+
+
+def publish(coll, ids, op=None, source="local"):
+    """Prévient les abonnés de `coll` (ids=None : toute la collection)."""
+    for fn, ops in _subscribers.get(coll, ()):
+        if op is None or op in ops:
+            fn(coll, ids)
+    metrics.CACHE_INVALIDATIONS.labels(coll, source).inc(1 if ids is None else len(ids))
+
+
+def _publish_all(source):
+    for coll in list(_subscribers):
+        publish(coll, None, source=source)
+
+
+# -------------------------------
+# Change stream
+# -------------------------------
+def _pipeline():
+    match = [{"ns.coll": coll, "operationType": {"$in": sorted({o for _, ops in subs for o in ops})}}
+             for coll, subs in _subscribers.items()]
+    return [
+        {"$match": {"$or": match + [{"operationType": {"$in": ["drop", "rename", "dropDatabase", "invalidate"]}}]}},
+        {"$project": {"ns": 1, "documentKey": 1, "operationType": 1}},
+    ]
+
+
+def _load_token(db):
+    doc = db[TOKEN_COLLECTION].find_one({"_id": TOKEN_ID})
+    return doc.get("token") if doc else None
+
+
+def _save_token(db, token):
+    db[TOKEN_COLLECTION].update_one(
+        {"_id": TOKEN_ID},
+        {"$set": {"token": token, "at": datetime.now(timezone.utc), "pid": os.getpid()}},
+        upsert=True,
+    )
+
+
+def _flush(batch):
+    for (coll, op), ids in batch.items():
+        publish(coll, ids, op, source="stream")
+    batch.clear()
+
+
+def _run_stream(db, stop, log):
+    token = saved = None
+    loaded, last_save = False, time.monotonic()
+    while not stop.is_set():
+        try:
+            if not loaded:
+                token = saved = _load_token(db)
+                loaded = True
+            with db.watch(_pipeline(), resume_after=token, max_await_time_ms=1000) as stream:
+                _state["mode"] = "stream"
+                batch = {}
+                while not stop.is_set():
+                    change = stream.try_next()
+                    if change is not None:
+                        op = change["operationType"]
+                        coll = (change.get("ns") or {}).get("coll")
+                        if op in _ALL_OPS:
+                            batch.setdefault((coll, op), set()).add(change["documentKey"]["_id"])
+                        elif coll in _subscribers:
+                            publish(coll, None, source="stream")          # drop / rename
+                        elif not coll:
+                            _publish_all("stream")                        # dropDatabase / invalidate
+                        if op == "invalidate":
+                            token = None
+                            break
+                    else:
+                        _flush(batch)
+                    token = stream.resume_token or token
+                    if token != saved and time.monotonic() - last_save >= WATCH_CHECKPOINT_SECONDS:
+                        _save_token(db, token)
+                        saved, last_save = token, time.monotonic()
+                _flush(batch)
+        except OperationFailure as e:
+            if e.code in _NO_CHANGE_STREAM:
+                raise
+            if e.code in _RESUME_LOST:
+                log(f"[invalidation] jeton de reprise inutilisable ({e.code}) : caches vidés")
+                token = None
+                _publish_all("stream")
+                continue
+            log(f"[invalidation] change stream interrompu : {e}")
+            _state["mode"] = None
+            stop.wait(WATCH_POLL_SECONDS)
+        except PyMongoError as e:
+            log(f"[invalidation] change stream interrompu : {e}")
+            _state["mode"] = None
+            stop.wait(WATCH_POLL_SECONDS)
+    if token != saved and token is not None:
+        _save_token(db, token)
+
+
+# -------------------------------
+# Polling (mongod standalone)
+# -------------------------------
+def _run_poll(db, stop, log):
+    _state["mode"] = "poll"
+    # seules les collections dont un abonné suit les mises à jour (les suppressions
+    # physiques sont invisibles ici : inutile de balayer patients pour le cache d'existence)
+    colls = [c for c, subs in _subscribers.items() if any("update" in ops for _, ops in subs)]
+    since = {coll: datetime.now(timezone.utc) for coll in colls}
+    while not stop.wait(WATCH_POLL_SECONDS):
+        for coll in colls:
+            try:
+                docs = list(db[coll].find({"updated_at": {"$gt": since[coll]}}, {"updated_at": 1})
+                            .sort("updated_at", 1).limit(_POLL_LIMIT))
+            except PyMongoError as e:
+                log(f"[invalidation] polling {coll} : {e}")
+                continue
+            if not docs:
+                continue
+            if len(docs) == _POLL_LIMIT:
+                publish(coll, None, source="poll")
+            else:
+                publish(coll, {d["_id"] for d in docs}, "update", source="poll")
+            last = docs[-1]["updated_at"]
+            since[coll] = last if last.tzinfo else last.replace(tzinfo=timezone.utc)
+
+
+def _run(app, stop):
+    log = app.logger.warning
+    try:
+        try:
+            _run_stream(app.db, stop, log)
+        except OperationFailure as e:            # uniquement _NO_CHANGE_STREAM (cf. _run_stream)
+            log(f"[invalidation] change streams indisponibles ({e.code}) : polling sur updated_at")
+            _run_poll(app.db, stop, log)
+    except Exception as e:                       # le thread ne doit jamais tuer le worker
+        _state["mode"] = None
+        log(f"[invalidation] arrêt du suivi des changements : {e!r}")
+
+
+def start(app):
+    """Lance le suivi dans le processus courant (idempotent, à appeler après fork)."""
+    if not WATCH_ENABLED or not _subscribers or _state["pid"] == os.getpid():
+        return
+    with _lock:
+        if _state["pid"] == os.getpid():
+            return
+        stop = threading.Event()
+        t = threading.Thread(target=_run, args=(app, stop), name="cache-invalidation", daemon=True)
+        _state.update(pid=os.getpid(), thread=t, mode=None, stop=stop)
+        t.start()
+
+
+def stop():
+    if _state["stop"] is not None:
+        _state["stop"].set()
@@ -0,0 +1,108 @@
+# ===========================================================
+#  json_codec.py — encodage / décodage JSON de l'API
+#
+#  Deux providers Flask interchangeables (variable JSON_PROVIDER) :
+#    - "orjson" (défaut si installé) : encodeur C, datetime natif,
+#      réponse construite directement en bytes (pas de str intermédiaire)
+#    - "std" : json de la stdlib (fallback, même format de sortie)
+#
+#  Types Mongo gérés nativement par les deux :
+#    ObjectId   -> "65f0…" (str)
+#    datetime   -> ISO 8601 UTC, suffixe Z (les datetimes naïfs sont en UTC)
+#    date       -> "YYYY-MM-DD"
+#    Decimal128 -> "12.50" (str, pas de perte de précision)
+#
+#  Les routes renvoient donc les documents Mongo tels quels : plus de
+#  conversion manuelle par blueprint.
+# ===========================================================
+
+import os
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+try:
+    import orjson
+except ImportError:  # dépendance optionnelle : fallback stdlib
+    orjson = None
+
+
+# Dispatch par type exact (un dict lookup au lieu d'une cascade d'isinstance)
+_ENCODERS = {
+    ObjectId: lambda o: o.binary.hex(),
+    Decimal128: lambda o: str(o.to_decimal()),
+    Decimal: str,
+    set: list,
+    frozenset: list,
+    tuple: list,
+}
+
+
+def _mongo_default(o):
+    """Types non JSON natifs (appelé par les deux encodeurs)."""
+    enc = _ENCODERS.get(type(o))
+    if enc is not None:
+        return enc(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+# -------------------------------
+# Provider orjson
+# -------------------------------
+class OrjsonProvider(JSONProvider):
+    """Provider Flask basé sur orjson (dumps en bytes, loads direct depuis bytes)."""
+
+    mimetype = "application/json"
+
+    if orjson is not None:
+        # clés BSON toujours str : pas besoin de OPT_NON_STR_KEYS (plus lent)
+        option = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+    def dumps_bytes(self, obj) -> bytes:
+        return orjson.dumps(obj, default=_mongo_default, option=self.option)
+
+    def dumps(self, obj, **kwargs) -> str:
+        return self.dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+
+
+# -------------------------------
+# Provider stdlib (fallback)
+# -------------------------------
+class MongoJSONProvider(DefaultJSONProvider):
+    """json stdlib + types Mongo ; même format de sortie que OrjsonProvider."""
+
+    sort_keys = False
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, datetime):
+            if o.tzinfo is None:
+                o = o.replace(tzinfo=timezone.utc)
+            return o.isoformat().replace("+00:00", "Z")
+        if isinstance(o, date):
+            return o.isoformat()
+        return _mongo_default(o)
+
+    def dumps_bytes(self, obj) -> bytes:
+        return self.dumps(obj).encode()
+
+
+PROVIDERS = {"orjson": OrjsonProvider, "std": MongoJSONProvider}
+
+
+def make_provider(app):
+    """Instancie le provider choisi par JSON_PROVIDER (orjson si disponible)."""
+    name = os.getenv("JSON_PROVIDER", "orjson" if orjson is not None else "std")
+    if name == "orjson" and orjson is None:
+        name = "std"
+    return PROVIDERS[name](app)
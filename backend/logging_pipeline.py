@@ -0,0 +1,294 @@
+# ===========================================================
+#  logging_pipeline.py — logs de requêtes non bloquants
+#
+#  Principe :
+#    - Les handlers de requête ne font QUE un put_nowait() dans une queue
+#      bornée (aucune I/O disque sur le chemin chaud).
+#    - Un thread QueueListener (un par processus) formate en JSON et écrit.
+#    - L'écriture + la rotation sont protégées par un verrou fcntl partagé
+#      entre processus : plusieurs workers gunicorn peuvent écrire le même
+#      fichier sans casser la rotation.
+#    - Une seule ligne par requête (à la sortie), avec échantillonnage
+#      configurable des réponses OK ; erreurs et requêtes lentes toujours logguées.
+#
+#  Variables d'environnement :
+#    LOG_FILE          (logs/backend_run.log)
+#    LOG_MAX_BYTES     (5000000)
+#    LOG_BACKUPS       (5)
+#    LOG_QUEUE_SIZE    (10000)   au-delà, les records sont comptés puis jetés
+#    LOG_SAMPLE_RATE   (1.0)     part des requêtes 2xx/3xx logguées (0.0 – 1.0)
+#    LOG_SLOW_MS       (500)     toujours logguer au-delà de cette durée
+# ===========================================================
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import g, request
+from flask.logging import default_handler
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus
+    fcntl = None
+
+LOG_FILE        = os.getenv("LOG_FILE", "logs/backend_run.log")
+LOG_MAX_BYTES   = int(os.getenv("LOG_MAX_BYTES", "5000000"))
+LOG_BACKUPS     = int(os.getenv("LOG_BACKUPS", "5"))
+LOG_QUEUE_SIZE  = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+LOG_SLOW_MS     = float(os.getenv("LOG_SLOW_MS", "500"))
+
+# Compteurs du processus courant (exposés par stats()) — approximatifs, sans verrou
+_stats = {"enqueued": 0, "dropped": 0, "sampled_out": 0, "hook_ns": 0, "requests": 0}
+
+_state = {"pid": None, "queue": None, "listener": None, "handler": None}
+_lock = threading.Lock()
+
+
+# -------------------------------
+# Formatage JSON
+# -------------------------------
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par record ; les champs structurés viennent de extra={"fields": {...}}."""
+
+    def format(self, record):
+        out = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat().replace("+00:00", "Z"),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            out.update(fields)
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+# -------------------------------
+# Rotation sûre en multi-processus
+# -------------------------------
+class LockedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler + verrou fcntl sur '<fichier>.lock'.
+    - la taille est relue sur disque (un autre processus a pu écrire)
+    - si un autre processus a fait la rotation (inode différent), on rouvre
+    N'est appelé que depuis le thread listener : le coût du verrou est hors chemin chaud.
+    """
+
+    def __init__(self, filename, **kw):
+        super().__init__(filename, delay=True, **kw)
+        self._lockfile = open(self.baseFilename + ".lock", "a")
+
+    def _reopen_if_rotated(self):
+        if self.stream is None:
+            return
+        try:
+            st = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            st = None
+        if st is None or st.st_ino != os.fstat(self.stream.fileno()).st_ino:
+            self.stream.close()
+            self.stream = None
+
+    def shouldRollover(self, record):
+        if self.maxBytes <= 0:
+            return False
+        try:
+            size = os.stat(self.baseFilename).st_size
+        except FileNotFoundError:
+            return False
+        return size + len(self.format(record)) + 1 >= self.maxBytes
+
+    def emit(self, record):
+        if fcntl is None:
+            return super().emit(record)
+        try:
+            fcntl.flock(self._lockfile, fcntl.LOCK_EX)
+            try:
+                self._reopen_if_rotated()
+                super().emit(record)
+                if self.stream is not None:
+                    self.stream.flush()
+            finally:
+                fcntl.flock(self._lockfile, fcntl.LOCK_UN)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        super().close()
+        self._lockfile.close()
+
+
+# -------------------------------
+# Handler côté requête : put_nowait, jamais bloquant
+# -------------------------------
+class DroppingQueueHandler(QueueHandler):
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            _stats["enqueued"] += 1
+        except queue.Full:
+            _stats["dropped"] += 1
+
+    def prepare(self, record):
+        # Plus léger que QueueHandler.prepare : pas de copie ni de formatage du message
+        # (fait par le listener), on ne fige que ce qui n'est pas picklable/thread-safe.
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class RequestQueueListener(QueueListener):
+    """
+    Le chemin chaud met en file un simple tuple (created, fields) ; la
+    construction du LogRecord (coûteuse : thread, pid, nom de process…) est faite ici.
+    """
+
+    def __init__(self, q, *handlers, logger_name="app", **kw):
+        super().__init__(q, *handlers, **kw)
+        self.logger_name = logger_name
+
+    def prepare(self, item):
+        if isinstance(item, tuple):
+            created, fields = item
+            rec = logging.makeLogRecord({
+                "name": self.logger_name, "levelno": logging.INFO, "levelname": "INFO",
+                "msg": "request", "fields": fields,
+            })
+            rec.created = created
+            return rec
+        return item
+
+
+def _enqueue_request(fields):
+    q = _state["queue"]
+    if q is None:
+        return
+    try:
+        q.put_nowait((time.time(), fields))
+        _stats["enqueued"] += 1
+    except queue.Full:
+        _stats["dropped"] += 1
+
+
+# -------------------------------
+# Cycle de vie (un listener par processus)
+# -------------------------------
+def _file_handler():
+    os.makedirs(os.path.dirname(LOG_FILE) or ".", exist_ok=True)
+    fh = LockedRotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+    fh.setLevel(logging.INFO)
+    fh.setFormatter(JsonFormatter())
+    return fh
+
+
+def start(app):
+    """
+    Démarre (ou redémarre après fork) le listener du processus courant.
+    Après un fork, le thread du parent n'existe plus et sa queue peut être
+    verrouillée : on recrée tout.
+    """
+    if _state["pid"] == os.getpid() and _state["handler"] in app.logger.handlers:
+        return
+    with _lock:
+        if _state["pid"] == os.getpid():
+            if _state["handler"] not in app.logger.handlers:
+                app.logger.addHandler(_state["handler"])
+            return
+        q = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        listener = RequestQueueListener(q, _file_handler(), logger_name=app.logger.name,
+                                        respect_handler_level=True)
+        listener.start()
+
+        if _state["handler"] is not None:
+            app.logger.removeHandler(_state["handler"])
+        qh = DroppingQueueHandler(q)
+        qh.setLevel(logging.INFO)
+        app.logger.addHandler(qh)
+        app.logger.setLevel(logging.INFO)
+        # stderr (handler par défaut de Flask) : seulement warnings/erreurs, synchrone
+        default_handler.setLevel(logging.WARNING)
+
+        for k in _stats:
+            _stats[k] = 0
+        _state.update(pid=os.getpid(), queue=q, listener=listener, handler=qh)
+
+
+def stop():
+    """Vide la queue et arrête le listener (appelé à la sortie du processus)."""
+    with _lock:
+        listener = _state["listener"]
+        if listener is not None and listener._thread is not None and _state["pid"] == os.getpid():
+            listener.stop()
+            for h in listener.handlers:
+                h.close()
+        _state.update(pid=None, queue=None, listener=None)
+
+
+atexit.register(stop)
+
+
+def stats():
+    """Compteurs du processus : records en file, jetés, échantillonnés, coût moyen du hook."""
+    out = dict(_stats)
+    out["queue_depth"] = _state["queue"].qsize() if _state["queue"] is not None else 0
+    out["hook_us_avg"] = (_stats["hook_ns"] / _stats["requests"] / 1000) if _stats["requests"] else 0.0
+    return out
+
+
+# -------------------------------
+# Hooks Flask
+# -------------------------------
+def init_app(app):
+    start(app)
+
+    @app.before_request
+    def _request_id():
+        # Un ID de requête pour tracer côté logs
+        g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        g.t0 = time.perf_counter()
+
+    @app.after_request
+    def _after(resp):
+        t_hook = time.perf_counter_ns()
+        # On renvoie l'ID dans la réponse (utile côté front/outils)
+        resp.headers["X-Request-ID"] = g.get("request_id", "")
+
+        dur_ms = (time.perf_counter() - g.get("t0", time.perf_counter())) * 1000
+        status = resp.status_code
+        if status < 400 and dur_ms < LOG_SLOW_MS and random.random() >= LOG_SAMPLE_RATE:
+            _stats["sampled_out"] += 1
+        else:
+            fields = {
+                "request_id": g.get("request_id"),
+                "method": request.method,
+                "path": request.path,
+                "status": status,
+                "duration_ms": round(dur_ms, 2),
+                "bytes": resp.calculate_content_length(),
+                "endpoint": request.endpoint,
+                **g.get("log_extra", {}),
+            }
+            _enqueue_request(fields)
+
+        _stats["requests"] += 1
+        _stats["hook_ns"] += time.perf_counter_ns() - t_hook
+        return resp
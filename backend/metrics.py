@@ -0,0 +1,189 @@
+# ===========================================================
+#  metrics.py — endpoint /metrics au format Prometheus
+#
+#  Exposé :
+#    http_requests_total{blueprint,endpoint,method,status}
+#    http_request_duration_seconds{blueprint,endpoint,method}   (histogramme -> p50/p95/p99)
+#    http_response_size_bytes{blueprint,endpoint}               (histogramme)
+#    http_requests_in_flight
+#    mongo_pool_connections / mongo_pool_checked_out / mongo_pool_wait_queue
+#    mongo_pool_wait_seconds                                    (histogramme)
+#    sequence_values_issued_total / sequence_blocks_reserved_total{sequence}
+#    sequence_values_available{sequence}   (valeurs réservées non distribuées)
+#    refcache_reloads_total{cache}         (rechargements des instantanés, cf. refcache.py)
+#    cache_invalidations_total{collection,source}  (cf. invalidation.py)
+#
+#  Multi-processus : avec PROMETHEUS_MULTIPROC_DIR (posé par gunicorn.conf.py),
+#  chaque worker écrit ses valeurs dans des fichiers mmap et /metrics agrège
+#  tous les workers, quel que soit celui qui répond. Sans cette variable
+#  (serveur de dev), registre en mémoire du processus.
+#
+#  Coût par requête : quelques écritures mmap ; les enfants .labels() sont
+#  mis en cache pour éviter la résolution des labels à chaque requête.
+# ===========================================================
+
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest,
+)
+from prometheus_client import multiprocess
+from pymongo import monitoring
+
+MULTIPROC = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+_LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+REQUESTS = Counter(
+    "http_requests_total", "Requêtes HTTP traitées",
+    ["blueprint", "endpoint", "method", "status"],
+)
+LATENCY = Histogram(
+    "http_request_duration_seconds", "Durée de traitement des requêtes",
+    ["blueprint", "endpoint", "method"], buckets=_LATENCY_BUCKETS,
+)
+RESP_SIZE = Histogram(
+    "http_response_size_bytes", "Taille des corps de réponse (hors streaming)",
+    ["blueprint", "endpoint"], buckets=_SIZE_BUCKETS,
+)
+IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requêtes en cours", multiprocess_mode="livesum",
+)
+
+POOL_CONNECTIONS = Gauge(
+    "mongo_pool_connections", "Connexions Mongo ouvertes", multiprocess_mode="livesum",
+)
+POOL_CHECKED_OUT = Gauge(
+    "mongo_pool_checked_out", "Connexions Mongo empruntées", multiprocess_mode="livesum",
+)
+POOL_WAIT_QUEUE = Gauge(
+    "mongo_pool_wait_queue", "Threads en attente d'une connexion Mongo", multiprocess_mode="livesum",
+)
+POOL_WAIT = Histogram(
+    "mongo_pool_wait_seconds", "Attente pour obtenir une connexion Mongo",
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5),
+)
+
+SEQ_ISSUED = Counter(
+    "sequence_values_issued_total", "Valeurs de séquence distribuées (cf. sequences.py)", ["sequence"],
+)
+SEQ_BLOCKS = Counter(
+    "sequence_blocks_reserved_total", "Blocs de séquence réservés en base", ["sequence"],
+)
+SEQ_AVAILABLE = Gauge(
+    "sequence_values_available", "Valeurs réservées restant à distribuer",
+    ["sequence"], multiprocess_mode="livesum",
+)
+
+REFCACHE_RELOADS = Counter(
+    "refcache_reloads_total", "Rechargements des instantanés de référence", ["cache"],
+)
+CACHE_INVALIDATIONS = Counter(
+    "cache_invalidations_total", "Invalidations publiées aux caches en mémoire",
+    ["collection", "source"],
+)
+COMPRESSION_BYTES = Counter(
+    "http_compression_bytes_total", "Octets avant (in) / après (out) compression des réponses",
+    ["encoding", "stage"],
+)
+MIGRATION_DOCS = Counter(
+    "migration_documents_total", "Documents lus (scanned) / modifiés (modified) par les migrations",
+    ["migration", "result"],
+)
+MIGRATION_REMAINING = Gauge(
+    "migration_documents_remaining", "Documents restant à migrer (estimation, cf. migrations.py)",
+    ["migration"], multiprocess_mode="mostrecent",
+)
+
+_children = {}
+
+
+def _child(metric, *labels):
+    key = (metric, labels)
+    c = _children.get(key)
+    if c is None:
+        c = _children[key] = metric.labels(*labels)
+    return c
+
+
+# -------------------------------
+# Pool de connexions Mongo
+# -------------------------------
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    def connection_created(self, event):
+        POOL_CONNECTIONS.inc()
+
+    def connection_closed(self, event):
+        POOL_CONNECTIONS.dec()
+
+    def connection_check_out_started(self, event):
+        POOL_WAIT_QUEUE.inc()
+
+    def connection_checked_out(self, event):
+        POOL_WAIT_QUEUE.dec()
+        POOL_CHECKED_OUT.inc()
+        POOL_WAIT.observe(event.duration)
+
+    def connection_check_out_failed(self, event):
+        POOL_WAIT_QUEUE.dec()
+        POOL_WAIT.observe(event.duration)
+
+    def connection_checked_in(self, event):
+        POOL_CHECKED_OUT.dec()
+
+    # événements sans métrique associée
+    def connection_ready(self, event): pass
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+
+
+pool_listener = PoolMetrics()
+
+
+# -------------------------------
+# Hooks Flask + /metrics
+# -------------------------------
+def init_app(app):
+    @app.before_request
+    def _metrics_start():
+        g.metrics_t0 = time.perf_counter()
+        IN_FLIGHT.inc()
+
+    @app.after_request
+    def _metrics_end(resp):
+        t0 = g.get("metrics_t0")
+        if t0 is None or request.endpoint == "metrics":
+            return resp
+        bp = request.blueprint or "app"
+        ep = request.endpoint or "none"
+        _child(REQUESTS, bp, ep, request.method, str(resp.status_code)).inc()
+        _child(LATENCY, bp, ep, request.method).observe(time.perf_counter() - t0)
+        size = resp.calculate_content_length()
+        if size is not None:
+            _child(RESP_SIZE, bp, ep).observe(size)
+        return resp
+
+    @app.teardown_request
+    def _metrics_teardown(exc):
+        if g.pop("metrics_t0", None) is not None:
+            IN_FLIGHT.dec()
+
+    @app.get("/metrics")
+    def metrics():
+        if MULTIPROC:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def mark_process_dead(pid):
+    """À appeler par le master quand un worker meurt (gunicorn child_exit)."""
+    if MULTIPROC:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,405 @@
+# ===========================================================
+#  migrations.py — migrations de données en ligne (backfills par lots)
+#
+#  Chaque migration est une entrée versionnée de MIGRATIONS :
+#    Backfill(id, collection, query, fix | ops)
+#      query : documents encore à migrer (un document migré n'y répond plus)
+#      fix(doc) -> update | None   correction d'un document, ou
+#      ops(db, docs) -> [UpdateOne] corrections d'un lot (lectures groupées)
+#
+#  Exécution : plages d'_id explicites. Chaque lot = les MIGRATION_BATCH
+#  _id suivants (parcours couvert de l'index _id), puis {query, _id dans la
+#  plage} : au plus MIGRATION_BATCH documents examinés par requête, même pour
+#  une migration qui ne touche que de rares documents. Corrections écrites
+#  par bulk_write(ordered=False) ; le filtre de chaque UpdateOne reprend
+#  `query` : un document modifié entre-temps par l'API n'est pas écrasé.
+#  Chaque lecture porte maxTimeMS (MIGRATION_MAX_TIME_MS) ; dépassement ->
+#  lots réduits de moitié.
+#
+#  Collection `migrations` (une entrée par migration) :
+#    {_id, status: running|done|failed, owner, heartbeat_at, last_id,
+#     scanned, modified, estimate, started_at, finished_at, error}
+#    - last_id = point de reprise, enregistré après chaque lot
+#    - owner / heartbeat_at = bail : un seul processus exécute une migration ;
+#      un bail non renouvelé depuis MIGRATION_LEASE_SECONDS est repris
+#      (worker recyclé, déploiement…) à partir de last_id
+#
+#  Débit borné : au plus MIGRATION_RATE documents examinés par seconde
+#  (pause entre les lots), pour tourner sous la charge de production.
+#
+#  Quand :
+#    - thread de fond d'un worker (start, après fork), dans l'ordre de
+#      MIGRATIONS ; une migration en échec arrête la file. Jamais dans le
+#      master : le démarrage n'attend aucune migration.
+#    - migrations `blocking` (ex. drapeau deleted, requis par les index
+#      partiels) : exécutées en premier ; tant qu'il en reste, app.bootstrap
+#      n'applique pas les index (pending), le thread les applique ensuite
+#    - CLI :
+#        python migrations.py status
+#        python migrations.py run [--retry] [id…]   (--retry : relance les échecs)
+#        python migrations.py reset <id>            (rejouer depuis le début)
+#
+#  Métriques : migration_documents_total{migration,result=scanned|modified},
+#              (scanned = examinés), migration_documents_remaining{migration}
+#              (estimation : documents restant à examiner)
+#
+#  Réglages : MIGRATIONS_ON_START=1, MIGRATION_BATCH=500, MIGRATION_RATE=2000,
+#             MIGRATION_LEASE_SECONDS=60, MIGRATION_MAX_TIME_MS=5000
+# ===========================================================
+
+import os
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, ExecutionTimeout, PyMongoError
+
+import indexes
+import metrics
+import names
+import scheduling
+import search_keys
+import versions
+from utils import iso_to_dt
+
+MIGRATIONS_ON_START = os.getenv("MIGRATIONS_ON_START", "1").lower() in ("1", "true", "yes")
+MIGRATION_BATCH = int(os.getenv("MIGRATION_BATCH", "500"))
+MIGRATION_RATE = float(os.getenv("MIGRATION_RATE", "2000"))
+MIGRATION_LEASE_SECONDS = float(os.getenv("MIGRATION_LEASE_SECONDS", "60"))
+MIGRATION_MAX_TIME_MS = int(os.getenv("MIGRATION_MAX_TIME_MS", "5000"))
+MIGRATION_MIN_BATCH = 50
+
+COLLECTION = "migrations"
+
+_state = {"pid": None, "stop": None}
+
+
+class Backfill:
+    """Migration des documents de `collection` qui vérifient `query`."""
+
+    def __init__(self, id, description, collection, query, fix=None, ops=None,
+                 projection=None, blocking=False):
+        self.id = id
+        self.description = description
+        self.collection = collection
+        self.query = query
+        self._fix = fix
+        self._ops = ops
+        self.projection = projection
+        self.blocking = blocking
+
+    def ops(self, db, docs):
+        if self._ops is not None:
+            return self._ops(db, docs)
+        out = []
+        for d in docs:
+            update = self._fix(d)
+            if update:
+                out.append(UpdateOne({"_id": d["_id"], **self.query}, update))
+        return out
+
+
+# -------------------------------
+# Corrections
+# -------------------------------
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _appointment_date_time(d):
+    """start_at (seed historique, parfois en chaîne) -> date_time, clé lue par les routes."""
+    update = {"$unset": {"start_at": ""}, "$set": {"updated_at": _now()}}
+    if d.get("date_time") is None:
+        try:
+            dt = iso_to_dt(d.get("start_at"))
+        except ValueError:
+            return None                         # illisible : laissé tel quel (visible dans status)
+        if dt is not None:
+            update["$set"]["date_time"] = dt
+    return update
+
+
+def _soft_delete_flag(d):
+    """deleted explicite (softdelete.py) ; deleted_at des supprimés d'après updated_at."""
+    if d.get("deleted") is True:
+        return {"$set": {"deleted_at": d.get("updated_at") or _now()}}
+    return {"$set": {"deleted": False}}
+
+
+# Dates écrites en chaîne ISO (imports, mongo-express) -> dates BSON ; clés de tri des listes comprises
+DATE_FIELDS = ("created_at", "updated_at", "date_time", "date_ordered", "deleted_at")
+
+
+def _string_dates(d):
+    s = {}
+    for f in DATE_FIELDS:
+        if isinstance(d.get(f), str):
+            try:
+                s[f] = iso_to_dt(d[f])
+            except ValueError:
+                continue
+    return {"$set": s} if s else None
+
+
+def _search_keys_ops(db, docs):
+    return [UpdateOne({"_id": d["_id"], "search_keys": {"$exists": False}},
+                      {"$set": {"search_keys": search_keys.patient_keys(d)}}) for d in docs]
+
+
+def _name_ops(db, docs):
+    return names.sync_ops(db, docs, _now())
+
+
+def _slot_ops(db, docs):
+    return scheduling.sync_ops(db, docs, _now())
+
+
+MIGRATIONS = [
+    Backfill("0001_appointments_date_time", "appointments.start_at -> date_time",
+             "appointments", {"start_at": {"$exists": True}}, fix=_appointment_date_time,
+             projection={"start_at": 1, "date_time": 1}),
+    *[Backfill(f"0002_soft_delete_{c}", f"{c}: deleted explicite + deleted_at", c,
+               {"$or": [{"deleted": {"$nin": [True, False]}},
+                        {"deleted": True, "deleted_at": {"$exists": False}}]},
+               fix=_soft_delete_flag, projection={"deleted": 1, "updated_at": 1}, blocking=True)
+      for c in indexes.LISTS],
+    *[Backfill(f"0003_string_dates_{c}", f"{c}: dates en chaîne -> dates BSON", c,
+               {"$or": [{f: {"$type": "string"}} for f in DATE_FIELDS]},
+               fix=_string_dates, projection=dict.fromkeys(DATE_FIELDS, 1))
+      for c in indexes.LISTS],
+    Backfill("0004_patients_search_keys", "patients.search_keys (search_keys.py)",
+             "patients", {"search_keys": {"$exists": False}}, ops=_search_keys_ops,
+             projection=dict.fromkeys(search_keys.SOURCE_FIELDS, 1)),
+    *[Backfill(f"0005_name_snapshots_{c}", f"{c}: patient_name / doctor_name (names.py)", c,
+               {"patient_identifier": {"$exists": False}}, ops=_name_ops,
+               projection=names.SOURCE_PROJECTION)
+      for c in names.TARGETS],
+    Backfill("0006_appointments_slots", "appointments.end_at + cases réservées (scheduling.py)",
+             "appointments", {"end_at": {"$exists": False}}, ops=_slot_ops,
+             projection={**scheduling.PROJECTION, "deleted": 1}),
+]
+
+
+# -------------------------------
+# Exécution
+# -------------------------------
+def _owner():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def _acquire(db, m, owner, retry):
+    """Bail sur la migration `m` -> entrée (avec last_id) ou None si terminée / tenue par un autre."""
+    now = _now()
+    takeable = ["failed"] if retry else []
+    try:
+        return db[COLLECTION].find_one_and_update(
+            {"_id": m.id, "$or": [
+                {"status": {"$in": takeable}},
+                {"status": "running", "heartbeat_at": {"$lt": datetime.fromtimestamp(
+                    now.timestamp() - MIGRATION_LEASE_SECONDS, timezone.utc)}},
+            ]},
+            {"$set": {"status": "running", "owner": owner, "heartbeat_at": now, "error": None},
+             "$setOnInsert": {"description": m.description, "collection": m.collection,
+                              "started_at": now, "last_id": None, "scanned": 0, "modified": 0}},
+            upsert=True, return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:               # entrée existante non reprenable (done, failed, bail actif)
+        return None
+
+
+def _estimate(db, m):
+    """Taille de la collection (métadonnées : aucun parcours)."""
+    try:
+        return db[m.collection].estimated_document_count(maxTimeMS=MIGRATION_MAX_TIME_MS)
+    except PyMongoError:
+        return None
+
+
+def _range(db, m, last, size):
+    """_id des `size` documents suivant `last` (parcours couvert de l'index _id) -> [] en fin de collection."""
+    q = {"_id": {"$gt": last}} if last is not None else {}
+    cur = db[m.collection].find(q, {"_id": 1}).sort("_id", 1).limit(size).max_time_ms(MIGRATION_MAX_TIME_MS)
+    return [d["_id"] for d in cur]
+
+
+def run_one(db, m, owner=None, retry=False, stop=None, log=print):
+    """
+    Exécute (ou reprend) la migration `m`.
+    -> "done", "busy" (bail tenu ailleurs / déjà en échec), "stopped" ou "failed".
+    """
+    owner = owner or _owner()
+    stop = stop or threading.Event()
+    rec = _acquire(db, m, owner, retry)
+    if rec is None:
+        cur = db[COLLECTION].find_one({"_id": m.id}, {"status": 1}) or {}
+        return "done" if cur.get("status") == "done" else "busy"
+
+    last = rec.get("last_id")
+    remaining = _estimate(db, m)
+    if remaining is not None:
+        remaining = max(0, remaining - rec.get("scanned", 0))
+    db[COLLECTION].update_one({"_id": m.id}, {"$set": {"estimate": remaining}})
+    scanned_c = metrics.MIGRATION_DOCS.labels(m.id, "scanned")
+    modified_c = metrics.MIGRATION_DOCS.labels(m.id, "modified")
+    remaining_g = metrics.MIGRATION_REMAINING.labels(m.id)
+    if remaining is not None:
+        remaining_g.set(remaining)
+    log(f"[migrations] {m.id} : reprise après {last}, ~{remaining} document(s) à examiner" if last
+        else f"[migrations] {m.id} : ~{remaining} document(s) à examiner")
+
+    size = MIGRATION_BATCH
+    try:
+        while not stop.is_set():
+            t0 = time.monotonic()
+            try:
+                # lot = plage d'_id explicite ]last, upper] : au plus `size` documents examinés,
+                # quelle que soit la rareté des documents à migrer
+                ids = _range(db, m, last, size)
+                if not ids:
+                    rec = db[COLLECTION].find_one_and_update(
+                        {"_id": m.id, "owner": owner},
+                        {"$set": {"status": "done", "finished_at": _now(), "heartbeat_at": _now()}},
+                        return_document=ReturnDocument.AFTER,
+                    )
+                    if rec and rec.get("modified"):
+                        versions.bump(db, m.collection)     # ETags des listes (cf. conditional.py)
+                    remaining_g.set(0)
+                    log(f"[migrations] {m.id} : terminée")
+                    return "done"
+                rng = {"$gt": last, "$lte": ids[-1]} if last is not None else {"$lte": ids[-1]}
+                docs = list(db[m.collection].find({**m.query, "_id": rng}, m.projection)
+                            .max_time_ms(MIGRATION_MAX_TIME_MS))
+            except ExecutionTimeout:
+                # primaire chargé : lot réduit de moitié, pause d'un lot
+                size = max(MIGRATION_MIN_BATCH, size // 2)
+                log(f"[migrations] {m.id} : délai dépassé, lots de {size}")
+                stop.wait(MIGRATION_BATCH / MIGRATION_RATE if MIGRATION_RATE > 0 else 1.0)
+                continue
+
+            ops = m.ops(db, docs) if docs else []
+            modified = db[m.collection].bulk_write(ops, ordered=False).modified_count if ops else 0
+            last = ids[-1]
+
+            # point de reprise + renouvellement du bail (perdu -> un autre a repris : on s'arrête)
+            res = db[COLLECTION].update_one(
+                {"_id": m.id, "owner": owner},
+                {"$set": {"last_id": last, "heartbeat_at": _now()},
+                 "$inc": {"scanned": len(ids), "modified": modified}},
+            )
+            scanned_c.inc(len(ids))
+            modified_c.inc(modified)
+            if remaining is not None:
+                remaining = max(0, remaining - len(ids))
+                remaining_g.set(remaining)
+            if not res.matched_count:
+                log(f"[migrations] {m.id} : bail perdu, arrêt")
+                return "busy"
+
+            # débit borné : MIGRATION_RATE documents EXAMINÉS par seconde (migrés ou non)
+            if MIGRATION_RATE > 0:
+                stop.wait(max(0.0, len(ids) / MIGRATION_RATE - (time.monotonic() - t0)))
+        db[COLLECTION].update_one({"_id": m.id, "owner": owner},
+                                  {"$set": {"heartbeat_at": datetime.fromtimestamp(0, timezone.utc)}})
+        return "stopped"                    # bail relâché : reprise immédiate par un autre processus
+    except Exception as e:
+        db[COLLECTION].update_one({"_id": m.id, "owner": owner},
+                                  {"$set": {"status": "failed", "error": repr(e), "finished_at": _now()}})
+        log(f"[migrations] {m.id} : échec {e!r}")
+        return "failed"
+
+
+def pending(db, blocking_only=False):
+    """Migrations non terminées (dans l'ordre de MIGRATIONS) -> [id]. Une requête, rien n'est exécuté."""
+    done = {d["_id"] for d in db[COLLECTION].find({"status": "done"}, {"_id": 1})}
+    return [m.id for m in MIGRATIONS if m.id not in done and (m.blocking or not blocking_only)]
+
+
+def run(db, ids=None, blocking_only=False, retry=False, stop=None, log=print):
+    """
+    Exécute les migrations en attente, dans l'ordre. S'arrête à la première qui n'aboutit pas.
+    -> True si toutes les migrations visées sont terminées.
+    """
+    done = {d["_id"] for d in db[COLLECTION].find({"status": "done"}, {"_id": 1})}
+    owner = _owner()
+    for m in MIGRATIONS:
+        if m.id in done or (ids and m.id not in ids) or (blocking_only and not m.blocking):
+            continue
+        if run_one(db, m, owner=owner, retry=retry, stop=stop, log=log) != "done":
+            return False
+    return True
+
+
+# -------------------------------
+# Thread de fond (workers)
+# -------------------------------
+def _background(app, stop, on_blocking_done):
+    log = app.logger.info
+    blocking_done = False
+    while not stop.is_set():
+        try:
+            # bloquantes d'abord : elles conditionnent les index (on_blocking_done)
+            if not blocking_done and run(app.db, blocking_only=True, stop=stop, log=log):
+                blocking_done = True
+                if on_blocking_done is not None:
+                    on_blocking_done()
+            if blocking_done and run(app.db, stop=stop, log=log):
+                return
+        except PyMongoError as e:
+            app.logger.warning("[migrations] %r", e)
+        stop.wait(MIGRATION_LEASE_SECONDS)      # tenue par un autre worker, ou Mongo indisponible
+
+
+def start(app, on_blocking_done=None):
+    """
+    Lance les migrations en attente dans un thread du processus courant (idempotent, après fork).
+    on_blocking_done() : appelé une fois les migrations bloquantes terminées (ex. index).
+    """
+    if not MIGRATIONS_ON_START or _state["pid"] == os.getpid():
+        return
+    stop = threading.Event()
+    _state.update(pid=os.getpid(), stop=stop)
+    threading.Thread(target=_background, args=(app, stop, on_blocking_done), name="migrations",
+                     daemon=True).start()
+
+
+# -------------------------------
+# CLI
+# -------------------------------
+def status(db):
+    recs = {d["_id"]: d for d in db[COLLECTION].find()}
+    for m in MIGRATIONS:
+        r = recs.get(m.id) or {}
+        print(f"{m.id:36} {r.get('status', 'pending'):8} lus={r.get('scanned', 0):<9} "
+              f"modifiés={r.get('modified', 0):<9} {r.get('error') or ''}")
+
+
+def main(argv=None):
+    from pymongo import MongoClient
+
+    argv = sys.argv[1:] if argv is None else argv
+    cmd = argv[0] if argv else "status"
+    db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))[os.getenv("MONGO_DB", "hospital")]
+
+    if cmd == "status":
+        status(db)
+        return 0
+    if cmd == "run":
+        ids = [a for a in argv[1:] if not a.startswith("--")] or None
+        ok = run(db, ids=ids, retry="--retry" in argv)
+        if not pending(db, blocking_only=True):
+            indexes.apply(db)               # index partiels en attente des migrations bloquantes
+        return 0 if ok else 1
+    if cmd == "reset" and len(argv) == 2:
+        db[COLLECTION].delete_one({"_id": argv[1]})
+        print(f"[migrations] {argv[1]} : réinitialisée")
+        return 0
+
+    print("usage: python migrations.py [status | run [--retry] [id…] | reset <id>]")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
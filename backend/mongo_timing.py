@@ -0,0 +1,163 @@
+# ===========================================================
+#  mongo_timing.py — comptabilité Mongo par requête + Server-Timing
+#
+#  Un CommandListener pymongo (enregistré sur le MongoClient) additionne,
+#  pour la requête HTTP en cours (g.mongo_stats, lié à g.request_id) :
+#    - le nombre de commandes, leur durée serveur+réseau, les échecs
+#    - les octets envoyés / reçus (BSON), si MONGO_TIMING_BYTES
+#  Les événements de commande sont émis dans le thread qui exécute la
+#  commande : le thread de la requête Flask.
+#
+#  Sortie :
+#    Server-Timing: mongo;dur=3.1;desc="4 cmds", app;dur=1.2, total;dur=4.3
+#    + champs mongo_* dans la ligne de log de la requête
+#
+#  Variables d'environnement :
+#    SERVER_TIMING       (true)  en-tête Server-Timing
+#    MONGO_TIMING_BYTES  (false) mesure des octets : les événements pymongo ne donnent
+#                                pas les tailles, chaque commande et réponse est
+#                                ré-encodée en BSON (diagnostic ponctuel seulement)
+#    MONGO_QUERY_DEBUG   (false) détail par commande (nom, collection, forme du filtre,
+#                                durée) dans Server-Timing et dans les logs ; les formes
+#                                répétées >= 3 fois sont signalées (pistes de N+1)
+# ===========================================================
+
+import os
+import time
+from collections import Counter
+
+import bson
+from flask import g, has_request_context
+from pymongo import monitoring
+
+
+def _bool(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+SERVER_TIMING = _bool("SERVER_TIMING", "true")
+MONGO_TIMING_BYTES = _bool("MONGO_TIMING_BYTES", "false")
+MONGO_QUERY_DEBUG = _bool("MONGO_QUERY_DEBUG", "false")
+
+# Commandes dont la valeur n'est pas le nom de collection
+_COLL_KEY = {"getMore": "collection"}
+
+
+class RequestStats:
+    __slots__ = ("cmds", "micros", "failed", "bytes_out", "bytes_in", "queries")
+
+    def __init__(self, debug=False):
+        self.cmds = 0
+        self.micros = 0
+        self.failed = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.queries = [] if debug else None
+
+
+def _current():
+    if not has_request_context():
+        return None
+    return g.get("mongo_stats")
+
+
+def _shape(cmd_name, command):
+    """Forme d'une requête : collection + clés du filtre (sans les valeurs)."""
+    coll = command.get(_COLL_KEY.get(cmd_name, cmd_name))
+    filt = command.get("filter") or command.get("q") or {}
+    if cmd_name == "aggregate" and command.get("pipeline"):
+        filt = command["pipeline"][0].get("$match", {})
+    keys = ",".join(sorted(filt)) if isinstance(filt, dict) else ""
+    return coll if isinstance(coll, str) else "", keys
+
+
+# -------------------------------
+# Listener pymongo
+# -------------------------------
+class CommandTimer(monitoring.CommandListener):
+    def started(self, event):
+        st = _current()
+        if st is None:
+            return
+        if MONGO_TIMING_BYTES:
+            st.bytes_out += len(bson.encode(event.command))
+        if st.queries is not None:
+            coll, keys = _shape(event.command_name, event.command)
+            st.queries.append({"id": event.request_id, "cmd": event.command_name,
+                               "coll": coll, "filter": keys, "ms": None})
+
+    def _done(self, event, failed):
+        st = _current()
+        if st is None:
+            return
+        st.cmds += 1
+        st.micros += event.duration_micros
+        if failed:
+            st.failed += 1
+        elif MONGO_TIMING_BYTES and event.reply:
+            st.bytes_in += len(bson.encode(event.reply))
+        if st.queries is not None:
+            for q in reversed(st.queries):
+                if q["id"] == event.request_id:
+                    q["ms"] = round(event.duration_micros / 1000, 3)
+                    break
+
+    def succeeded(self, event):
+        self._done(event, False)
+
+    def failed(self, event):
+        self._done(event, True)
+
+
+listener = CommandTimer()
+
+
+# -------------------------------
+# Hooks Flask
+# -------------------------------
+def _server_timing(st, total_ms):
+    mongo_ms = st.micros / 1000
+    parts = [
+        f'mongo;dur={mongo_ms:.2f};desc="{st.cmds} cmds"',
+        f"app;dur={max(total_ms - mongo_ms, 0):.2f}",
+        f"total;dur={total_ms:.2f}",
+    ]
+    if st.queries:
+        for i, q in enumerate(st.queries):
+            parts.append(f'q{i};dur={q["ms"] or 0};desc="{q["cmd"]} {q["coll"]} {{{q["filter"]}}}"')
+    return ", ".join(parts)
+
+
+def init_app(app):
+    @app.before_request
+    def _mongo_stats_start():
+        g.mongo_stats = RequestStats(MONGO_QUERY_DEBUG)
+        g.timing_t0 = time.perf_counter()
+
+    @app.after_request
+    def _mongo_stats_end(resp):
+        st = g.get("mongo_stats")
+        if st is None:
+            return resp
+        total_ms = (time.perf_counter() - g.timing_t0) * 1000
+        if SERVER_TIMING:
+            resp.headers["Server-Timing"] = _server_timing(st, total_ms)
+
+        # Champs ajoutés à la ligne de log de la requête (cf. logging_pipeline)
+        extra = {
+            "mongo_cmds": st.cmds,
+            "mongo_ms": round(st.micros / 1000, 2),
+        }
+        if MONGO_TIMING_BYTES:
+            extra["mongo_bytes_out"] = st.bytes_out
+            extra["mongo_bytes_in"] = st.bytes_in
+        if st.failed:
+            extra["mongo_failed"] = st.failed
+        if st.queries is not None:
+            extra["mongo_queries"] = [{k: v for k, v in q.items() if k != "id"} for q in st.queries]
+            repeated = [f"{c} {coll} {{{f}}}" for (c, coll, f), n in
+                        Counter((q["cmd"], q["coll"], q["filter"]) for q in st.queries).items() if n >= 3]
+            if repeated:
+                extra["mongo_repeated"] = repeated
+        g.log_extra = {**g.get("log_extra", {}), **extra}
+        return resp
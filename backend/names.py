@@ -0,0 +1,210 @@
+# ===========================================================
+#  names.py — noms dénormalisés (patient / médecin) des rendez-vous
+#             et des consultations
+#
+#  Les listes affichent le nom du patient et du médecin de chaque ligne.
+#  Au lieu d'un $lookup par ligne, chaque document porte une copie :
+#    patient_name        "Prénom Nom"   (absent si prénom ou nom manquant)
+#    patient_identifier  "CHADH-PT-00042" ("" si le patient n'en a pas)
+#    doctor_name         "Prénom NOM"
+#  -> GET /api/appointments et /api/consultations sont de simples find indexés.
+#
+#  Maintenues par :
+#    - création unitaire et /bulk (fill : une requête $in par collection source)
+#    - PATCH patients / doctors : si identite ou identifiant change, la copie
+#      est propagée aux documents liés (update_many sur patient_id / doctor_id,
+#      index des listes) APRÈS l'envoi de la réponse (propagate_later)
+#    - python names.py backfill        documents sans copie (après déploiement,
+#                                      seed, gen_data)
+#      python names.py backfill --all  resynchronise tout (écritures faites
+#                                      hors API, propagation interrompue…)
+#
+#  Une propagation touche updated_at des documents liés et incrémente leur
+#  version (versions.py) : ETags de détail et de liste restent justes.
+#  Les documents supprimés gardent le nom qu'ils avaient à leur suppression.
+# ===========================================================
+
+import os
+import sys
+from datetime import datetime, timezone
+
+from flask import after_this_request, current_app
+from pymongo import UpdateOne
+
+import refcache
+import versions
+from softdelete import live
+
+# collections qui portent les copies
+TARGETS = ("appointments", "consultations")
+
+# Champs sources (PATCH : propagation seulement si l'un d'eux est modifié)
+PATIENT_SOURCE_FIELDS = ("identite.prenom", "identite.nom", "identifiant")
+DOCTOR_SOURCE_FIELDS = ("identite.prenom", "identite.nom")
+
+_PATIENT_PROJ = {"identite.prenom": 1, "identite.nom": 1, "identifiant": 1}
+_DOCTOR_PROJ = {"identite.prenom": 1, "identite.nom": 1}
+
+full_name = refcache.full_name
+
+
+def patient_fields(p) -> dict:
+    """Copie à poser pour le patient `p` (None : patient introuvable)."""
+    return {"patient_name": full_name(p), "patient_identifier": (p or {}).get("identifiant") or ""}
+
+
+def doctor_fields(d) -> dict:
+    return {"doctor_name": full_name(d)}
+
+
+def _update(fields, now):
+    """$set des valeurs présentes (+ updated_at sauf now=None), $unset des None (même rendu que strip_none)."""
+    update = {"$set": {k: v for k, v in fields.items() if v is not None}}
+    if now is not None:
+        update["$set"]["updated_at"] = now
+    u = {k: "" for k, v in fields.items() if v is None}
+    if u:
+        update["$unset"] = u
+    return update
+
+
+def _differs(fields):
+    """Filtre : copie absente ou différente de `fields`."""
+    return {"$or": [{k: {"$ne": v}} if v is not None else {k: {"$exists": True}} for k, v in fields.items()]}
+
+
+# -------------------------------
+# Création
+# -------------------------------
+def _sources(db, docs):
+    """
+    Patients et médecins référencés par `docs`, lus en base ($in) : jamais depuis l'instantané
+    refcache, dont le retard entre workers figerait un ancien nom dans la copie.
+    """
+    pids = {d["patient_id"] for d in docs if d.get("patient_id") is not None}
+    dids = {d["doctor_id"] for d in docs if d.get("doctor_id") is not None}
+    patients = {p["_id"]: p for p in db.patients.find({"_id": {"$in": list(pids)}}, _PATIENT_PROJ)} if pids else {}
+    doctors = {x["_id"]: x for x in db.doctors.find({"_id": {"$in": list(dids)}}, _DOCTOR_PROJ)} if dids else {}
+    return patients, lambda oid: full_name(doctors.get(oid))
+
+
+def fill(db, docs):
+    """Pose les copies sur des documents à insérer (en place)."""
+    if not docs:
+        return docs
+    patients, doctor_name = _sources(db, docs)
+    for d in docs:
+        fields = {**patient_fields(patients.get(d.get("patient_id"))),
+                  "doctor_name": doctor_name(d.get("doctor_id"))}
+        d.update({k: v for k, v in fields.items() if v is not None})
+    return docs
+
+
+# -------------------------------
+# Propagation (PATCH patients / doctors)
+# -------------------------------
+def _read_source(db, kind, oid):
+    proj = {**(_PATIENT_PROJ if kind == "patient" else _DOCTOR_PROJ), "updated_at": 1}
+    return (db.patients if kind == "patient" else db.doctors).find_one({"_id": oid}, proj)
+
+
+def propagate(db, kind, oid, now, attempts=3):
+    """
+    Réécrit dans TARGETS la copie du patient / médecin `oid`, relu en base : deux PATCH
+    rapprochés dont les propagations finissent dans le désordre écrivent tous deux le dernier nom.
+    Source modifiée pendant la propagation (updated_at changé) -> nouvelle passe.
+    Seuls les documents dont la copie diffère sont modifiés. -> nombre de documents modifiés.
+    """
+    key = "patient_id" if kind == "patient" else "doctor_id"
+    total, touched = 0, set()
+    source = _read_source(db, kind, oid)
+    for _ in range(attempts):
+        if source is None:
+            break
+        fields = patient_fields(source) if kind == "patient" else doctor_fields(source)
+        # documents vivants seulement : index partiels des listes (cf. softdelete.py)
+        q, update = live({key: oid, **_differs(fields)}), _update(fields, now)
+        for coll in TARGETS:
+            res = db[coll].update_many(q, update)
+            if res.modified_count:
+                total += res.modified_count
+                touched.add(coll)
+        again = _read_source(db, kind, oid)
+        if again is None or again.get("updated_at") == source.get("updated_at"):
+            break
+        source = again
+    if touched:
+        versions.bump(db, *sorted(touched))
+    return total
+
+
+def propagate_later(kind, source, now):
+    """Planifie propagate() de `source` (patient / médecin modifié) après l'envoi de la réponse."""
+    app = current_app._get_current_object()
+    db = app.db
+
+    def run():
+        try:
+            n = propagate(db, kind, source["_id"], now)
+            if n:
+                app.logger.info("[names] %s %s : %d document(s) mis à jour", kind, source["_id"], n)
+        except Exception as e:                   # rattrapé par `names.py backfill --all`
+            app.logger.warning("[names] propagation %s %s échouée : %r", kind, source["_id"], e)
+
+    @after_this_request
+    def _schedule(resp):
+        resp.call_on_close(run)
+        return resp
+
+
+# -------------------------------
+# Backfill
+# -------------------------------
+SOURCE_PROJECTION = {"patient_id": 1, "doctor_id": 1}
+
+
+def sync_ops(db, docs, now):
+    """UpdateOne qui alignent la copie des documents `docs` (patient_id, doctor_id) ; now=None : sans updated_at."""
+    patients, doctor_name = _sources(db, docs)
+    ops = []
+    for d in docs:
+        fields = {**patient_fields(patients.get(d.get("patient_id"))),
+                  "doctor_name": doctor_name(d.get("doctor_id"))}
+        ops.append(UpdateOne({"_id": d["_id"], **_differs(fields)}, _update(fields, now)))
+    return ops
+
+
+def backfill(db, batch=1000, resync=False, touch=True, log=print):
+    """
+    Pose les copies manquantes (ou les vérifie toutes si resync) par lots d'_id croissants.
+    touch=False : updated_at inchangé (données tout juste chargées, aucun ETag en circulation).
+    """
+    total = 0
+    for coll in TARGETS:
+        n, changed, last = 0, 0, None
+        while True:
+            q = {} if resync else {"patient_identifier": {"$exists": False}}
+            if last is not None:
+                q["_id"] = {"$gt": last}
+            docs = list(db[coll].find(q, SOURCE_PROJECTION).sort("_id", 1).limit(batch))
+            if not docs:
+                break
+            ops = sync_ops(db, docs, datetime.now(timezone.utc) if touch else None)
+            changed += db[coll].bulk_write(ops, ordered=False).modified_count
+            n += len(docs)
+            last = docs[-1]["_id"]
+            log(f"[names] {coll}: {n} lus, {changed} mis à jour")
+        if changed:
+            versions.bump(db, coll)
+        total += changed
+    return total
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+
+    if sys.argv[1:2] != ["backfill"]:
+        print("usage: python names.py backfill [--all]")
+        sys.exit(2)
+    _db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))[os.getenv("MONGO_DB", "hospital")]
+    backfill(_db, resync="--all" in sys.argv[2:])
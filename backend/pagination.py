@@ -0,0 +1,248 @@
+# ===========================================================
+#  pagination.py — pagination par curseur (keyset) des routes list_
+#
+#  Principe :
+#    - tri = (clé de tri, _id) ; la page suivante reprend APRÈS le dernier
+#      couple vu, via un filtre sur l'index (pas de skip) -> la page 100
+#      coûte autant que la page 1 quand l'index (filtres…, clé, _id) existe.
+#    - le client reçoit un jeton opaque (base64url) à renvoyer tel quel.
+#
+#  Paramètres de requête :
+#    ?limit=50        taille de page (défaut PAGE_SIZE_DEFAULT, max PAGE_SIZE_MAX)
+#    ?cursor=<jeton>  page suivante
+#    ?envelope=1      corps {"items": [...], "next": <jeton|null>} au lieu du tableau
+#
+#  Jeton de la page suivante (absent s'il n'y en a pas) :
+#    en-têtes  X-Next-Cursor  et  Link: <…?cursor=…>; rel="next"
+# ===========================================================
+
+import base64
+import json
+import os
+from itertools import islice
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+from bson import ObjectId
+from flask import request
+
+import streaming
+
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "200"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MS = timedelta(milliseconds=1)
+
+
+# -------------------------------
+# Jetons opaques
+# -------------------------------
+def _enc_value(v):
+    """Valeur de tri -> [tag, valeur JSON]."""
+    if v is None:
+        return ["n", None]
+    if isinstance(v, datetime):
+        v = v if v.tzinfo else v.replace(tzinfo=timezone.utc)
+        return ["d", (v - _EPOCH) // _MS]         # entier exact (un flottant perd parfois 1 ms)
+    if isinstance(v, ObjectId):
+        return ["o", str(v)]
+    if isinstance(v, (int, float, str, bool)):
+        return ["v", v]
+    raise ValueError(f"type de clé de tri non supporté : {type(v).__name__}")
+
+
+def _dec_value(tag, v):
+    if tag == "n":
+        return None
+    if tag == "d":
+        return _EPOCH + v * _MS
+    if tag == "o":
+        return ObjectId(v)
+    if tag == "v":
+        return v
+    raise ValueError("tag inconnu")
+
+
+def encode_cursor(field, direction, value, oid) -> str:
+    raw = json.dumps([field, direction, *_enc_value(value), str(oid)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str):
+    """-> (field, direction, value, ObjectId) ; ValueError si le jeton est invalide."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        field, direction, tag, v, oid = json.loads(raw)
+        return field, direction, _dec_value(tag, v), ObjectId(oid)
+    except Exception:
+        raise ValueError("cursor invalide")
+
+
+# -------------------------------
+# Filtre de reprise (aussi utilisé par indexes.py pour explain())
+# -------------------------------
+def after_filter(field, direction, value, oid) -> dict:
+    """
+    Reprise après (value, oid) : une seule borne de plage sur la clé de tri (f <= v
+    en décroissant) -> un seul parcours d'index déjà trié, sans SORT ni SORT_MERGE ;
+    le $or ne sert qu'à écarter les ex æquo (f == v) déjà envoyés.
+    Les documents sans clé de tri (null) ne sont pas paginés.
+    """
+    strict, bound = ("$lt", "$lte") if direction < 0 else ("$gt", "$gte")
+    if value is None:
+        return {field: None, "_id": {strict: oid}}
+    return {field: {bound: value}, "$or": [{field: {strict: value}}, {"_id": {strict: oid}}]}
+
+
+# -------------------------------
+# Page courante
+# -------------------------------
+class Page:
+    """
+    Une page d'une liste triée par (field, _id) dans le sens `direction` (1 / -1).
+
+        page = Page.from_request("created_at", -1)
+        cur = page.find(db.patients, q, projection)
+        return page.response(cur)
+
+    response(cur, transform=f) applique f à chaque document (enrichissement) ;
+    response_items(it) sert une liste déjà triée en mémoire (cf. refcache.py).
+    """
+
+    def __init__(self, field, direction, limit, after=None, envelope=False):
+        self.field = field
+        self.direction = direction
+        self.limit = limit
+        self.after = after          # (valeur, _id) du dernier document de la page précédente
+        self.envelope = envelope
+        self.mode = streaming.stream_mode()
+        self._coll = None
+        self._filter = None
+
+    @classmethod
+    def from_request(cls, field, direction=-1, kind=datetime):
+        """
+        Lit ?limit / ?cursor / ?envelope ; ValueError si invalides (-> 400 dans la route).
+        kind : type de la clé de tri ; la valeur du curseur doit en être (ou null).
+        """
+        try:
+            limit = int(request.args.get("limit", PAGE_SIZE_DEFAULT))
+        except ValueError:
+            raise ValueError("limit doit être un entier")
+        if limit < 1:
+            raise ValueError("limit doit être >= 1")
+        limit = min(limit, PAGE_SIZE_MAX)
+
+        after = None
+        token = request.args.get("cursor")
+        if token:
+            f, d, v, oid = decode_cursor(token)
+            if f != field or d != direction:
+                raise ValueError("cursor invalide pour cette liste")
+            if v is not None and not isinstance(v, kind):
+                raise ValueError("cursor invalide pour cette liste")
+            after = (v, oid)
+
+        envelope = request.args.get("envelope", "").lower() in ("1", "true", "yes")
+        return cls(field, direction, limit, after, envelope)
+
+    # --- construction de la requête
+    @property
+    def sort(self):
+        return [(self.field, self.direction), ("_id", self.direction)]
+
+    def filter(self, q: dict) -> dict:
+        if self.after is None:
+            return q
+        after = after_filter(self.field, self.direction, *self.after)
+        return {"$and": [q, after]} if q else after
+
+    @property
+    def _fetch(self):
+        # +1 document pour savoir s'il existe une page suivante (sauf en streaming : cf. _peek_next)
+        return self.limit if self.mode else self.limit + 1
+
+    def find(self, coll, q, projection=None):
+        self._coll, self._filter = coll, self.filter(q)
+        return coll.find(self._filter, projection).sort(self.sort).limit(self._fetch)
+
+    def aggregate(self, coll, q, tail=()):
+        """$match/$sort/$limit de la page, suivis des étapes `tail` ($lookup…)."""
+        self._coll, self._filter = coll, self.filter(q)
+        pipeline = [
+            {"$match": self._filter},
+            {"$sort": dict(self.sort)},
+            {"$limit": self._fetch},
+            *tail,
+        ]
+        return coll.aggregate(pipeline)
+
+    # --- page suivante
+    def _token_for(self, doc):
+        return encode_cursor(self.field, self.direction, doc.get(self.field), doc["_id"])
+
+    def _peek_next(self):
+        """
+        En streaming, les en-têtes partent avant les documents : on calcule le jeton
+        par une petite requête projetée (clé de tri + _id) qui saute au plus `limit`
+        entrées d'index — coût borné, indépendant de la profondeur.
+        """
+        docs = list(
+            self._coll.find(self._filter, {self.field: 1})
+            .sort(self.sort).skip(self.limit - 1).limit(2)
+        )
+        return self._token_for(docs[0]) if len(docs) == 2 else None
+
+    def _next_headers(self, token):
+        if not token:
+            return {}
+        args = request.args.to_dict()
+        args["cursor"] = token
+        return {"X-Next-Cursor": token, "Link": f'<{request.base_url}?{urlencode(args)}>; rel="next"'}
+
+    def _body(self, docs, status, transform):
+        token = None
+        if len(docs) > self.limit:
+            docs = docs[: self.limit]
+            token = self._token_for(docs[-1])
+        if transform is not None:
+            docs = [transform(d) for d in docs]
+        body = {"items": docs, "next": token} if self.envelope else docs
+        return body, status, self._next_headers(token)
+
+    def response(self, cursor, status=200, transform=None):
+        if self.mode:
+            headers = self._next_headers(self._peek_next())
+            if transform is not None:
+                cursor = _Mapped(cursor, transform)
+            return streaming.list_response(cursor, status, headers=headers)
+        return self._body(list(cursor), status, transform)
+
+    def response_items(self, items, status=200, transform=None):
+        """Comme response(), pour un itérable déjà filtré/trié/repris après le curseur."""
+        docs = list(islice(items, self.limit + 1))
+        if self.mode:
+            token = self._token_for(docs[self.limit - 1]) if len(docs) > self.limit else None
+            docs = docs[: self.limit]
+            if transform is not None:
+                docs = [transform(d) for d in docs]
+            return streaming.list_response(docs, status, headers=self._next_headers(token))
+        return self._body(docs, status, transform)
+
+
+class _Mapped:
+    """Curseur dont chaque document passe par `fn` (streaming : batch_size/close délégués)."""
+
+    def __init__(self, cursor, fn):
+        self._cursor, self._fn = cursor, fn
+
+    def __iter__(self):
+        return map(self._fn, self._cursor)
+
+    def batch_size(self, n):
+        self._cursor.batch_size(n)
+        return self
+
+    def close(self):
+        self._cursor.close()
@@ -0,0 +1,205 @@
+# ===========================================================
+#  refcache.py — instantanés en mémoire des données de référence
+#
+#  Médecins et établissements changent quelques fois par jour mais sont lus
+#  à chaque liste (GET /api/doctors, noms des établissements des médecins).
+#  Chaque worker garde un instantané complet en mémoire :
+#    doctors     identite, specialites, facility_id, created_at
+#                (les supprimés restent dans l'instantané, hors des listes)
+#    facilities  name, code
+#
+#  Invalidation par version (cf. versions.py) :
+#    - toute écriture (routes/doctors.py, seed, gen_data) incrémente la version
+#    - un worker relit la version au plus toutes les REFCACHE_CHECK_SECONDS
+#      (une requête _id), et recharge l'instantané si elle a changé
+#    - le worker qui écrit invalide son instantané immédiatement
+#    - toute modification vue par invalidation.py (autres workers,
+#      mongo-express…) marque l'instantané périmé ; tant que le change stream
+#      tourne, le contrôle de version n'est fait que toutes les
+#      REFCACHE_WATCHED_SECONDS (filet de sécurité)
+#
+#  Réglages :
+#    REFCACHE=1                  0 -> toujours lire Mongo
+#    REFCACHE_CHECK_SECONDS=2    fraîcheur maximale entre workers (sans change stream)
+#    REFCACHE_WATCHED_SECONDS=60 contrôle de version avec change stream actif
+#    REFCACHE_MAX_DOCS=100000    au-delà, pas d'instantané (lecture Mongo)
+#
+#  Les documents de l'instantané sont partagés entre requêtes : ne jamais
+#  les modifier (copier avant d'ajouter un champ).
+# ===========================================================
+
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+
+import invalidation
+import metrics
+from softdelete import is_live
+import versions
+
+REFCACHE_ENABLED = os.getenv("REFCACHE", "1").lower() in ("1", "true", "yes")
+REFCACHE_CHECK_SECONDS = float(os.getenv("REFCACHE_CHECK_SECONDS", "2"))
+REFCACHE_WATCHED_SECONDS = float(os.getenv("REFCACHE_WATCHED_SECONDS", "60"))
+REFCACHE_MAX_DOCS = int(os.getenv("REFCACHE_MAX_DOCS", "100000"))
+
+DOCTOR_FIELDS = {"identite": 1, "specialites": 1, "facility_id": 1, "created_at": 1}
+_DOCTOR_LOAD_FIELDS = {**DOCTOR_FIELDS, "deleted": 1}
+
+
+class Snapshot:
+    """Données `name` chargées par load(db), rechargées quand la version en base change."""
+
+    def __init__(self, name, load):
+        self.name = name
+        self._load = load
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loaded = False
+        self._data = None
+        self._version = None
+        self._checked = 0.0
+        self._stale = False
+        invalidation.subscribe(name, self._on_change)
+
+    def _on_change(self, coll, ids):
+        self._stale = True
+
+    def _fresh(self, now):
+        if not self._loaded or self._stale or self._pid != os.getpid():
+            return False
+        ttl = REFCACHE_WATCHED_SECONDS if invalidation.live() else REFCACHE_CHECK_SECONDS
+        return now - self._checked < ttl
+
+    def get(self, db):
+        """Instantané à jour, ou None (cache désactivé / collection trop grosse)."""
+        if not REFCACHE_ENABLED:
+            return None
+        if self._fresh(time.monotonic()):
+            return self._data
+        with self._lock:
+            if self._fresh(time.monotonic()):
+                return self._data
+            # version lue AVANT les données : une écriture pendant le chargement
+            # provoque un nouveau chargement au contrôle suivant
+            v = versions.current(db, [self.name])[self.name]
+            if not self._loaded or self._stale or v != self._version or self._pid != os.getpid():
+                self._stale = False          # avant le chargement : un changement pendant celui-ci reste visible
+                self._data = self._load(db)
+                self._version, self._pid, self._loaded = v, os.getpid(), True
+                metrics.REFCACHE_RELOADS.labels(self.name).inc()
+            self._checked = time.monotonic()
+            return self._data
+
+    def invalidate(self):
+        """Force la relecture de la version à la prochaine lecture."""
+        self._checked = 0.0
+
+
+# -------------------------------
+# Médecins
+# -------------------------------
+def _aware(dt):
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+class _Sorted:
+    """Documents triés par (created_at, _id) croissants + clés pour la recherche dichotomique."""
+
+    def __init__(self):
+        self.docs, self.keys = [], []
+
+    def add(self, doc, key):
+        self.docs.append(doc)
+        self.keys.append(key)
+
+    def after(self, direction, after):
+        """Itère dans le sens `direction` en reprenant après (valeur, _id) (cf. pagination.after_filter)."""
+        if after is not None and after[0] is None:
+            return iter(())                     # reprise parmi les documents sans date : hors instantané
+        if direction < 0:
+            i = len(self.keys) if after is None else bisect_left(self.keys, (_aware(after[0]), after[1]))
+            return (self.docs[k] for k in range(i - 1, -1, -1))
+        i = 0 if after is None else bisect_right(self.keys, (_aware(after[0]), after[1]))
+        return (self.docs[k] for k in range(i, len(self.docs)))
+
+
+class Doctors:
+    """Instantané des médecins : par _id, par spécialité, par établissement."""
+
+    def __init__(self, docs):
+        self.by_id = {}
+        self.all = _Sorted()
+        self.by_specialite, self.by_facility = {}, {}
+        for d in docs:
+            listed = is_live(d)
+            d.pop("deleted", None)
+            self.by_id[d["_id"]] = d
+            if not listed or not isinstance(d.get("created_at"), datetime):
+                continue                                   # hors listes (même filtre que list_)
+            key = (_aware(d["created_at"]), d["_id"])
+            self.all.add(d, key)
+            for s in d.get("specialites") or ():
+                self.by_specialite.setdefault(s, _Sorted()).add(d, key)
+            if d.get("facility_id") is not None:
+                self.by_facility.setdefault(d["facility_id"], _Sorted()).add(d, key)
+
+    def list(self, page, specialite=None, facility_id=None):
+        """Documents de la page (même ordre et même reprise que GET /api/doctors en base)."""
+        views = [self.all]
+        if specialite is not None:
+            views.append(self.by_specialite.get(specialite, _Sorted()))
+        if facility_id is not None:
+            views.append(self.by_facility.get(facility_id, _Sorted()))
+        base = min(views, key=lambda v: len(v.docs))       # vue la plus sélective
+        it = base.after(page.direction, page.after)
+        if specialite is not None:
+            it = (d for d in it if specialite in (d.get("specialites") or ()))
+        if facility_id is not None:
+            it = (d for d in it if d.get("facility_id") == facility_id)
+        return it
+
+
+
+def full_name(d):
+    """"Prénom Nom" d'un patient / médecin (None si l'un des deux manque)."""
+    ident = (d or {}).get("identite") or {}
+    if not ident.get("prenom") or not ident.get("nom"):
+        return None                                      # comme $concat avec un champ absent
+    return f"{ident['prenom']} {ident['nom']}"
+
+
+def _load_doctors(db):
+    docs = list(
+        db.doctors.find({}, _DOCTOR_LOAD_FIELDS)
+        .sort([("created_at", 1), ("_id", 1)])
+        .limit(REFCACHE_MAX_DOCS + 1)
+    )
+    return Doctors(docs) if len(docs) <= REFCACHE_MAX_DOCS else None
+
+
+def _load_facilities(db):
+    docs = list(db.facilities.find({}, {"name": 1, "code": 1}).limit(REFCACHE_MAX_DOCS + 1))
+    return {d["_id"]: d for d in docs} if len(docs) <= REFCACHE_MAX_DOCS else None
+
+
+doctors = Snapshot("doctors", _load_doctors)
+facilities = Snapshot("facilities", _load_facilities)
+
+
+def changed(db, name):
+    """À appeler après une écriture : version en base + invalidation locale."""
+    versions.bump(db, name)
+    {"doctors": doctors, "facilities": facilities}[name].invalidate()
+
+
+# -------------------------------
+# Enrichissement des noms (autres blueprints)
+# -------------------------------
+def facility_name(db):
+    """Fonction oid -> nom d'établissement (None si cache indisponible)."""
+    snap = facilities.get(db)
+    if snap is None:
+        return None
+    return lambda oid: (snap.get(oid) or {}).get("name")
@@ -4,50 +4,102 @@
 #  Description :
 #    Ce module gère les opérations CRUD principales liées
 #    aux rendez-vous (appointments) entre patients et médecins.
+#    Créneaux [date_time, end_at) réservés atomiquement : 409 si le
+#    médecin est déjà pris (cf. scheduling.py).
 # ===========================================================
 
 from flask import Blueprint, request, current_app
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from bson import ObjectId
-from utils import strip_none, iso_to_dt, validate_objectid, check_exists
+from utils import strip_none, iso_to_dt, validate_objectid, check_exists, missing_refs, json_body
+from pagination import Page
+from softdelete import live, mark_deleted
+import conditional
+import bulk
+import names
+import scheduling
 
 bp = Blueprint("appointments", __name__)
 _ALLOWED_STATUS = {"scheduled", "checked_in", "cancelled", "no_show", "completed"}
 
 
+# -----------------------------------------------------------
+# Préparation d’un rendez-vous (création unitaire et /bulk)
+# -----------------------------------------------------------
+def _duration(v):
+    """duration_minutes -> timedelta. ValueError si invalide."""
+    if not isinstance(v, int) or isinstance(v, bool) or not 0 < v <= scheduling.MAX_DURATION_MINUTES:
+        raise ValueError(f"duration_minutes doit être un entier entre 1 et {scheduling.MAX_DURATION_MINUTES}")
+    return timedelta(minutes=v)
+
+
+def _prepare(b):
+    """Valide et normalise le corps -> (document, références à vérifier). ValueError si invalide."""
+    pid = validate_objectid(b.get("patient_id"), "patient_id")
+    did = validate_objectid(b.get("doctor_id"), "doctor_id")
+    dt = iso_to_dt(b.get("date_time"))
+    if not dt:
+        raise ValueError("date_time requis et doit être au format ISO 8601")
+
+    fid = validate_objectid(b.get("facility_id")) if b.get("facility_id") else ObjectId()
+    status = b.get("status", "scheduled")
+    if status not in _ALLOWED_STATUS:
+        raise ValueError("status invalide")
+
+    # fin : durée demandée, sinon durée de créneau du médecin (scheduling.book)
+    end = dt + _duration(b["duration_minutes"]) if b.get("duration_minutes") is not None else None
+
+    now = datetime.now(timezone.utc)
+    doc = strip_none({
+        "patient_id": pid, "doctor_id": did, "facility_id": fid,
+        "date_time": dt, "end_at": end, "status": status,
+        "reason": b.get("reason"), "notes": b.get("notes"),
+        "created_at": now, "updated_at": now, "deleted": False,
+    })
+    refs = [("patients", pid, "Patient introuvable"), ("doctors", did, "Médecin introuvable")]
+    return doc, refs
+
+
 # -----------------------------------------------------------
 # Route POST /api/appointments — création d’un rendez-vous
 # -----------------------------------------------------------
 @bp.post("")
 def create():
-    b = request.get_json(force=True) or {}
     try:
-        pid = validate_objectid(b.get("patient_id"), "patient_id")
-        did = validate_objectid(b.get("doctor_id"), "doctor_id")
-        dt = iso_to_dt(b.get("date_time"))
-        if not dt:
-            return {"error": "date_time requis et doit être au format ISO 8601"}, 400
+        doc, refs = _prepare(json_body() or {})
+    except ValueError as e:
+        return {"error": str(e)}, 400
 
-        check_exists("patients", pid, "Patient")
-        check_exists("doctors", did, "Médecin")
+    missing = missing_refs(*refs)
+    if missing:
+        return {"error": missing[0]}, 400
 
-        fid = validate_objectid(b.get("facility_id")) if b.get("facility_id") else ObjectId()
-        status = b.get("status", "scheduled")
-        if status not in _ALLOWED_STATUS:
-            return {"error": f"status invalide"}, 400
+    db = current_app.db
+    refused = scheduling.book(db, doc)
+    if refused:
+        return scheduling.response(refused)
 
-    except (ValueError, FileNotFoundError) as e:
-        return {"error": str(e)}, 400
+    names.fill(db, [doc])
+    try:
+        ins = db.appointments.insert_one(doc)
+    except Exception:
+        scheduling.release(db, [doc["_id"]])
+        raise
+    return {"_id": ins.inserted_id}, 201
 
-    doc = strip_none({
-        "patient_id": pid, "doctor_id": did, "facility_id": fid,
-        "date_time": dt, "status": status,
-        "reason": b.get("reason"), "notes": b.get("notes"),
-        "created_at": datetime.utcnow(), "updated_at": datetime.utcnow(),
-    })
 
-    ins = current_app.db.appointments.insert_one(doc)
-    return {"_id": ins.inserted_id}, 201
+# -----------------------------------------------------------
+# Route POST /api/appointments/bulk — création en masse (tableau ou NDJSON)
+# -----------------------------------------------------------
+@bp.post("/bulk")
+def create_bulk():
+    db = current_app.db
+    return bulk.create_many(
+        db.appointments, _prepare, missing_status=400,
+        enrich=lambda docs: names.fill(db, docs),
+        reserve=lambda docs: scheduling.book_many(db, docs),
+        release=lambda docs: scheduling.release(db, [d["_id"] for d in docs]),
+    )
 
 
 # -----------------------------------------------------------
@@ -55,7 +107,7 @@ def create():
 # -----------------------------------------------------------
 @bp.get("")
 def list_():
-    q = {"deleted": {"$ne": True}}
+    q = live()
     try:
         if "doctor_id" in request.args: q["doctor_id"] = validate_objectid(request.args["doctor_id"])
         if "patient_id" in request.args: q["patient_id"] = validate_objectid(request.args["patient_id"])
@@ -67,22 +119,13 @@ def list_():
             q["date_time"] = {}
             if date_from: q["date_time"]["$gte"] = date_from
             if date_to: q["date_time"]["$lte"] = date_to
+
+        page = Page.from_request("date_time", 1)
     except ValueError as e:
         return {"error": str(e)}, 400
 
-    pipeline = [
-        {"$match": q},
-        {"$sort": {"date_time": 1}},
-        {"$limit": 200},
-        {"$lookup": {"from": "patients", "localField": "patient_id", "foreignField": "_id", "as": "p"}},
-        {"$addFields": {
-            "patient_name": {"$concat": [{"$arrayElemAt": ["$p.identite.prenom", 0]}, " ", {"$arrayElemAt": ["$p.identite.nom", 0]}]},
-            "patient_identifier": {"$ifNull": [{"$arrayElemAt": ["$p.identifiant", 0]}, ""]}
-        }},
-        {"$project": {"p": 0}}
-    ]
-    cur = current_app.db.appointments.aggregate(pipeline)
-    return list(cur), 200
+    # patient_name / patient_identifier copiés dans le document (cf. names.py) : pas de jointure
+    return page.response(page.find(current_app.db.appointments, q))
 
 
 # -----------------------------------------------------------
@@ -94,8 +137,7 @@ def get_one(id):
         oid = validate_objectid(id)
     except ValueError as e:
         return {"error": str(e)}, 400
-    doc = current_app.db.appointments.find_one({"_id": oid})
-    return (doc, 200) if doc else ({"error": "introuvable"}, 404)
+    return conditional.detail(current_app.db.appointments, oid, ({"error": "introuvable"}, 404))
 
 
 # -----------------------------------------------------------
@@ -105,11 +147,14 @@ def get_one(id):
 def update(id):
     try:
         oid = validate_objectid(id)
-        check_exists("appointments", oid, "Rendez-vous")
-    except (ValueError, FileNotFoundError) as e:
+    except ValueError as e:
         return {"error": str(e)}, 400
+    db = current_app.db
+    cur = db.appointments.find_one(live({"_id": oid}), scheduling.PROJECTION)
+    if cur is None:
+        return {"error": "Rendez-vous introuvable"}, 400
 
-    b = request.get_json(force=True) or {}
+    b = json_body() or {}
     update_doc = {}
 
     if "status" in b:
@@ -123,22 +168,52 @@ def update(id):
             return {"error": "date_time invalide"}, 400
         update_doc["date_time"] = dt
 
+    duration = None
+    if "duration_minutes" in b:
+        try:
+            duration = _duration(b["duration_minutes"])
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
     if "reason" in b: update_doc["reason"] = b["reason"]
     if "notes" in b: update_doc["notes"] = b["notes"]
 
-    if not update_doc:
+    if not update_doc and duration is None:
         return {"error": "Aucun champ à mettre à jour"}, 400
 
-    update_doc["updated_at"] = datetime.utcnow()
+    # nouveau créneau réservé avant la mise à jour, l'ancien rendu après (cf. scheduling.py)
+    refused, keep = scheduling.reschedule(db, cur, update_doc, duration)
+    if refused:
+        return scheduling.response(refused)
+
+    update_doc["updated_at"] = datetime.now(timezone.utc)
 
-    res = current_app.db.appointments.find_one_and_update(
+    res = db.appointments.find_one_and_update(
         {"_id": oid},
         {"$set": update_doc},
         return_document=True
     )
+    if keep is not None:
+        scheduling.release(db, [oid], keep=keep)
     return res, 200
 
 
+# -----------------------------------------------------------
+# Route POST /api/appointments/bulk/status — transition en masse (check-in du jour…)
+# -----------------------------------------------------------
+@bp.post("/bulk/status")
+def update_status_bulk():
+    db = current_app.db
+    # sortie de "cancelled" : créneau à revérifier, PATCH unitaire seulement
+    body, status = bulk.transition_many(
+        db.appointments, _ALLOWED_STATUS,
+        guard=lambda target: None if target == "cancelled" else {"status": {"$ne": "cancelled"}},
+    )
+    if body.get("status") == "cancelled" and body.get("changed"):
+        scheduling.release(db, body["changed"])
+    return body, status
+
+
 # -----------------------------------------------------------
 # Route DELETE /api/appointments/<id> — suppression (soft)
 # -----------------------------------------------------------
@@ -150,8 +225,6 @@ def delete(id):
     except (ValueError, FileNotFoundError) as e:
         return {"error": str(e)}, 400
 
-    current_app.db.appointments.update_one(
-        {"_id": oid},
-        {"$set": {"deleted": True, "updated_at": datetime.utcnow()}}
-    )
+    mark_deleted(current_app.db.appointments, oid, datetime.now(timezone.utc))
+    scheduling.release(current_app.db, [oid])
     return "", 204
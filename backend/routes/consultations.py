@@ -12,37 +12,33 @@
 # ===========================================================
 
 from flask import Blueprint, request, current_app
-from datetime import datetime
+from datetime import datetime, timezone
 from bson import ObjectId
-from utils import strip_none, iso_to_dt, validate_objectid, check_exists
+from utils import strip_none, iso_to_dt, validate_objectid, check_exists, missing_refs, json_body
+from pagination import Page
+from softdelete import live, mark_deleted
+import conditional
+import bulk
+import names
 
 bp = Blueprint("consultations", __name__)
 
 
 # -----------------------------------------------------------
-# POST /api/consultations — créer une consultation
+# Préparation d’une consultation (création unitaire et /bulk)
 # -----------------------------------------------------------
-@bp.post("")
-def create():
-    b = request.get_json(force=True) or {}
-    try:
-        pid = validate_objectid(b.get("patient_id"), "patient_id")
-        did = validate_objectid(b.get("doctor_id"), "doctor_id")
-        dt = iso_to_dt(b.get("date_time"))
-        if not dt:
-            return {"error": "date_time requis et doit être au format ISO 8601"}, 400
-
-        check_exists("patients", pid, "Patient")
-        check_exists("doctors", did, "Médecin")
-
-        fid = validate_objectid(b.get("facility_id")) if b.get("facility_id") else ObjectId()
-        ap_id = validate_objectid(b.get("appointment_id")) if b.get("appointment_id") else None
-        if ap_id:
-            check_exists("appointments", ap_id, "Rendez-vous")
-
-    except (ValueError, FileNotFoundError) as e:
-        return {"error": str(e)}, 400
-
+def _prepare(b):
+    """Valide et normalise le corps -> (document, références à vérifier). ValueError si invalide."""
+    pid = validate_objectid(b.get("patient_id"), "patient_id")
+    did = validate_objectid(b.get("doctor_id"), "doctor_id")
+    dt = iso_to_dt(b.get("date_time"))
+    if not dt:
+        raise ValueError("date_time requis et doit être au format ISO 8601")
+
+    fid = validate_objectid(b.get("facility_id")) if b.get("facility_id") else ObjectId()
+    ap_id = validate_objectid(b.get("appointment_id")) if b.get("appointment_id") else None
+
+    now = datetime.now(timezone.utc)
     doc = strip_none({
         "patient_id": pid,
         "doctor_id": did,
@@ -54,19 +50,51 @@ def create():
         "notes": b.get("notes"),
         "vital_signs": b.get("vital_signs"),
         "attachments": b.get("attachments"),
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow(),
+        "created_at": now,
+        "updated_at": now,
+        "deleted": False,
     })
+    refs = [
+        ("patients", pid, "Patient introuvable"),
+        ("doctors", did, "Médecin introuvable"),
+        ("appointments", ap_id, "Rendez-vous introuvable"),
+    ]
+    return doc, refs
+
+
+# -----------------------------------------------------------
+# POST /api/consultations — créer une consultation
+# -----------------------------------------------------------
+@bp.post("")
+def create():
+    try:
+        doc, refs = _prepare(json_body() or {})
+    except ValueError as e:
+        return {"error": str(e)}, 400
 
+    missing = missing_refs(*refs)
+    if missing:
+        return {"error": missing[0]}, 400
+
+    names.fill(current_app.db, [doc])
     ins = current_app.db.consultations.insert_one(doc)
     return {"_id": ins.inserted_id}, 201
 
+
+# -----------------------------------------------------------
+# POST /api/consultations/bulk — création en masse (tableau ou NDJSON)
+# -----------------------------------------------------------
+@bp.post("/bulk")
+def create_bulk():
+    db = current_app.db
+    return bulk.create_many(db.consultations, _prepare, missing_status=400, enrich=lambda docs: names.fill(db, docs))
+
 # -----------------------------------------------------------
 # GET /api/consultations — liste (filtres : patient/doctor/facility + période)
 # -----------------------------------------------------------
 @bp.get("")
 def list_():
-    q = {"deleted": {"$ne": True}}
+    q = live()
     try:
         if "patient_id" in request.args: q["patient_id"] = validate_objectid(request.args["patient_id"])
         if "doctor_id" in request.args: q["doctor_id"] = validate_objectid(request.args["doctor_id"])
@@ -81,20 +109,13 @@ def list_():
         if date_from: q["date_time"]["$gte"] = date_from
         if date_to: q["date_time"]["$lte"] = date_to
 
-    pipeline = [
-        {"$match": q},
-        {"$sort": {"date_time": -1}},
-        {"$limit": 200},
-        {"$lookup": {"from": "patients", "localField": "patient_id", "foreignField": "_id", "as": "p"}},
-        {"$lookup": {"from": "doctors", "localField": "doctor_id", "foreignField": "_id", "as": "d"}},
-        {"$addFields": {
-            "patient_name": {"$concat": [{"$arrayElemAt": ["$p.identite.prenom", 0]}, " ", {"$arrayElemAt": ["$p.identite.nom", 0]}]},
-            "doctor_name": {"$concat": [{"$arrayElemAt": ["$d.identite.prenom", 0]}, " ", {"$arrayElemAt": ["$d.identite.nom", 0]}]},
-        }},
-        {"$project": {"p": 0, "d": 0}}
-    ]
-    cur = current_app.db.consultations.aggregate(pipeline)
-    return list(cur)
+    try:
+        page = Page.from_request("date_time", -1)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    # patient_name / doctor_name copiés dans le document (cf. names.py) : pas de jointure
+    return page.response(page.find(current_app.db.consultations, q))
 
 # -----------------------------------------------------------
 # GET /api/consultations/<id> — détail d'une consultation
@@ -105,8 +126,7 @@ def get_one(id):
         oid = validate_objectid(id)
     except ValueError as e:
         return {"error": str(e)}, 400
-    d = current_app.db.consultations.find_one({"_id": oid})
-    return (d, 200) if d else ({"error": "introuvable"}, 404)
+    return conditional.detail(current_app.db.consultations, oid, ({"error": "introuvable"}, 404))
 
 
 # -----------------------------------------------------------
@@ -120,7 +140,7 @@ def update(id):
     except (ValueError, FileNotFoundError) as e:
         return {"error": str(e)}, 400
 
-    b = request.get_json(force=True) or {}
+    b = json_body() or {}
     update_doc = {}
     
     for f in ("symptomes", "diagnostic", "notes", "vital_signs", "attachments"):
@@ -136,7 +156,7 @@ def update(id):
     if not update_doc:
         return {"error": "Aucun champ à mettre à jour"}, 400
 
-    update_doc["updated_at"] = datetime.utcnow()
+    update_doc["updated_at"] = datetime.now(timezone.utc)
 
     res = current_app.db.consultations.find_one_and_update(
         {"_id": oid},
@@ -157,8 +177,5 @@ def delete(id):
     except (ValueError, FileNotFoundError) as e:
         return {"error": str(e)}, 400
 
-    current_app.db.consultations.update_one(
-        {"_id": oid},
-        {"$set": {"deleted": True, "updated_at": datetime.utcnow()}}
-    )
+    mark_deleted(current_app.db.consultations, oid, datetime.now(timezone.utc))
     return "", 204
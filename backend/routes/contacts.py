@@ -11,8 +11,9 @@
 #    - Affiche le message dans les logs serveur (utile pour débogage frontend)
 # ===========================================================
 
-from flask import Blueprint, request
-from datetime import datetime
+from flask import Blueprint
+from datetime import datetime, timezone
+from utils import json_body
 
 bp = Blueprint("contacts", __name__)
 
@@ -33,13 +34,13 @@ def create():
     Vérifie que tous les champs sont présents et non vides.
     Log le contenu avec la date UTC, puis renvoie {"ok": True}.
     """
-    b = request.get_json(force=True) or {}
+    b = json_body() or {}
 
     for f in ("name", "email", "message"):
         if not b.get(f):
             return {"error": f"{f} requis"}, 400
 
-    print("[CONTACT]", datetime.utcnow().isoformat(), b)
+    print("[CONTACT]", datetime.now(timezone.utc).isoformat(), b)
 
     return {"ok": True}, 200
 
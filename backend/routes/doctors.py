@@ -6,20 +6,32 @@
 #    POST /api/doctors        -> créer un médecin
 #    GET  /api/doctors        -> lister (filtres)
 #    GET  /api/doctors/<id>   -> détail
+#    GET  /api/doctors/<id>/availability?from=&to= -> créneaux libres
 #
 #  Points clés :
 #    - Validation stricte de identite.prenom / nom et specialites
 #    - facility_id généré si absent (cohérent avec les autres modèles)
 #    - Nettoyage et normalisation des chaînes (trim, non vide)
 #    - Timestamps en UTC
+#    - Horaires facultatifs (`schedule`, cf. scheduling.py)
+#    - Liste servie depuis l'instantané en mémoire du worker (cf. refcache.py) ;
+#      création / PATCH / DELETE incrémentent la version "doctors"
 # ===========================================================
 
+from functools import partial
 from flask import Blueprint, request, current_app, jsonify
 from bson import ObjectId
 from bson.errors import InvalidId
 from pymongo.errors import WriteError
-from datetime import datetime, timezone
-from utils import strip_none, iso_to_dt, validate_objectid
+from pymongo import ReturnDocument
+from datetime import datetime, timedelta, timezone
+from utils import strip_none, iso_to_dt, validate_objectid, check_exists, json_body
+from pagination import Page
+from softdelete import live, mark_deleted
+import conditional
+import names
+import refcache
+import scheduling
 
 bp = Blueprint("doctors", __name__)
 
@@ -27,17 +39,37 @@ bp = Blueprint("doctors", __name__)
 # -------------------------------
 # Validation d'entrée
 # -------------------------------
+_NORMALIZE = {"prenom": lambda v: v.strip().capitalize(), "nom": lambda v: v.strip().upper()}
+
+
+def _identite(ident, partial=False) -> dict:
+    """
+    Valide et normalise identite.prenom / nom (prénom capitalisé, NOM en majuscules).
+    partial : PATCH, seuls les champs présents. -> {champ: valeur}. ValueError si invalide.
+    """
+    if not isinstance(ident, dict):
+        raise ValueError("identite doit être un objet")
+    out = {}
+    for f, norm in _NORMALIZE.items():
+        if f not in ident:
+            if partial:
+                continue
+            raise ValueError(f"identite.{f} requis")
+        if not isinstance(ident[f], str) or not ident[f].strip():
+            raise ValueError(f"identite.{f} doit être une chaîne non vide")
+        out[f] = norm(ident[f])
+    return out
+
+
 def _validate_create(b: dict):
     """Valide les champs requis à la création d’un médecin."""
     if "identite" not in b:
         return "identite requis"
 
-    ident = b["identite"]
-    for f in ("prenom", "nom"):
-        if f not in ident:
-            return f"identite.{f} requis"
-        if not isinstance(ident[f], str) or not ident[f].strip():
-            return f"identite.{f} doit être une chaîne non vide"
+    try:
+        b["identite"].update(_identite(b["identite"]))
+    except ValueError as e:
+        return str(e)
 
     sp = b.get("specialites")
     if not isinstance(sp, list) or len(sp) == 0:
@@ -45,14 +77,25 @@ def _validate_create(b: dict):
     if not all(isinstance(x, str) and x.strip() for x in sp):
         return "specialites doit contenir des chaînes non vides"
 
+    if "schedule" in b:
+        try:
+            b["schedule"] = scheduling.validate_schedule(b["schedule"])
+        except ValueError as e:
+            return str(e)
+
     return None
 
 # -------------------------------
 # GET /api/doctors — liste
 # -------------------------------
+def _with_facility(facility_name, d):
+    name = facility_name(d.get("facility_id"))
+    return {**d, "facility_name": name} if name else d
+
+
 @bp.get("")
 def list_():
-    q = {"deleted": {"$ne": True}}
+    q = live()
 
     # Filtre par spécialité (ex: ?specialite=Cardiologue)
     spec = request.args.get("specialite")
@@ -66,19 +109,23 @@ def list_():
         except InvalidId:
             return jsonify(error="facility_id invalide"), 400
 
-    cur = current_app.db.doctors.find(
-        q, {"identite": 1, "specialites": 1, "facility_id": 1}
-    ).sort("created_at", -1).limit(200)
+    try:
+        page = Page.from_request("created_at", -1)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
 
-    return jsonify([
-        {
-            "_id": str(d["_id"]),
-            "identite": d.get("identite", {}),
-            "specialites": d.get("specialites", []),
-            "facility_id": str(d["facility_id"]) if d.get("facility_id") else None
-        }
-        for d in cur
-    ]), 200
+    db = current_app.db
+    facility_name = refcache.facility_name(db)
+    with_facility = partial(_with_facility, facility_name) if facility_name is not None else None
+
+    # instantané du worker (même tri, même curseur que la requête Mongo)
+    snap = refcache.doctors.get(db)
+    if snap is not None:
+        items = snap.list(page, specialite=q.get("specialites"), facility_id=q.get("facility_id"))
+        return page.response_items(items, transform=with_facility)
+
+    cur = page.find(db.doctors, q, refcache.DOCTOR_FIELDS)
+    return page.response(cur, transform=with_facility)
 
 # -------------------------------
 # GET /api/doctors/<id> — détail
@@ -90,23 +137,47 @@ def get_one(id):
     except InvalidId:
         return jsonify(error="id invalide"), 400
 
-    d = current_app.db.doctors.find_one({"_id": oid})
-    if not d:
-        return jsonify(error="introuvable"), 404
+    return conditional.detail(current_app.db.doctors, oid, (jsonify(error="introuvable"), 404))
 
-    # Conversion JSON-safe
-    d["_id"] = str(d["_id"])
-    if "facility_id" in d and isinstance(d["facility_id"], ObjectId):
-        d["facility_id"] = str(d["facility_id"])
+# -------------------------------
+# GET /api/doctors/<id>/availability — créneaux libres
+# -------------------------------
+@bp.get("/<id>/availability")
+def availability(id):
+    try:
+        oid = ObjectId(id)
+    except InvalidId:
+        return jsonify(error="id invalide"), 400
 
-    return jsonify(d), 200
+    try:
+        start = iso_to_dt(request.args.get("from"), "from") or datetime.now(timezone.utc)
+        end = iso_to_dt(request.args.get("to"), "to") or start + timedelta(days=scheduling.AVAILABILITY_DEFAULT_DAYS)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    if not start < end <= start + timedelta(days=scheduling.AVAILABILITY_MAX_DAYS):
+        return jsonify(error=f"période invalide (to > from, {scheduling.AVAILABILITY_MAX_DAYS} jours au plus)"), 400
+
+    db = current_app.db
+    doc = db.doctors.find_one(live({"_id": oid}), {"schedule": 1})
+    if doc is None:
+        return jsonify(error="introuvable"), 404
+
+    sched = scheduling.Schedule(doc)
+    return {
+        "doctor_id": oid,
+        "timezone": sched.tz.key,
+        "slot_minutes": sched.slot // timedelta(minutes=1),
+        "from": start,
+        "to": end,
+        "slots": scheduling.availability(db, oid, sched, start, end),
+    }, 200
 
 # -------------------------------
 # POST /api/doctors — création
 # -------------------------------
 @bp.post("")
 def create():
-    b = request.get_json(force=True) or {}
+    b = json_body() or {}
 
     # Validation fonctionnelle
     err = _validate_create(b)
@@ -122,13 +193,11 @@ def create():
     else:
         b["facility_id"] = ObjectId()
 
-    # Normalisation des chaînes
-    b["identite"]["prenom"] = b["identite"]["prenom"].strip().capitalize()
-    b["identite"]["nom"] = b["identite"]["nom"].strip().upper()
+    # Normalisation des chaînes (identite : cf. _identite)
     b["specialites"] = [s.strip() for s in b["specialites"]]
 
     # Timestamps UTC
-    now = datetime.utcnow().replace(tzinfo=timezone.utc)
+    now = datetime.now(timezone.utc)
     b["created_at"] = now
     b["updated_at"] = now
     b["deleted"] = False
@@ -142,6 +211,7 @@ def create():
     except WriteError as we:
         details = getattr(we, "details", {}) or {}
         return jsonify(error="validation_mongo", details=details), 400
+    refcache.changed(current_app.db, "doctors")
 
     return jsonify(_id=str(ins.inserted_id)), 201
 
@@ -157,13 +227,27 @@ def update(id):
     except (ValueError, FileNotFoundError) as e:
         return {"error": str(e)}, 400
 
-    b = request.get_json(force=True) or {}
+    b = json_body() or {}
     update_doc = {}
     
     if "specialites" in b: update_doc["specialites"] = b["specialites"]
     if "licence" in b: update_doc["licence"] = b["licence"]
+    if "schedule" in b:
+        try:
+            update_doc["schedule"] = scheduling.validate_schedule(b["schedule"])
+        except ValueError as e:
+            return {"error": str(e)}, 400
     if "facility_id" in b: update_doc["facility_id"] = validate_objectid(b["facility_id"])
 
+    if "identite" in b:
+        # même validation / normalisation qu'à la création : ces valeurs sont copiées (names.py)
+        try:
+            update_doc.update({f"identite.{f}": v for f, v in _identite(b["identite"], partial=True).items()})
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        if "sexe" in b["identite"]:
+            update_doc["identite.sexe"] = b["identite"]["sexe"]
+
     if not update_doc:
         return {"error": "Aucun champ à mettre à jour"}, 400
 
@@ -174,6 +258,11 @@ def update(id):
         {"$set": update_doc},
         return_document=ReturnDocument.AFTER
     )
+    refcache.changed(current_app.db, "doctors")
+
+    # nom copié dans les rendez-vous / consultations (cf. names.py), après la réponse
+    if res and any(k in names.DOCTOR_SOURCE_FIELDS for k in update_doc):
+        names.propagate_later("doctor", res, update_doc["updated_at"])
     return res, 200
 
 
@@ -188,8 +277,6 @@ def delete(id):
     except (ValueError, FileNotFoundError) as e:
         return {"error": str(e)}, 400
 
-    current_app.db.doctors.update_one(
-        {"_id": oid},
-        {"$set": {"deleted": True, "updated_at": datetime.now(timezone.utc)}}
-    )
+    mark_deleted(current_app.db.doctors, oid, datetime.now(timezone.utc))
+    refcache.changed(current_app.db, "doctors")
     return "", 204
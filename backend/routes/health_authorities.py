@@ -9,7 +9,7 @@
 #
 #  Points clés :
 #    - Validation stricte (report_type, period_start/end, status…)
-#    - Conversion ISO8601 → datetime aware (UTC)
+#    - Conversion ISO8601 → datetime aware (UTC) ; sérialisation par le provider JSON de l'app
 #    - Nettoyage des None pour respecter $jsonSchema
 #    - Même style que le reste de l’API (appointments, consultations…)
 # ===========================================================
@@ -19,7 +19,10 @@ from bson import ObjectId
 from bson.errors import InvalidId
 from pymongo.errors import WriteError
 from datetime import datetime, timezone
-from utils import strip_none, iso_to_dt, validate_objectid, check_exists
+from utils import strip_none, iso_to_dt, validate_objectid, check_exists, json_body
+from pagination import Page
+from softdelete import live
+import conditional
 
 
 bp = Blueprint("health_authorities", __name__)
@@ -30,19 +33,6 @@ ALLOWED_STATUS = {"draft", "submitted", "accepted", "rejected"}
 # -------------------------------
 # Helpers
 # -------------------------------
-def _jsonify(doc):
-    """Cast ObjectId/datetime -> types JSON-safe + normalise datetime en UTC (suffixe Z)."""
-    if not doc:
-        return doc
-    d = dict(doc)
-    for k, v in list(d.items()):
-        if isinstance(v, ObjectId):
-            d[k] = str(v)
-        elif isinstance(v, datetime):
-            v = v if v.tzinfo else v.replace(tzinfo=timezone.utc)
-            d[k] = v.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
-    return d
-
 def _validate(b: dict):
     """Contrôles fonctionnels d’entrée."""
     for f in ("report_type", "period_start", "period_end", "status", "facility_id"):
@@ -62,7 +52,7 @@ def _validate(b: dict):
 # -------------------------------
 @bp.post("")
 def create():
-    b = request.get_json(silent=True) or {}
+    b = json_body(silent=True) or {}
 
     # Validation fonctionnelle
     err = _validate(b)
@@ -93,7 +83,7 @@ def create():
         except ValueError as e:
             return jsonify(error=str(e)), 400
 
-    now = datetime.utcnow().replace(tzinfo=timezone.utc)
+    now = datetime.now(timezone.utc)
 
     # Document propre pour Mongo
     doc = strip_none({
@@ -125,7 +115,7 @@ def create():
 # -------------------------------
 @bp.get("")
 def list_():
-    q = {"deleted": {"$ne": True}}
+    q = live()
 
     # Filtres simples (id + enums)
     if "facility_id" in request.args:
@@ -146,8 +136,13 @@ def list_():
             return jsonify(error=f"status invalide ({'|'.join(sorted(ALLOWED_STATUS))})"), 400
         q["status"] = st
 
-    cur = current_app.db.health_authorities.find(q).sort("created_at", -1).limit(200)
-    return jsonify([_jsonify(d) for d in cur]), 200
+    try:
+        page = Page.from_request("created_at", -1)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    cur = page.find(current_app.db.health_authorities, q)
+    return page.response(cur)
 
 # -------------------------------
 # GET /api/health_authorities/<id> — détail
@@ -158,5 +153,4 @@ def get_one(id):
         oid = ObjectId(id)
     except InvalidId:
         return jsonify(error="id invalide"), 400
-    d = current_app.db.health_authorities.find_one({"_id": oid})
-    return (jsonify(_jsonify(d)), 200) if d else (jsonify(error="introuvable"), 404)
+    return conditional.detail(current_app.db.health_authorities, oid, (jsonify(error="introuvable"), 404))
@@ -16,7 +16,11 @@ from bson import ObjectId
 from bson.errors import InvalidId
 from pymongo.errors import WriteError
 from datetime import datetime, timezone
-from utils import strip_none, iso_to_dt, validate_objectid, check_exists
+from utils import strip_none, iso_to_dt, validate_objectid, check_exists, missing_refs, json_body
+from pagination import Page
+from softdelete import live, mark_deleted
+import conditional
+import bulk
 
 bp = Blueprint("laboratories", __name__)
 
@@ -72,37 +76,28 @@ def _validate(b):
 
 
 # -----------------------------------------------------------
-# POST /api/laboratories — création d’une analyse
+# Préparation d’une analyse (création unitaire et /bulk)
 # -----------------------------------------------------------
-@bp.post("")
-def create():
-    b = request.get_json(force=True) or {}
-
+def _prepare(b):
+    """Valide et normalise le corps -> (document, références à vérifier). ValueError si invalide."""
     # validation complète
     err = _validate(b)
     if err:
-        return {"error": err}, 400
+        raise ValueError(err)
 
-    db = current_app.db
-
-    # conversion ObjectId et existence patient/médecin
+    # conversion ObjectId patient/médecin
     try:
         pid = ObjectId(b["patient_id"])
         did = ObjectId(b["doctor_id"])
-    except InvalidId:
-        return {"error": "patient_id/doctor_id doivent être des ObjectId"}, 400
-
-    if not db.patients.find_one({"_id": pid}):
-        return {"error": "patient introuvable"}, 404
-    if not db.doctors.find_one({"_id": did}):
-        return {"error": "médecin introuvable"}, 404
+    except (InvalidId, TypeError):
+        raise ValueError("patient_id/doctor_id doivent être des ObjectId")
 
     # facility_id (généré si absent)
     if b.get("facility_id"):
         try:
             fid = ObjectId(b["facility_id"])
-        except InvalidId:
-            return {"error": "facility_id doit être un ObjectId"}, 400
+        except (InvalidId, TypeError):
+            raise ValueError("facility_id doit être un ObjectId")
     else:
         fid = ObjectId()
 
@@ -111,10 +106,8 @@ def create():
     if b.get("appointment_id"):
         try:
             ap_id = ObjectId(b["appointment_id"])
-        except InvalidId:
-            return {"error": "appointment_id doit être un ObjectId"}, 400
-        if not db.appointments.find_one({"_id": ap_id}):
-            return {"error": "appointment introuvable"}, 404
+        except (InvalidId, TypeError):
+            raise ValueError("appointment_id doit être un ObjectId")
 
     # Normalisation des tests
     tests = []
@@ -127,14 +120,14 @@ def create():
         for k in ("result", "unit", "ref_range", "abnormal"):
             if t.get(k) is not None:
                 nt[k] = t[k]
-        tests.append(_strip_none(nt))
+        tests.append(strip_none(nt))
 
     # dates automatiques
-    now = datetime.utcnow().replace(tzinfo=timezone.utc)
+    now = datetime.now(timezone.utc)
     date_reported = now if b.get("status") == "completed" else None
 
     # constitution du document Mongo
-    doc = _strip_none({
+    doc = strip_none({
         "patient_id": pid,
         "doctor_id": did,
         "facility_id": fid,
@@ -148,10 +141,32 @@ def create():
         "updated_at": now,
         "deleted": False,
     })
+    refs = [
+        ("patients", pid, "patient introuvable"),
+        ("doctors", did, "médecin introuvable"),
+        ("appointments", ap_id, "appointment introuvable"),
+    ]
+    return doc, refs
+
+
+# -----------------------------------------------------------
+# POST /api/laboratories — création d’une analyse
+# -----------------------------------------------------------
+@bp.post("")
+def create():
+    try:
+        doc, refs = _prepare(json_body() or {})
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    # existence des références (un seul aller-retour)
+    missing = missing_refs(*refs)
+    if missing:
+        return {"error": missing[0]}, 404
 
     # insertion en base
     try:
-        ins = db.laboratories.insert_one(doc)
+        ins = current_app.db.laboratories.insert_one(doc)
     except WriteError as we:
         details = getattr(we, "details", {}) or {}
         return {"error": "validation_mongo", "details": details}, 400
@@ -159,12 +174,20 @@ def create():
     return {"_id": str(ins.inserted_id)}, 201
 
 
+# -----------------------------------------------------------
+# POST /api/laboratories/bulk — création en masse (analyseurs, tableau ou NDJSON)
+# -----------------------------------------------------------
+@bp.post("/bulk")
+def create_bulk():
+    return bulk.create_many(current_app.db.laboratories, _prepare)
+
+
 # -----------------------------------------------------------
 # GET /api/laboratories — liste filtrable
 # -----------------------------------------------------------
 @bp.get("")
 def list_():
-    q = {"deleted": {"$ne": True}}
+    q = live()
 
     # Filtres simples par ID
     try:
@@ -209,8 +232,13 @@ def list_():
             rng["$lte"] = dt_
         q["date_ordered"] = rng
 
-    cur = current_app.db.laboratories.find(q).sort("date_ordered", -1).limit(200)
-    return [d for d in cur], 200
+    try:
+        page = Page.from_request("date_ordered", -1)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    cur = page.find(current_app.db.laboratories, q)
+    return page.response(cur)
 
 
 # -----------------------------------------------------------
@@ -222,8 +250,7 @@ def get_one(id):
         oid = ObjectId(id)
     except InvalidId:
         return {"error": "id invalide"}, 400
-    d = current_app.db.laboratories.find_one({"_id": oid})
-    return (d, 200) if d else ({"error": "introuvable"}, 404)
+    return conditional.detail(current_app.db.laboratories, oid, ({"error": "introuvable"}, 404))
 
 
 # -----------------------------------------------------------
@@ -237,7 +264,7 @@ def update(id):
     except (ValueError, FileNotFoundError) as e:
         return {"error": str(e)}, 400
 
-    b = request.get_json(force=True) or {}
+    b = json_body() or {}
     update_doc = {}
 
     if "status" in b:
@@ -268,6 +295,15 @@ def update(id):
     return res, 200
 
 
+# -----------------------------------------------------------
+# POST /api/laboratories/bulk/status — transition en masse (completed -> date_reported)
+# -----------------------------------------------------------
+@bp.post("/bulk/status")
+def update_status_bulk():
+    return bulk.transition_many(current_app.db.laboratories, _ALLOWED_STATUS,
+                                stamps={"completed": "date_reported"})
+
+
 # -----------------------------------------------------------
 # DELETE /api/laboratories/<id> — suppression (soft)
 # -----------------------------------------------------------
@@ -279,9 +315,6 @@ def delete(id):
     except (ValueError, FileNotFoundError) as e:
         return {"error": str(e)}, 400
 
-    current_app.db.laboratories.update_one(
-        {"_id": oid},
-        {"$set": {"deleted": True, "updated_at": datetime.now(timezone.utc)}}
-    )
+    mark_deleted(current_app.db.laboratories, oid, datetime.now(timezone.utc))
     return "", 204
 
@@ -4,6 +4,7 @@
 #
 #  Endpoints:
 #    POST   /api/notifications        -> créer une notification
+#    POST   /api/notifications/bulk   -> créer un lot (tableau JSON ou NDJSON)
 #    GET    /api/notifications        -> lister (filtres)
 #    GET    /api/notifications/<id>   -> détail
 #
@@ -20,7 +21,11 @@ from bson import ObjectId
 from bson.errors import InvalidId
 from pymongo.errors import WriteError
 from datetime import datetime, timezone
-from utils import strip_none, iso_to_dt, validate_objectid, check_exists
+from utils import strip_none, iso_to_dt, validate_objectid, check_exists, missing_refs, json_body
+from pagination import Page
+from softdelete import live
+import conditional
+import bulk
 
 
 bp = Blueprint("notifications", __name__)
@@ -69,66 +74,50 @@ def _validate(b: dict):
     return None
 
 # -------------------------------
-# POST /api/notifications — création
+# Préparation d’une notification (création unitaire et /bulk)
 # -------------------------------
-@bp.post("")
-def create():
-    b = request.get_json(force=True) or {}
-
+_REF_COLL = {
+    "appointment": "appointments",
+    "consultation": "consultations",
+    "prescription": "prescriptions",
+    "payment": "payments",
+    "other": None,  # pas de vérif
+}
+
+def _prepare(b):
+    """Valide et normalise le corps -> (document, références à vérifier). ValueError si invalide."""
     #  Validation fonctionnelle
     err = _validate(b)
     if err:
-        return {"error": err}, 400
-
-    db = current_app.db
+        raise ValueError(err)
 
     #  Cast des ObjectId optionnels
     to_pid = _cast_oid(b.get("to_patient_id"))
     if b.get("to_patient_id") is not None and to_pid is None:
-        return {"error": "to_patient_id doit être un ObjectId"}, 400
+        raise ValueError("to_patient_id doit être un ObjectId")
 
     to_did = _cast_oid(b.get("to_doctor_id"))
     if b.get("to_doctor_id") is not None and to_did is None:
-        return {"error": "to_doctor_id doit être un ObjectId"}, 400
+        raise ValueError("to_doctor_id doit être un ObjectId")
 
     ref_id = _cast_oid(b.get("ref_id"))
     if b.get("ref_id") is not None and ref_id is None:
-        return {"error": "ref_id doit être un ObjectId"}, 400
-
-    #  Vérifications d’existence (optionnelles mais utiles)
-    if to_pid and not db.patients.find_one({"_id": to_pid}, {"_id": 1}):
-        return {"error": "to_patient_id introuvable"}, 404
-    if to_did and not db.doctors.find_one({"_id": to_did}, {"_id": 1}):
-        return {"error": "to_doctor_id introuvable"}, 404
-    if ref_id and b.get("ref_type"):
-        _ref_map = {
-            "appointment": "appointments",
-            "consultation": "consultations",
-            "prescription": "prescriptions",
-            "payment": "payments",
-            "other": None,  # pas de vérif
-        }
-        coll = _ref_map.get(b["ref_type"])
-        if coll and not db[coll].find_one({"_id": ref_id}, {"_id": 1}):
-            return {"error": f"ref_id introuvable pour ref_type={b['ref_type']}"}, 404
+        raise ValueError("ref_id doit être un ObjectId")
 
     #  Dates optionnelles
-    send_at    = iso_to_dt(b.get("send_at"))    if b.get("send_at")    else None
-    sent_at    = iso_to_dt(b.get("sent_at"))    if b.get("sent_at")    else None
-    expires_at = iso_to_dt(b.get("expires_at")) if b.get("expires_at") else None
-
-    if b.get("send_at") and not send_at:
-        return {"error": "send_at doit être ISO 8601"}, 400
-    if b.get("sent_at") and not sent_at:
-        return {"error": "sent_at doit être ISO 8601"}, 400
-    if b.get("expires_at") and not expires_at:
-        return {"error": "expires_at doit être ISO 8601"}, 400
+    dates = {}
+    for f in ("send_at", "sent_at", "expires_at"):
+        try:
+            dates[f] = iso_to_dt(b.get(f)) if b.get(f) else None
+        except ValueError:
+            raise ValueError(f"{f} doit être ISO 8601")
+    sent_at = dates["sent_at"]
 
     # Si status=sent sans sent_at -> on positionne à maintenant (UTC)
     if b.get("status") == "sent" and not sent_at:
-        sent_at = datetime.utcnow().replace(tzinfo=timezone.utc)
+        sent_at = datetime.now(timezone.utc)
 
-    now = datetime.utcnow().replace(tzinfo=timezone.utc)
+    now = datetime.now(timezone.utc)
 
     #  Construction du document Mongo (pense à l’index TTL sur expires_at)
     doc = strip_none({
@@ -140,29 +129,60 @@ def create():
         "ref_id":   ref_id,
         "to_patient_id": to_pid,
         "to_doctor_id":  to_did,
-        "send_at":    send_at,
+        "send_at":    dates["send_at"],
         "sent_at":    sent_at,
-        "expires_at": expires_at,             # TTL (défini dans ensure_indexes)
+        "expires_at": dates["expires_at"],    # TTL (défini dans ensure_indexes)
         "error": b.get("error"),
         "created_at": now,
         "updated_at": now,
         "deleted": False,
     })
 
+    #  Vérifications d’existence (optionnelles mais utiles)
+    ref_coll = _REF_COLL.get(b.get("ref_type"))
+    refs = [
+        ("patients", to_pid, "to_patient_id introuvable"),
+        ("doctors", to_did, "to_doctor_id introuvable"),
+        (ref_coll, ref_id if ref_coll else None, f"ref_id introuvable pour ref_type={b.get('ref_type')}"),
+    ]
+    return doc, refs
+
+# -------------------------------
+# POST /api/notifications — création
+# -------------------------------
+@bp.post("")
+def create():
+    try:
+        doc, refs = _prepare(json_body() or {})
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    # existence des références (un seul aller-retour)
+    missing = missing_refs(*refs)
+    if missing:
+        return {"error": missing[0]}, 404
+
     # Insertion
     try:
-        ins = db.notifications.insert_one(doc)
+        ins = current_app.db.notifications.insert_one(doc)
     except WriteError as we:
         return {"error": "validation_mongo", "details": getattr(we, "details", {}) or {}}, 400
 
     return {"_id": str(ins.inserted_id)}, 201
 
+# -------------------------------
+# POST /api/notifications/bulk — création en masse (campagnes, tableau ou NDJSON)
+# -------------------------------
+@bp.post("/bulk")
+def create_bulk():
+    return bulk.create_many(current_app.db.notifications, _prepare)
+
 # -------------------------------
 # GET /api/notifications — liste
 # -------------------------------
 @bp.get("")
 def list_():
-    q = {"deleted": {"$ne": True}}
+    q = live()
 
     # Filtres simples
     if "status" in request.args:
@@ -180,8 +200,13 @@ def list_():
                 return {"error": f"{arg} invalide"}, 400
             q[arg] = oid
 
-    cur = current_app.db.notifications.find(q).sort("created_at", -1).limit(200)
-    return [d for d in cur], 200
+    try:
+        page = Page.from_request("created_at", -1)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    cur = page.find(current_app.db.notifications, q)
+    return page.response(cur)
 
 # -------------------------------
 # GET /api/notifications/<id> — détail
@@ -191,5 +216,4 @@ def get_one(id):
     oid = _cast_oid(id)
     if oid is None:
         return {"error": "id invalide"}, 400
-    d = current_app.db.notifications.find_one({"_id": oid})
-    return (d, 200) if d else ({"error": "introuvable"}, 404)
+    return conditional.detail(current_app.db.notifications, oid, ({"error": "introuvable"}, 404))
@@ -5,14 +5,16 @@
 #  Endpoints:
 #    POST /api/patients       -> créer un patient
 #    GET  /api/patients       -> lister (projection légère)
+#    GET  /api/patients/search?q=  -> recherche (nom, prénom, identifiant, téléphone)
 #    GET  /api/patients/<id>  -> détail
 #
 #  Points clés :
 #    - Validation stricte de identite.{prenom, nom, date_naissance, sexe}
 #    - facility_id généré si absent (mock, cohérent avec le reste)
-#    - identifiant lisible auto: CHADH-PT-00001, 00002, ...
+#    - identifiant lisible auto: CHADH-PT-00001, 00002, ... (alloué par blocs, sans ordre global)
 #    - Normalisation : trim + format (Prénom Capitalisé, NOM MAJUSCULE, sexe M/F/X)
 #    - Dates en ISO -> datetime (timezone-safe)
+#    - search_keys recalculées à la création et au PATCH (cf. search_keys.py)
 # ===========================================================
 
 from flask import Blueprint, request, current_app
@@ -21,7 +23,13 @@ from bson.errors import InvalidId
 from pymongo.errors import WriteError
 from pymongo import ReturnDocument
 from datetime import datetime, timezone
-from utils import strip_none, iso_to_dt, validate_objectid, check_exists
+from utils import strip_none, iso_to_dt, validate_objectid, check_exists, json_body
+from pagination import Page
+from softdelete import live, mark_deleted
+import conditional
+import names
+from sequences import sequence
+import search_keys
 
 bp = Blueprint("patients", __name__)
 
@@ -29,23 +37,12 @@ _ALLOWED_SEX = {"M", "F", "X"}
 
 
 # -------------------------------
-# Séquence : CHADH-PT-00001, etc.
+# Séquence : CHADH-PT-00001, etc. (blocs réservés par worker, cf. sequences.py)
 # -------------------------------
-def _next_seq(db, name: str) -> int:
-    """
-    Utilise la collection 'counters' (document {_id: name, seq: N})
-    pour auto-incrémenter un compteur par clé 'name'.
-    """
-    doc = db.counters.find_one_and_update(
-        {"_id": name},
-        {"$inc": {"seq": 1}},
-        upsert=True,
-        return_document=ReturnDocument.AFTER,
-    )
-    return int(doc["seq"])
+_PATIENT_IDENT = sequence("patient_ident", fmt="CHADH-PT-{:05d}")
 
 def _gen_patient_ident(db) -> str:
-    return f"CHADH-PT-{_next_seq(db, 'patient_ident'):05d}"
+    return _PATIENT_IDENT.next_str(db)
 
 
 # -------------------------------
@@ -89,13 +86,47 @@ def list_():
     - identite (nom/prenom/date/sexe)
     - contacts.phone
     """
-    cur = current_app.db.patients.find(
-        {"deleted": {"$ne": True}},
-        {"identite": 1, "contacts.phone": 1, "identifiant": 1}
-    ).sort("created_at", -1).limit(200)
+    try:
+        page = Page.from_request("created_at", -1)
+    except ValueError as e:
+        return {"error": str(e)}, 400
 
-    
-    return [d for d in cur], 200
+    cur = page.find(
+        current_app.db.patients,
+        live(),
+        {"identite": 1, "contacts.phone": 1, "identifiant": 1, "created_at": 1}
+    )
+    return page.response(cur)
+
+# -------------------------------
+# GET /api/patients/search?q= — recherche par préfixe
+# -------------------------------
+_SEARCH_LIMIT_MAX = 50
+
+@bp.get("/search")
+def search():
+    """
+    Préfixes insensibles aux accents/casse sur nom, prénom, identifiant et téléphone.
+    Tous les termes doivent correspondre ("dup jea", "CHADH-PT-00042", "66 12 34").
+    """
+    terms = search_keys.parse(request.args.get("q", ""))
+    if not terms:
+        return {"error": f"q requis ({search_keys.SEARCH_MIN_CHARS} caractères minimum)"}, 400
+    try:
+        limit = min(max(int(request.args.get("limit", 20)), 1), _SEARCH_LIMIT_MAX)
+    except ValueError:
+        return {"error": "limit doit être un entier"}, 400
+
+    q = live(search_keys.query(terms))
+    docs = list(current_app.db.patients.find(
+        q,
+        {"identite": 1, "contacts.phone": 1, "identifiant": 1, "created_at": 1, "search_keys": 1},
+    ).limit(search_keys.SEARCH_CANDIDATES))
+
+    out = search_keys.rank(docs, terms)[:limit]
+    for d in out:
+        d.pop("search_keys", None)
+    return out, 200
 
 # -------------------------------
 # GET /api/patients/<id> — détail
@@ -106,15 +137,14 @@ def get_one(id):
         oid = ObjectId(id)
     except InvalidId:
         return {"error": "id invalide"}, 400
-    d = current_app.db.patients.find_one({"_id": oid})
-    return (d, 200) if d else ({"error": "introuvable"}, 404)
+    return conditional.detail(current_app.db.patients, oid, ({"error": "introuvable"}, 404))
 
 # -------------------------------
 # POST /api/patients — création
 # -------------------------------
 @bp.post("")
 def create():
-    b = request.get_json(force=True) or {}
+    b = json_body() or {}
 
     #  Identifiant lisible auto si absent
     if not b.get("identifiant"):
@@ -129,6 +159,7 @@ def create():
         "identifiant": b.get("identifiant"),
         "email": b.get("email"),
         "identite": b.get("identite"),
+        "contacts": b.get("contacts") if isinstance(b.get("contacts"), dict) else None,
         "notes": b.get("notes"),
         "allergies": b.get("allergies"),
         "chronic_diseases": b.get("chronic_diseases"),
@@ -146,6 +177,7 @@ def create():
     doc = strip_none(doc)
     if "identite" in doc:
         doc["identite"] = strip_none(doc["identite"])
+    doc["search_keys"] = search_keys.patient_keys(doc)
 
     #  Insertion Mongo
     try:
@@ -159,6 +191,19 @@ def create():
 # -----------------------------------------------------------
 # Route PATCH /api/patients/<id> — mise à jour partielle
 # -----------------------------------------------------------
+_CONTACT_FIELDS = ("phone", "city")
+_KEY_SOURCE_PROJ = {f: 1 for f in (*search_keys.SOURCE_FIELDS, "updated_at")}
+
+
+def _merged(doc, sets):
+    """Document `doc` après le $set `sets` (chemins à un niveau : "identite.nom")."""
+    out = dict(doc)
+    for k, v in sets.items():
+        head, _, tail = k.partition(".")
+        out[head] = {**(out.get(head) or {}), tail: v} if tail else v
+    return out
+
+
 @bp.patch("/<id>")
 def update(id):
     try:
@@ -167,7 +212,7 @@ def update(id):
     except (ValueError, FileNotFoundError) as e:
         return {"error": str(e)}, 400
 
-    b = request.get_json(force=True) or {}
+    b = json_body() or {}
     update_doc = {}
     
     for f in ("email", "notes", "allergies", "chronic_diseases"):
@@ -182,16 +227,48 @@ def update(id):
                 else:
                     update_doc[key] = b["identite"][f]
 
+    if "contacts" in b and isinstance(b["contacts"], dict):
+        for f, v in b["contacts"].items():
+            if f not in _CONTACT_FIELDS:
+                return {"error": f"contacts.{f} : champ inconnu ({'|'.join(_CONTACT_FIELDS)})"}, 400
+            if v is not None and not isinstance(v, str):
+                return {"error": f"contacts.{f} doit être une chaîne"}, 400
+            update_doc[f"contacts.{f}"] = v
+
     if not update_doc:
         return {"error": "Aucun champ à mettre à jour"}, 400
 
     update_doc["updated_at"] = datetime.now(timezone.utc)
-
-    res = current_app.db.patients.find_one_and_update(
-        {"_id": oid},
-        {"$set": update_doc},
-        return_document=ReturnDocument.AFTER
-    )
+    db = current_app.db
+
+    # clés de recherche (si nom / prénom / téléphone modifiés) : calculées sur le document
+    # fusionné et écrites dans le même $set, à condition que updated_at n'ait pas bougé
+    if not any(k.split(".")[0] in search_keys.SOURCE_FIELDS for k in update_doc):
+        res = db.patients.find_one_and_update(
+            {"_id": oid},
+            {"$set": update_doc},
+            return_document=ReturnDocument.AFTER
+        )
+    else:
+        for _ in range(3):
+            cur = db.patients.find_one({"_id": oid}, _KEY_SOURCE_PROJ)
+            if cur is None:
+                res = None
+                break
+            keys = search_keys.patient_keys(_merged(cur, update_doc))
+            res = db.patients.find_one_and_update(
+                {"_id": oid, "updated_at": cur.get("updated_at")},
+                {"$set": {**update_doc, "search_keys": keys}},
+                return_document=ReturnDocument.AFTER
+            )
+            if res is not None:
+                break
+        else:
+            return {"error": "patient modifié simultanément, réessayer"}, 409
+
+    # nom copié dans les rendez-vous / consultations (cf. names.py), après la réponse
+    if res and any(k in names.PATIENT_SOURCE_FIELDS for k in update_doc):
+        names.propagate_later("patient", res, update_doc["updated_at"])
     return res, 200
 
 
@@ -206,9 +283,6 @@ def delete(id):
     except (ValueError, FileNotFoundError) as e:
         return {"error": str(e)}, 400
 
-    current_app.db.patients.update_one(
-        {"_id": oid},
-        {"$set": {"deleted": True, "updated_at": datetime.now(timezone.utc)}}
-    )
+    mark_deleted(current_app.db.patients, oid, datetime.now(timezone.utc))
     return "", 204
 
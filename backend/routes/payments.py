@@ -16,7 +16,11 @@ from bson import ObjectId
 from bson.errors import InvalidId
 from pymongo.errors import WriteError
 from datetime import datetime, timezone
-from utils import strip_none, iso_to_dt, validate_objectid, check_exists
+from utils import strip_none, iso_to_dt, validate_objectid, check_exists, missing_refs, json_body
+from pagination import Page
+from softdelete import live, mark_deleted
+import conditional
+import bulk
 
 
 bp = Blueprint("payments", __name__)
@@ -73,43 +77,41 @@ def _validate(b):
 
 
 # -----------------------------------------------------------
-# POST /api/payments — création d’un paiement
+# Préparation d’un paiement (création unitaire et /bulk)
 # -----------------------------------------------------------
-@bp.post("")
-def create():
-    b = request.get_json(force=True) or {}
-
+def _prepare(b):
+    """Valide et normalise le corps -> (document, références à vérifier). ValueError si invalide."""
     #  validation
     err = _validate(b)
     if err:
-        return {"error": err}, 400
-
-    db = current_app.db
+        raise ValueError(err)
 
     #  patient_id obligatoire
     try:
         pid = ObjectId(b["patient_id"])
-    except InvalidId:
-        return {"error": "patient_id doit être un ObjectId"}, 400
-    if not db.patients.find_one({"_id": pid}):
-        return {"error": "patient introuvable"}, 404
+    except (InvalidId, TypeError):
+        raise ValueError("patient_id doit être un ObjectId")
 
     # références optionnelles
     try:
         appt_id    = ObjectId(b["appointment_id"])   if b.get("appointment_id")   else None
         consult_id = ObjectId(b["consultation_id"])  if b.get("consultation_id")  else None
         fid        = ObjectId(b["facility_id"])      if b.get("facility_id")      else ObjectId()
-    except InvalidId:
-        return {"error": "références optionnelles: ObjectId invalide"}, 400
+    except (InvalidId, TypeError):
+        raise ValueError("références optionnelles: ObjectId invalide")
 
     # dates optionnelles
-    due_date = iso_to_dt(b["due_date"]) if isinstance(b.get("due_date"), str) else None
-    if isinstance(b.get("due_date"), str) and not due_date:
-        return {"error": "due_date doit être au format ISO 8601"}, 400
-
-    paid_at = iso_to_dt(b["paid_at"]) if isinstance(b.get("paid_at"), str) else None
-    if isinstance(b.get("paid_at"), str) and not paid_at:
-        return {"error": "paid_at doit être au format ISO 8601"}, 400
+    due_date = paid_at = None
+    if isinstance(b.get("due_date"), str):
+        try:
+            due_date = iso_to_dt(b["due_date"])
+        except ValueError:
+            raise ValueError("due_date doit être au format ISO 8601")
+    if isinstance(b.get("paid_at"), str):
+        try:
+            paid_at = iso_to_dt(b["paid_at"])
+        except ValueError:
+            raise ValueError("paid_at doit être au format ISO 8601")
 
     #  normalisation des items
     items = []
@@ -123,11 +125,11 @@ def create():
             try:
                 ni["ref_id"] = ObjectId(it["ref_id"]) if isinstance(it["ref_id"], str) else it["ref_id"]
             except InvalidId:
-                return {"error": "items.ref_id doit être un ObjectId"}, 400
+                raise ValueError("items.ref_id doit être un ObjectId")
         items.append(strip_none(ni))
 
     #  construction du document Mongo
-    now = datetime.utcnow().replace(tzinfo=timezone.utc)
+    now = datetime.now(timezone.utc)
     doc = strip_none({
         "patient_id": pid,
         "appointment_id": appt_id,
@@ -145,10 +147,26 @@ def create():
         "updated_at": now,
         "deleted": False,
     })
+    return doc, [("patients", pid, "patient introuvable")]
+
+
+# -----------------------------------------------------------
+# POST /api/payments — création d’un paiement
+# -----------------------------------------------------------
+@bp.post("")
+def create():
+    try:
+        doc, refs = _prepare(json_body() or {})
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    missing = missing_refs(*refs)
+    if missing:
+        return {"error": missing[0]}, 404
 
     #  insertion MongoDB
     try:
-        ins = db.payments.insert_one(doc)
+        ins = current_app.db.payments.insert_one(doc)
     except WriteError as we:
         details = getattr(we, "details", {}) or {}
         return {"error": "validation_mongo", "details": details}, 400
@@ -157,12 +175,20 @@ def create():
     return {"_id": str(ins.inserted_id)}, 201
 
 
+# -----------------------------------------------------------
+# POST /api/payments/bulk — création en masse (tableau ou NDJSON)
+# -----------------------------------------------------------
+@bp.post("/bulk")
+def create_bulk():
+    return bulk.create_many(current_app.db.payments, _prepare)
+
+
 # -----------------------------------------------------------
 # GET /api/payments — liste (filtres par status, currency, etc.)
 # -----------------------------------------------------------
 @bp.get("")
 def list_():
-    q = {"deleted": {"$ne": True}}
+    q = live()
 
     # Filtres ID
     try:
@@ -185,8 +211,13 @@ def list_():
         q["method"] = request.args["method"]
 
     # Tri décroissant par date de création
-    cur = current_app.db.payments.find(q).sort("created_at", -1).limit(200)
-    return [d for d in cur], 200
+    try:
+        page = Page.from_request("created_at", -1)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    cur = page.find(current_app.db.payments, q)
+    return page.response(cur)
 
 
 # -----------------------------------------------------------
@@ -198,8 +229,7 @@ def get_one(id):
         oid = ObjectId(id)
     except InvalidId:
         return {"error": "id invalide"}, 400
-    d = current_app.db.payments.find_one({"_id": oid})
-    return (d, 200) if d else ({"error": "introuvable"}, 404)
+    return conditional.detail(current_app.db.payments, oid, ({"error": "introuvable"}, 404))
 
 
 # -----------------------------------------------------------
@@ -213,7 +243,7 @@ def update(id):
     except (ValueError, FileNotFoundError) as e:
         return {"error": str(e)}, 400
 
-    b = request.get_json(force=True) or {}
+    b = json_body() or {}
     update_doc = {}
 
     if "status" in b:
@@ -244,6 +274,15 @@ def update(id):
     return res, 200
 
 
+# -----------------------------------------------------------
+# POST /api/payments/bulk/status — transition en masse (paid -> paid_at)
+# -----------------------------------------------------------
+@bp.post("/bulk/status")
+def update_status_bulk():
+    return bulk.transition_many(current_app.db.payments, _ALLOWED_STATUS,
+                                stamps={"paid": "paid_at"})
+
+
 # -----------------------------------------------------------
 # DELETE /api/payments/<id> — suppression (soft)
 # -----------------------------------------------------------
@@ -255,8 +294,5 @@ def delete(id):
     except (ValueError, FileNotFoundError) as e:
         return {"error": str(e)}, 400
 
-    current_app.db.payments.update_one(
-        {"_id": oid},
-        {"$set": {"status": "cancelled", "updated_at": datetime.now(timezone.utc)}}
-    )
+    mark_deleted(current_app.db.payments, oid, datetime.now(timezone.utc))
     return "", 204
@@ -19,7 +19,11 @@ from bson import ObjectId
 from bson.errors import InvalidId
 from pymongo.errors import WriteError
 from datetime import datetime, timezone
-from utils import strip_none, iso_to_dt, validate_objectid, check_exists
+from utils import strip_none, iso_to_dt, validate_objectid, check_exists, missing_refs, json_body
+from pagination import Page
+from softdelete import live, mark_deleted
+import conditional
+import bulk
 
 
 bp = Blueprint("pharmacies", __name__)
@@ -93,63 +97,53 @@ def _normalize_items(items_in):
     return out
 
 # -------------------------------
-# POST /api/pharmacies — création
+# Préparation d’une délivrance (création unitaire et /bulk)
 # -------------------------------
-@bp.post("")
-def create():
-    b = request.get_json(force=True) or {}
-
+def _prepare(b):
+    """Valide et normalise le corps -> (document, références à vérifier). ValueError si invalide."""
     # 1) Validation fonctionnelle
     err = _validate_create(b)
     if err:
-        return {"error": err}, 400
+        raise ValueError(err)
 
-    db = current_app.db
-
-    # 2) Cast + existence patient/doctor
+    # 2) Cast patient/doctor
     try:
         pid = ObjectId(b["patient_id"])
         did = ObjectId(b["doctor_id"])
-    except InvalidId:
-        return {"error": "patient_id/doctor_id doivent être des ObjectId"}, 400
+    except (InvalidId, TypeError):
+        raise ValueError("patient_id/doctor_id doivent être des ObjectId")
 
-    if not db.patients.find_one({"_id": pid}, {"_id": 1}):
-        return {"error": "patient introuvable"}, 404
-    if not db.doctors.find_one({"_id": did}, {"_id": 1}):
-        return {"error": "médecin introuvable"}, 404
-
-    # 3) prescription_id optionnel + existence
+    # 3) prescription_id optionnel
     pres_id = None
     if b.get("prescription_id"):
         try:
             pres_id = ObjectId(b["prescription_id"])
-        except InvalidId:
-            return {"error": "prescription_id doit être un ObjectId"}, 400
-        if not db.prescriptions.find_one({"_id": pres_id}, {"_id": 1}):
-            return {"error": "prescription introuvable"}, 404
+        except (InvalidId, TypeError):
+            raise ValueError("prescription_id doit être un ObjectId")
 
     # 4) facility_id (requis par schéma) : généré si absent
     if b.get("facility_id"):
         try:
             facility_id = ObjectId(b["facility_id"])
-        except InvalidId:
-            return {"error": "facility_id doit être un ObjectId"}, 400
+        except (InvalidId, TypeError):
+            raise ValueError("facility_id doit être un ObjectId")
     else:
         facility_id = ObjectId()
 
     # 5) Normalisation items
     items = _normalize_items(b["items"])
     if not items:
-        return {"error": "items invalides (dci+qty requis)"}, 400
+        raise ValueError("items invalides (dci+qty requis)")
 
     # 6) Date optionnelle : dispensed_at (ISO)
     dispensed_at = None
     if b.get("dispensed_at"):
-        dispensed_at = iso_to_dt(b["dispensed_at"])
-        if not dispensed_at:
-            return {"error": "dispensed_at doit être ISO 8601"}, 400
+        try:
+            dispensed_at = iso_to_dt(b["dispensed_at"])
+        except ValueError:
+            raise ValueError("dispensed_at doit être ISO 8601")
 
-    now = datetime.utcnow().replace(tzinfo=timezone.utc)
+    now = datetime.now(timezone.utc)
 
     # 7) Document Mongo — on nettoie les None
     doc = strip_none({
@@ -164,21 +158,49 @@ def create():
         "updated_at": now,
         "deleted": False,
     })
+    refs = [
+        ("patients", pid, "patient introuvable"),
+        ("doctors", did, "médecin introuvable"),
+        ("prescriptions", pres_id, "prescription introuvable"),
+    ]
+    return doc, refs
+
+# -------------------------------
+# POST /api/pharmacies — création
+# -------------------------------
+@bp.post("")
+def create():
+    try:
+        doc, refs = _prepare(json_body() or {})
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    # existence des références (un seul aller-retour)
+    missing = missing_refs(*refs)
+    if missing:
+        return {"error": missing[0]}, 404
 
     # 8) Insertion
     try:
-        ins = db.pharmacies.insert_one(doc)
+        ins = current_app.db.pharmacies.insert_one(doc)
     except WriteError as we:
         return {"error": "validation_mongo", "details": getattr(we, "details", {}) or {}}, 400
 
     return {"_id": str(ins.inserted_id)}, 201
 
+# -------------------------------
+# POST /api/pharmacies/bulk — création en masse (tableau ou NDJSON)
+# -------------------------------
+@bp.post("/bulk")
+def create_bulk():
+    return bulk.create_many(current_app.db.pharmacies, _prepare)
+
 # -------------------------------
 # GET /api/pharmacies — liste
 # -------------------------------
 @bp.get("")
 def list_():
-    q = {"deleted": {"$ne": True}}
+    q = live()
 
     # Filtres ids
     try:
@@ -197,8 +219,13 @@ def list_():
     if "status" in request.args:
         q["status"] = request.args["status"]
 
-    cur = current_app.db.pharmacies.find(q).sort("created_at", -1).limit(200)
-    return [d for d in cur], 200
+    try:
+        page = Page.from_request("created_at", -1)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    cur = page.find(current_app.db.pharmacies, q)
+    return page.response(cur)
 
 # -------------------------------
 # GET /api/pharmacies/<id> — détail
@@ -209,8 +236,7 @@ def get_one(id):
         oid = ObjectId(id)
     except InvalidId:
         return {"error": "id invalide"}, 400
-    d = current_app.db.pharmacies.find_one({"_id": oid})
-    return (d, 200) if d else ({"error": "introuvable"}, 404)
+    return conditional.detail(current_app.db.pharmacies, oid, ({"error": "introuvable"}, 404))
 
 
 # -----------------------------------------------------------
@@ -224,7 +250,7 @@ def update(id):
     except (ValueError, FileNotFoundError) as e:
         return {"error": str(e)}, 400
 
-    b = request.get_json(force=True) or {}
+    b = json_body() or {}
     update_doc = {}
 
     if "status" in b:
@@ -253,6 +279,15 @@ def update(id):
     return res, 200
 
 
+# -----------------------------------------------------------
+# POST /api/pharmacies/bulk/status — transition en masse (dispensed -> dispensed_at)
+# -----------------------------------------------------------
+@bp.post("/bulk/status")
+def update_status_bulk():
+    return bulk.transition_many(current_app.db.pharmacies, _ALLOWED_STATUS,
+                                stamps={"dispensed": "dispensed_at"})
+
+
 # -----------------------------------------------------------
 # DELETE /api/pharmacies/<id> — suppression (soft)
 # -----------------------------------------------------------
@@ -264,9 +299,6 @@ def delete(id):
     except (ValueError, FileNotFoundError) as e:
         return {"error": str(e)}, 400
 
-    current_app.db.pharmacies.update_one(
-        {"_id": oid},
-        {"$set": {"deleted": True, "updated_at": datetime.now(timezone.utc)}}
-    )
+    mark_deleted(current_app.db.pharmacies, oid, datetime.now(timezone.utc))
     return "", 204
 
@@ -16,7 +16,10 @@ from bson import ObjectId
 from bson.errors import InvalidId
 from pymongo.errors import WriteError
 from datetime import datetime, timezone
-from utils import strip_none, iso_to_dt, validate_objectid, check_exists
+from utils import strip_none, iso_to_dt, validate_objectid, check_exists, missing_refs, json_body
+from pagination import Page
+from softdelete import live, mark_deleted
+import conditional
 
 
 bp = Blueprint("prescriptions", __name__)
@@ -93,7 +96,7 @@ def _normalize_items(items_in):
 # -------------------------------
 @bp.post("")
 def create():
-    b = request.get_json(force=True) or {}
+    b = json_body() or {}
 
     # 1) Validation d'entrée
     err = _validate_create(b)
@@ -110,13 +113,11 @@ def create():
     except InvalidId:
         return {"error": "patient_id/doctor_id/consultation_id doivent être des ObjectId"}, 400
 
-    # 3) Existence de base
-    if not db.patients.find_one({"_id": pid}):
-        return {"error": "patient introuvable"}, 404
-    if not db.doctors.find_one({"_id": did}):
-        return {"error": "médecin introuvable"}, 404
-    if not db.consultations.find_one({"_id": cid}):
-        return {"error": "consultation introuvable"}, 404
+    # 3) Existence de base (un seul aller-retour)
+    missing = missing_refs(("patients", pid, "patient"), ("doctors", did, "médecin"),
+                           ("consultations", cid, "consultation"))
+    if missing:
+        return {"error": f"{missing[0]} introuvable"}, 404
 
     # 4) facility_id optionnel 
     fid = None
@@ -145,8 +146,8 @@ def create():
         "items": items,
         "renouvellements": renouvel,
         "notes": b.get("notes"),
-        "created_at": datetime.utcnow().replace(tzinfo=timezone.utc),
-        "updated_at": datetime.utcnow().replace(tzinfo=timezone.utc),
+        "created_at": datetime.now(timezone.utc),
+        "updated_at": datetime.now(timezone.utc),
         "deleted": False,
     }
     if fid:
@@ -169,7 +170,7 @@ def create():
 # -----------------------------------------
 @bp.get("")
 def list_():
-    q = {"deleted": {"$ne": True}}
+    q = live()
 
     # Filtres par identifiants
     try:
@@ -199,8 +200,13 @@ def list_():
             rng["$lte"] = dt_
         q["created_at"] = rng
 
-    cur = current_app.db.prescriptions.find(q).sort("created_at", -1).limit(200)
-    return [d for d in cur], 200
+    try:
+        page = Page.from_request("created_at", -1)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    cur = page.find(current_app.db.prescriptions, q)
+    return page.response(cur)
 
 # --------------------------------------------------
 # GET /api/prescriptions/<id> — détail
@@ -211,8 +217,7 @@ def get_one(id):
         oid = ObjectId(id)
     except InvalidId:
         return {"error": "id invalide"}, 400
-    d = current_app.db.prescriptions.find_one({"_id": oid})
-    return (d, 200) if d else ({"error": "introuvable"}, 404)
+    return conditional.detail(current_app.db.prescriptions, oid, ({"error": "introuvable"}, 404))
 
 
 # -----------------------------------------------------------
@@ -226,7 +231,7 @@ def update(id):
     except (ValueError, FileNotFoundError) as e:
         return {"error": str(e)}, 400
 
-    b = request.get_json(force=True) or {}
+    b = json_body() or {}
     update_doc = {}
 
     if "items" in b:
@@ -273,8 +278,5 @@ def delete(id):
     except (ValueError, FileNotFoundError) as e:
         return {"error": str(e)}, 400
 
-    current_app.db.prescriptions.update_one(
-        {"_id": oid},
-        {"$set": {"deleted": True, "updated_at": datetime.now(timezone.utc)}}
-    )
+    mark_deleted(current_app.db.prescriptions, oid, datetime.now(timezone.utc))
     return "", 204
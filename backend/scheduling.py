@@ -0,0 +1,457 @@
+# ===========================================================
+#  scheduling.py — horaires des médecins, disponibilités et conflits
+#
+#  Horaires : champ `schedule` du médecin (POST / PATCH /api/doctors)
+#    {"timezone": "Africa/Ndjamena", "slot_minutes": 30,
+#     "hours": {"mon": [["08:00", "12:00"], ["14:00", "17:00"]], …, "sun": []}}
+#  Sans `schedule` : DEFAULT_HOURS (lun.–ven.), SCHEDULE_TZ, SCHEDULE_SLOT_MINUTES,
+#  pour les disponibilités seulement (pas de refus hors horaires).
+#
+#  Rendez-vous : [date_time, end_at) ; end_at = date_time + duration_minutes
+#  (corps) ou la durée de créneau du médecin.
+#
+#  Conflits, atomiques : un rendez-vous actif (non annulé, non supprimé)
+#  occupe des cases de GRID_MINUTES dans `doctor_slots`, d'_id {d: médecin,
+#  t: début de case}. L'unicité de _id fait le verrou : deux réservations
+#  concurrentes d'une même case -> une seule insertion réussit (E11000),
+#  l'autre est refusée (409) et rend ses cases déjà prises.
+#    - création / bulk : cases réservées AVANT l'insertion du rendez-vous
+#      (bulk : cases du lot en un insert_many non ordonné, documents en
+#      conflit repris un par un)
+#    - PATCH (date_time, duration_minutes, sortie de "cancelled") : nouvelles
+#      cases réservées avant la mise à jour, anciennes rendues après
+#    - annulation, suppression : cases rendues
+#    - case tenue par un rendez-vous absent (processus interrompu entre
+#      réservation et insertion), supprimé ou annulé : reprise, puis
+#      nouvelle tentative
+#  Cases expirées (TTL) SLOT_RETENTION_SECONDS après leur début.
+#
+#  Disponibilités : GET /api/doctors/<id>/availability?from=&to=
+#    rendez-vous actifs de la période (index doctor_id_date_time_id),
+#    rangés par jour local en intervalles fusionnés (Intervals : test de
+#    chevauchement par dichotomie), puis créneaux libres des horaires.
+#
+#  Rendez-vous antérieurs (sans end_at ni cases) : migration
+#  0006_appointments_slots (cf. migrations.py) ; après gen_data :
+#    python scheduling.py backfill
+# ===========================================================
+
+import os
+import sys
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from softdelete import live
+
+SCHEDULE_TZ = os.getenv("SCHEDULE_TZ", "Africa/Ndjamena")
+SCHEDULE_SLOT_MINUTES = int(os.getenv("SCHEDULE_SLOT_MINUTES", "30"))
+AVAILABILITY_DEFAULT_DAYS = 7
+AVAILABILITY_MAX_DAYS = 31
+
+GRID_MINUTES = 5
+MAX_DURATION_MINUTES = 8 * 60
+SLOT_RETENTION_SECONDS = 24 * 3600
+STALE_CLAIM_SECONDS = 60            # case sans rendez-vous : reprise au-delà (réservation en cours sinon)
+RESERVE_RETRIES = 3
+CONTENDED = "contended"             # reserve() : détenteurs renouvelés à chaque tentative
+
+COLLECTION = "doctor_slots"
+
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+DEFAULT_HOURS = {d: [("08:00", "12:00"), ("14:00", "17:00")] for d in DAYS[:5]}
+
+# champs du rendez-vous lus pour les réservations
+PROJECTION = {"doctor_id": 1, "date_time": 1, "end_at": 1, "status": 1}
+
+_GRID = timedelta(minutes=GRID_MINUTES)
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_NAIVE_EPOCH = _EPOCH.replace(tzinfo=None)
+_MS = timedelta(milliseconds=1)
+
+
+def _utc(dt):
+    """Dates lues en base : naïves en UTC."""
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _ms(dt):
+    return (dt - (_EPOCH if dt.tzinfo else _NAIVE_EPOCH)) // _MS
+
+
+def _minutes(s, field):
+    try:
+        h, m = s.split(":")
+        v = int(h) * 60 + int(m)
+    except (AttributeError, ValueError):
+        raise ValueError(f"{field} : heure HH:MM attendue")
+    if not 0 <= v <= 24 * 60 or not 0 <= int(m) < 60:
+        raise ValueError(f"{field} : heure hors limites")
+    return v
+
+
+# -------------------------------
+# Horaires
+# -------------------------------
+def validate_schedule(s) -> dict:
+    """Corps `schedule` -> document normalisé. ValueError si invalide."""
+    if not isinstance(s, dict):
+        raise ValueError("schedule doit être un objet")
+    tz = s.get("timezone", SCHEDULE_TZ)
+    try:
+        ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        raise ValueError("schedule.timezone inconnu")
+    slot = s.get("slot_minutes", SCHEDULE_SLOT_MINUTES)
+    if not isinstance(slot, int) or isinstance(slot, bool) or not GRID_MINUTES <= slot <= MAX_DURATION_MINUTES \
+            or slot % GRID_MINUTES:
+        raise ValueError(f"schedule.slot_minutes : multiple de {GRID_MINUTES} entre {GRID_MINUTES} et {MAX_DURATION_MINUTES}")
+
+    hours = s.get("hours", DEFAULT_HOURS)
+    if not isinstance(hours, dict) or set(hours) - set(DAYS):
+        raise ValueError(f"schedule.hours : clés {'|'.join(DAYS)}")
+    out = {}
+    for day in DAYS:
+        ranges, last = [], -1
+        for r in sorted(hours.get(day) or [], key=lambda r: r[0] if isinstance(r, (list, tuple)) and r else ""):
+            field = f"schedule.hours.{day}"
+            if not isinstance(r, (list, tuple)) or len(r) != 2:
+                raise ValueError(f"{field} : plages [début, fin] attendues")
+            a, b = _minutes(r[0], field), _minutes(r[1], field)
+            if a >= b or a < last:
+                raise ValueError(f"{field} : plages vides ou qui se chevauchent")
+            last = b
+            ranges.append([r[0], r[1]])
+        if ranges:
+            out[day] = ranges
+    return {"timezone": tz, "slot_minutes": slot, "hours": out}
+
+
+class Schedule:
+    """Horaires d'un médecin (son champ `schedule`, ou les horaires par défaut)."""
+
+    __slots__ = ("tz", "slot", "hours", "explicit")
+
+    def __init__(self, doc=None):
+        s = (doc or {}).get("schedule")
+        self.explicit = bool(s)
+        s = s or {}
+        self.tz = ZoneInfo(s.get("timezone") or SCHEDULE_TZ)
+        self.slot = timedelta(minutes=s.get("slot_minutes") or SCHEDULE_SLOT_MINUTES)
+        hours = s.get("hours") if s else DEFAULT_HOURS
+        # jour de semaine (0 = lundi) -> [(début, fin) en minutes locales]
+        self.hours = {i: [(_minutes(a, d), _minutes(b, d)) for a, b in hours.get(d, ())]
+                      for i, d in enumerate(DAYS)}
+
+    def working(self, day: date):
+        """Plages de travail du jour local `day` -> [(début, fin)] en UTC."""
+        midnight = datetime.combine(day, time(0), tzinfo=self.tz)
+        return [((midnight + timedelta(minutes=a)).astimezone(timezone.utc),
+                 (midnight + timedelta(minutes=b)).astimezone(timezone.utc))
+                for a, b in self.hours[day.weekday()]]
+
+    def contains(self, start, end) -> bool:
+        """[start, end) tient dans une plage de travail du jour local de start."""
+        return any(a <= start and end <= b for a, b in self.working(start.astimezone(self.tz).date()))
+
+    def days(self, start, end):
+        """Jours locaux couverts par [start, end)."""
+        d, last = start.astimezone(self.tz).date(), (end - timedelta(microseconds=1)).astimezone(self.tz).date()
+        while d <= last:
+            yield d
+            d += timedelta(days=1)
+
+
+def schedules(db, doctor_ids) -> dict:
+    """{doctor_id: Schedule} en une requête."""
+    ids = list({x for x in doctor_ids if x is not None})
+    found = {d["_id"]: Schedule(d) for d in db.doctors.find({"_id": {"$in": ids}}, {"schedule": 1})} if ids else {}
+    return {x: found.get(x) or Schedule() for x in ids}
+
+
+# -------------------------------
+# Intervalles occupés (un jour d'un médecin)
+# -------------------------------
+class Intervals:
+    """Intervalles [début, fin) disjoints et triés (ms) : chevauchement testé en O(log n)."""
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self):
+        self.starts, self.ends = [], []
+
+    @classmethod
+    def of(cls, pairs):
+        iv = cls()
+        for s, e in sorted(pairs):
+            if iv.ends and s <= iv.ends[-1]:
+                iv.ends[-1] = max(iv.ends[-1], e)       # fusion avec le précédent
+            else:
+                iv.starts.append(s)
+                iv.ends.append(e)
+        return iv
+
+    def overlaps(self, s, e) -> bool:
+        i = bisect_right(self.starts, s) - 1            # dernier intervalle qui commence avant s
+        if i >= 0 and self.ends[i] > s:
+            return True
+        return i + 1 < len(self.starts) and self.starts[i + 1] < e
+
+
+def _end(doc, sched):
+    return _utc(doc["end_at"]) if doc.get("end_at") else _utc(doc["date_time"]) + sched.slot
+
+
+def availability(db, doctor_id, sched, start, end, now=None):
+    """Créneaux libres du médecin (horaires `sched`) dans [start, end) -> [{start, end}]."""
+    start = max(start, now or datetime.now(timezone.utc))
+    if start >= end:
+        return []
+    days = list(sched.days(start, end))
+    # bornes des jours locaux (ms) : minuit de chaque jour, puis celui du lendemain du dernier
+    bounds = [_ms(datetime.combine(d, time(0), tzinfo=sched.tz)) for d in days]
+    bounds.append(_ms(datetime.combine(days[-1] + timedelta(days=1), time(0), tzinfo=sched.tz)))
+
+    # rendez-vous actifs qui peuvent chevaucher la période (index doctor_id_date_time_id), rangés par jour
+    busy = [[] for _ in days]
+    slot_ms = sched.slot // _MS
+    for a in db.appointments.find(
+        live({"doctor_id": doctor_id, "status": {"$ne": "cancelled"},
+              "date_time": {"$gt": start - timedelta(minutes=MAX_DURATION_MINUTES), "$lt": end}}),
+        {"_id": 0, "date_time": 1, "end_at": 1},
+    ):
+        s = _ms(a["date_time"])
+        e = _ms(a["end_at"]) if a.get("end_at") else s + slot_ms
+        first, last = max(0, bisect_right(bounds, s) - 1), min(len(days), bisect_left(bounds, e)) - 1
+        for k in range(first, last + 1):
+            busy[k].append((s, e))
+
+    lo, hi = _ms(start), _ms(end)
+    slots = []
+    for d, pairs in zip(days, busy):
+        day = Intervals.of(pairs)
+        for w_start, w_end in sched.working(d):
+            t, w_end = _ms(w_start), _ms(w_end)
+            while t + slot_ms <= w_end:
+                if t >= lo and t + slot_ms <= hi and not day.overlaps(t, t + slot_ms):
+                    slots.append({"start": _EPOCH + t * _MS,
+                                  "end": _EPOCH + (t + slot_ms) * _MS})
+                t += slot_ms
+    return slots
+
+
+# -------------------------------
+# Réservation des cases (doctor_slots)
+# -------------------------------
+def _cells(appointment_id, doctor_id, start, end):
+    t = _EPOCH + (_utc(start) - _EPOCH) // _GRID * _GRID          # case qui contient start
+    cells = []
+    while t < _utc(end):
+        cells.append({"_id": {"d": doctor_id, "t": t}, "appointment_id": appointment_id, "at": t})
+        t += _GRID
+    return cells
+
+
+def _stale(db, cell, now):
+    """Case reprenable : rendez-vous supprimé, annulé, ou jamais inséré."""
+    aid = cell["appointment_id"]
+    a = db.appointments.find_one({"_id": aid}, {"status": 1, "deleted": 1})
+    if a is None:
+        return (now - aid.generation_time).total_seconds() > STALE_CLAIM_SECONDS
+    return a.get("deleted") is True or a.get("status") == "cancelled"
+
+
+def reserve(db, appointment_id, doctor_id, start, end, new=False):
+    """
+    Réserve [start, end) du médecin pour le rendez-vous (cases déjà à lui conservées ;
+    new : _id tout juste attribué, aucune case à lui).
+    -> None, ou l'_id du rendez-vous qui tient une case demandée (rien n'est alors réservé).
+    """
+    coll = db[COLLECTION]
+    owned = set() if new else {_utc(c["_id"]["t"]) for c in coll.find({"appointment_id": appointment_id}, {"_id": 1})}
+    todo = [c for c in _cells(appointment_id, doctor_id, start, end) if c["at"] not in owned]
+    if not todo:
+        return None
+    # une case reprise ou rendue entre-temps -> nouvelle tentative ; les cases reprenables sont
+    # en nombre fini, la borne ne sert qu'en cas de rotation continue des détenteurs
+    for _ in range(len(todo) + RESERVE_RETRIES):
+        try:
+            coll.insert_many(todo, ordered=True)
+            return None
+        except BulkWriteError as e:
+            # rend les cases prises par cette tentative, puis examine la case refusée
+            done = todo[:e.details.get("nInserted", 0)]
+            if done:
+                coll.delete_many({"_id": {"$in": [c["_id"] for c in done]}, "appointment_id": appointment_id})
+            err = (e.details.get("writeErrors") or [{}])[0]
+            if err.get("code") != 11000:
+                raise
+            held = coll.find_one({"_id": todo[err["index"]]["_id"]})
+            if held is None:
+                continue                                    # rendue entre-temps
+            if not _stale(db, held, datetime.now(timezone.utc)):
+                return held["appointment_id"]
+            coll.delete_one({"_id": held["_id"], "appointment_id": held["appointment_id"]})
+    return CONTENDED
+
+
+def release(db, appointment_ids, keep=None):
+    """Rend les cases des rendez-vous (sauf celles de `keep`, liste d'_id de cases)."""
+    q = {"appointment_id": {"$in": list(appointment_ids)}}
+    if keep:
+        q["_id"] = {"$nin": keep}
+    if q["appointment_id"]["$in"]:
+        db[COLLECTION].delete_many(q)
+
+
+def _conflict(conflict_id):
+    if conflict_id == CONTENDED:
+        return {"error": "créneau disputé, réessayer", "status": 409}
+    return {"error": "créneau déjà réservé pour ce médecin", "status": 409, "conflict_id": conflict_id}
+
+
+def _outside():
+    return {"error": "hors des horaires du médecin", "status": 400}
+
+
+def book_many(db, docs):
+    """
+    Complète end_at et réserve les créneaux de rendez-vous à insérer (un _id leur est attribué).
+    Toutes les cases du lot en un insert_many(ordered=False) ; seuls les documents en conflit
+    repassent par reserve() (case reprenable, ou tenue par un document refusé du même lot).
+    -> {position dans docs: refus {"error", "status"[, "conflict_id"]}} ; rien n'est réservé pour un refus.
+    """
+    scheds = schedules(db, [d.get("doctor_id") for d in docs])
+    refused, cells, owner = {}, [], []          # owner[i] : position du document de cells[i]
+    for k, doc in enumerate(docs):
+        sched = scheds[doc["doctor_id"]]
+        doc.setdefault("_id", ObjectId())
+        doc.setdefault("end_at", _utc(doc["date_time"]) + sched.slot)
+        if doc.get("status") == "cancelled":
+            continue
+        if sched.explicit and not sched.contains(_utc(doc["date_time"]), _utc(doc["end_at"])):
+            refused[k] = _outside()
+            continue
+        for c in _cells(doc["_id"], doc["doctor_id"], doc["date_time"], doc["end_at"]):
+            cells.append(c)
+            owner.append(k)
+    if not cells:
+        return refused
+
+    try:
+        db[COLLECTION].insert_many(cells, ordered=False)
+        return refused
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(w.get("code") != 11000 for w in errors):
+            raise
+        contested = sorted({owner[w["index"]] for w in errors})
+
+    # documents en conflit : cases partielles rendues, puis reprise un par un, dans l'ordre du lot
+    release(db, [docs[k]["_id"] for k in contested])
+    for k in contested:
+        doc = docs[k]
+        holder = reserve(db, doc["_id"], doc["doctor_id"], doc["date_time"], doc["end_at"], new=True)
+        if holder is not None:
+            refused[k] = _conflict(holder)
+    return refused
+
+
+def book(db, doc):
+    """Comme book_many pour un rendez-vous -> refus ou None."""
+    return book_many(db, [doc]).get(0)
+
+
+def reschedule(db, cur, changes, duration=None):
+    """
+    Réserve le créneau du rendez-vous `cur` après `changes` ($set de PATCH, complété par end_at).
+    duration : nouvelle durée (timedelta) ou None.
+    -> (refus | None, cases à garder : à passer à release() après la mise à jour, None si rien à faire)
+    """
+    status = changes.get("status", cur.get("status"))
+    moved = "date_time" in changes or duration is not None
+    if not moved and (status == "cancelled" or cur.get("status") != "cancelled"):
+        return None, ([] if status == "cancelled" else None)
+
+    sched = schedules(db, [cur["doctor_id"]])[cur["doctor_id"]]
+    start = _utc(changes.get("date_time", cur["date_time"]))
+    if duration is None:
+        duration = _end(cur, sched) - _utc(cur["date_time"])
+    end = start + duration
+    if moved:
+        changes["end_at"] = end
+    if status == "cancelled":
+        return None, []                                     # tout est rendu
+    if moved and sched.explicit and not sched.contains(start, end):
+        return _outside(), None
+    holder = reserve(db, cur["_id"], cur["doctor_id"], start, end)
+    if holder is not None:
+        return _conflict(holder), None
+    return None, [c["_id"] for c in _cells(cur["_id"], cur["doctor_id"], start, end)]
+
+
+def response(refusal):
+    """Refus -> réponse de route (corps, statut)."""
+    return {k: v for k, v in refusal.items() if k != "status"}, refusal["status"]
+
+
+# -------------------------------
+# Backfill (migration 0006, gen_data)
+# -------------------------------
+def sync_ops(db, docs, now=None):
+    """
+    Rendez-vous `docs` (PROJECTION + deleted) : pose les cases des rendez-vous actifs à venir
+    (doubles réservations existantes ignorées) -> UpdateOne qui posent end_at là où il manque.
+    """
+    now = now or datetime.now(timezone.utc)
+    scheds = schedules(db, [d.get("doctor_id") for d in docs])
+    cells, ops = [], []
+    for d in docs:
+        if d.get("doctor_id") is None or not isinstance(d.get("date_time"), datetime):
+            continue
+        sched = scheds[d["doctor_id"]]
+        end = _end(d, sched)
+        if not d.get("end_at"):
+            ops.append(UpdateOne({"_id": d["_id"], "end_at": {"$exists": False}}, {"$set": {"end_at": end}}))
+        if end > now and d.get("status") != "cancelled" and d.get("deleted") is not True:
+            cells += _cells(d["_id"], d["doctor_id"], d["date_time"], end)
+    if cells:
+        try:
+            db[COLLECTION].insert_many(cells, ordered=False)
+        except BulkWriteError as e:
+            if any(w.get("code") != 11000 for w in e.details.get("writeErrors", [])):
+                raise
+    return ops
+
+
+def backfill(db, batch=1000, log=print):
+    """Cases et end_at des rendez-vous à venir (données insérées hors API : gen_data…)."""
+    q, last, n = live({"date_time": {"$gte": datetime.now(timezone.utc)}}), None, 0
+    proj = {**PROJECTION, "deleted": 1}
+    while True:
+        if last is not None:
+            q["_id"] = {"$gt": last}
+        docs = list(db.appointments.find(q, proj).sort("_id", 1).limit(batch))
+        if not docs:
+            break
+        ops = sync_ops(db, docs)
+        if ops:
+            db.appointments.bulk_write(ops, ordered=False)
+        n += len(docs)
+        last = docs[-1]["_id"]
+        log(f"[scheduling] {n} rendez-vous à venir")
+    return n
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+
+    if sys.argv[1:2] != ["backfill"]:
+        print("usage: python scheduling.py backfill")
+        sys.exit(2)
+    _db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))[os.getenv("MONGO_DB", "hospital")]
+    backfill(_db)
@@ -0,0 +1,175 @@
+# ===========================================================
+#  search_keys.py — clés de recherche normalisées des patients
+#
+#  Chaque patient porte un tableau `search_keys` (index multiclé
+#  patients.search_keys_1, cf. indexes.py) :
+#    n:<mot>      mots de identite.nom / identite.prenom, sans accents ni casse
+#                 (+ formes accolées : "Jean-Pierre" -> n:jean, n:pierre, n:jeanpierre)
+#    i:<ident>    identifiant sans ponctuation ("i:chadhpt00042"),
+#                 partie numérique ("i:00042") et sans zéros de tête ("i:42")
+#    p:<chiffres> téléphone, chiffres seuls, avec et sans indicatif (+235 / 00235)
+#
+#  GET /api/patients/search?q= : chaque terme de la requête devient un
+#  $in de regex ANCRÉES (^n:dup, ^i:dup…) -> bornes d'index, pas de scan de
+#  collection. Au plus SEARCH_CANDIDATES documents sont lus puis classés en
+#  mémoire (identifiant exact > mot exact > préfixe).
+#
+#  Maintenues par :
+#    - routes/patients.py (création, PATCH)
+#    - seed.normalize_patient (seed + gen_data)
+#    - python search_keys.py backfill   (patients existants sans clés)
+# ===========================================================
+
+import os
+import re
+import sys
+import unicodedata
+
+from bson.regex import Regex
+from pymongo import UpdateOne
+
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "200"))
+SEARCH_MIN_CHARS = 2
+
+# indicatif national retiré des téléphones (clé "locale" en plus de la clé complète)
+PHONE_COUNTRY = os.getenv("PHONE_COUNTRY_CODE", "235")
+
+# Champs dont dépendent les clés (PATCH : recalcul seulement si l'un d'eux change)
+SOURCE_FIELDS = ("identite", "identifiant", "contacts")
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+_PHONE_LIKE = re.compile(r"[\d\s+().-]+")
+
+
+def fold(s) -> str:
+    """'Éloïse  N'Djaména' -> 'eloise n djamena' (sans accents, minuscules, alphanumérique)."""
+    if not isinstance(s, str):
+        return ""
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(c for c in s if not unicodedata.combining(c)).lower()
+    return _NON_ALNUM.sub(" ", s).strip()
+
+
+def _digits(s) -> str:
+    return re.sub(r"\D", "", s) if isinstance(s, str) else ""
+
+
+def _phone_keys(phone):
+    d = _digits(phone)
+    if not d:
+        return []
+    keys = [d]
+    for prefix in ("00" + PHONE_COUNTRY, PHONE_COUNTRY):
+        if d.startswith(prefix) and len(d) > len(prefix) + 4:
+            keys.append(d[len(prefix):])
+            break
+    return keys
+
+
+def patient_keys(doc) -> list:
+    """Clés de recherche d'un document patient (complet)."""
+    keys = []
+    ident = doc.get("identite") or {}
+    for f in ("nom", "prenom"):
+        value = ident.get(f)
+        if not isinstance(value, str):
+            continue
+        words = []
+        for w in value.split():
+            parts = fold(w).split()
+            keys += [f"n:{x}" for x in parts if len(x) > 1]
+            words.append("".join(parts))
+        keys += [f"n:{w}" for w in words if w]
+        if len(words) > 1:
+            keys.append("n:" + "".join(words))
+
+    code = fold(doc.get("identifiant")).replace(" ", "")
+    if code:
+        keys.append(f"i:{code}")
+        num = re.search(r"\d+$", code)
+        if num:
+            keys += [f"i:{num.group()}", f"i:{num.group().lstrip('0') or '0'}"]
+
+    contacts = doc.get("contacts") or {}
+    keys += [f"p:{k}" for k in _phone_keys(contacts.get("phone"))]
+    return list(dict.fromkeys(keys))
+
+
+# -------------------------------
+# Requête et classement
+# -------------------------------
+def parse(q):
+    """Texte saisi -> termes normalisés (vide si trop court)."""
+    if _PHONE_LIKE.fullmatch(q or ""):
+        terms = [_digits(q)] if _digits(q) else []         # "66 12 34" : un seul numéro
+    else:
+        terms = [t for t in (fold(w).replace(" ", "") for w in (q or "").split()) if t]
+    if sum(len(t) for t in terms) < SEARCH_MIN_CHARS:
+        return []
+    return terms
+
+
+def _prefixes(term):
+    if term.isdigit():
+        return [f"i:{term}", f"p:{term}"] + ([f"p:{term[len(PHONE_COUNTRY):]}"]
+                                             if term.startswith(PHONE_COUNTRY) and len(term) > len(PHONE_COUNTRY) else [])
+    return [f"n:{term}", f"i:{term}"]
+
+
+def query(terms):
+    """Filtre Mongo : chaque terme doit préfixer au moins une clé (regex sans option -> bornes d'index)."""
+    clauses = [{"search_keys": {"$in": [Regex("^" + re.escape(p)) for p in _prefixes(t)]}}
+               for t in terms]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def rank(docs, terms):
+    """Tri par pertinence : identifiant exact, puis mots exacts, puis ordre alphabétique."""
+    def score(d):
+        keys = set(d.get("search_keys") or ())
+        s = 0
+        for t in terms:
+            exact = [p for p in _prefixes(t) if p in keys]
+            if any(p.startswith("i:") for p in exact):
+                s += 10
+            elif exact:
+                s += 3
+            else:
+                s += 1
+        ident = d.get("identite") or {}
+        return (-s, fold(ident.get("nom")), fold(ident.get("prenom")))
+    return sorted(docs, key=score)
+
+
+# -------------------------------
+# Backfill des patients existants
+# -------------------------------
+def backfill(db, batch=1000, log=print):
+    """Calcule search_keys des patients qui n'en ont pas (lots par _id croissant)."""
+    total, last = 0, None
+    proj = {f: 1 for f in SOURCE_FIELDS}
+    while True:
+        q = {"search_keys": {"$exists": False}}
+        if last is not None:
+            q["_id"] = {"$gt": last}
+        docs = list(db.patients.find(q, proj).sort("_id", 1).limit(batch))
+        if not docs:
+            break
+        db.patients.bulk_write(
+            [UpdateOne({"_id": d["_id"]}, {"$set": {"search_keys": patient_keys(d)}}) for d in docs],
+            ordered=False,
+        )
+        total += len(docs)
+        last = docs[-1]["_id"]
+        log(f"[search_keys] {total} patients")
+    return total
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+
+    if sys.argv[1:2] != ["backfill"]:
+        print("usage: python search_keys.py backfill")
+        sys.exit(2)
+    _db = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))[os.getenv("MONGO_DB", "hospital")]
+    backfill(_db)
@@ -1,10 +1,28 @@
 # seed.py — indices + import du seed_data.json en respectant tes validateurs
+#
+# Chargement en masse :
+#   - lecture en flux du JSON (iter_seed) : le fichier n'est jamais chargé en entier
+#   - upserts groupés (bulk_write de UpdateOne, ordered=False) par lots de SEED_BATCH
+#   - lots envoyés en parallèle (SEED_WORKERS threads), codes facility mis en cache
+#   - passes successives (PASSES) : une collection n'est chargée qu'après celles
+#     qu'elle référence ; les références (email, licence, _seed_id) sont résolues
+#     par RefResolver, une requête $in par collection visée et par lot
 import os, json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from bson import ObjectId
-from pymongo import ASCENDING
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import indexes
+import names
+import versions
+from search_keys import patient_keys
 
 SEED_FILE = os.getenv("SEED_FILE", "seed_data.json")
+SEED_BATCH = int(os.getenv("SEED_BATCH", "1000"))
+SEED_WORKERS = int(os.getenv("SEED_WORKERS", "4"))
 
 # -----------------------------
 # Helpers date / cast
@@ -16,11 +34,16 @@ def _to_dt(v):
         return datetime.fromisoformat(v.replace("Z", "+00:00"))
     return None
 
+# cache (base, code) -> _id : une seule requête par code et par processus
+_facility_ids = {}
+_facility_lock = threading.Lock()
+
 def get_or_create_facility_id(db, code_or_id):
     """
     facility_id doit être un ObjectId (validator).
     Si une string 24 hexa -> cast en ObjectId.
     Sinon on considère un 'code' (ex: 'HOSP-001') -> upsert dans db.facilities et on renvoie son _id.
+    Les codes déjà vus sont servis depuis le cache (upsert atomique : sûr entre threads).
     """
     if isinstance(code_or_id, ObjectId):
         return code_or_id
@@ -30,11 +53,19 @@ def get_or_create_facility_id(db, code_or_id):
         except Exception:
             pass
     code = code_or_id or "HOSP-001"
-    fac = db.facilities.find_one({"code": code}, {"_id": 1})
-    if not fac:
-        res = db.facilities.insert_one({"code": code, "name": f"Facility {code}"})
-        return res.inserted_id
-    return fac["_id"]
+    key = (db.name, code)
+    fid = _facility_ids.get(key)
+    if fid is None:
+        fac = db.facilities.find_one_and_update(
+            {"code": code},
+            {"$setOnInsert": {"name": f"Facility {code}"}},
+            projection={"_id": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        with _facility_lock:
+            fid = _facility_ids.setdefault(key, fac["_id"])
+    return fid
 
 # -----------------------------
 # Normalisations selon validateurs
@@ -88,6 +119,9 @@ def normalize_patient(d, db):
     for k in ("first_name", "last_name", "birth_date"):
         d.pop(k, None)
 
+    # clés de recherche (GET /api/patients/search)
+    d["search_keys"] = patient_keys(d)
+
     return d
 
 def normalize_doctor(d, db):
@@ -180,121 +214,305 @@ def normalize_notification(d, db):
 
 
 # -----------------------------
-# Indexes (partiels sur uniques)
+# Indexes (registre versionné : cf. indexes.py)
 # -----------------------------
 def ensure_indexes(db):
-    db.patients.create_index(
-        [("email", ASCENDING)],
-        name="uniq_email_not_null",
-        unique=True,
-        partialFilterExpression={"email": {"$type": "string"}}
-    )
-    db.doctors.create_index(
-        [("license_number", ASCENDING)],
-        name="uniq_license_not_null",
-        unique=True,
-        partialFilterExpression={"license_number": {"$type": "string"}}
-    )
-    db.appointments.create_index(
-        [("patient_id", ASCENDING), ("start_at", ASCENDING)],
-        name="uniq_patient_start",
-        unique=True
-    )
-    db.notifications.create_index(
-        "expires_at",
-        name="ttl_expires_at",
-        expireAfterSeconds=0
-    )
+    indexes.apply(db, force=True)
 
 # -----------------------------
 # Upsert générique + résolutions
 # -----------------------------
-def upsert_many(db, coll_name, docs, key, bypass_validation=False):
-    if not docs:
-        return
-    coll = db[coll_name]
-    for d in docs:
-        d = dict(d)
-        for k in ("start_at", "expires_at", "updated_at", "created_at"):
-            if k in d and isinstance(d[k], str):
-                d[k] = _to_dt(d[k]) or d[k]
-        for k in ("patient_id", "doctor_id"):
-            if k in d and isinstance(d[k], str) and len(d[k]) == 24:
-                try:
-                    d[k] = ObjectId(d[k])
-                except Exception:
-                    pass
-        # coerce facility_id codes/strings into ObjectId using helper
-        if "facility_id" in d:
+def _coerce(db, d):
+    d = dict(d)
+    for k in ("date_time", "start_at", "expires_at", "updated_at", "created_at"):
+        if k in d and isinstance(d[k], str):
+            d[k] = _to_dt(d[k]) or d[k]
+    for k in ("patient_id", "doctor_id"):
+        if k in d and isinstance(d[k], str) and len(d[k]) == 24:
             try:
-                d["facility_id"] = get_or_create_facility_id(db, d["facility_id"])
+                d[k] = ObjectId(d[k])
             except Exception:
-                # if coercion fails, leave as-is and let validation/reporting handle it
                 pass
-        coll.update_one(
-            {key: d[key]},
-            {"$set": d},
-            upsert=True,
-            bypass_document_validation=bypass_validation
-        )
+    # coerce facility_id codes/strings into ObjectId using helper
+    if "facility_id" in d:
+        try:
+            d["facility_id"] = get_or_create_facility_id(db, d["facility_id"])
+        except Exception:
+            # if coercion fails, leave as-is and let validation/reporting handle it
+            pass
+    return d
 
-def resolve_ids_for_appointments(db, docs):
+def upsert_many(db, coll_name, docs, key, bypass_validation=False):
+    """
+    Upsert par `key` en lots de SEED_BATCH (un aller-retour par lot).
+    ordered=False : un document rejeté (validator) n'arrête pas le lot.
+    Retourne (documents écrits, erreurs).
+    """
     if not docs:
-        return []
-    out = []
-    for d in docs:
-        d = dict(d)
-        if "start_at" in d and isinstance(d["start_at"], str):
-            d["start_at"] = _to_dt(d["start_at"]) or d["start_at"]
-        if "patient_email" in d and "patient_id" not in d:
-            p = db.patients.find_one({"email": d["patient_email"]}, {"_id": 1})
-            if p:
-                d["patient_id"] = p["_id"]
-        if "doctor_license" in d and "doctor_id" not in d:
-            doc = db.doctors.find_one({"license_number": d["doctor_license"]}, {"_id": 1})
-            if doc:
-                d["doctor_id"] = doc["_id"]
-        out.append(d)
-    return out
+        return 0, 0
+    coll = db[coll_name]
+    written = errors = 0
+    for lo in range(0, len(docs), SEED_BATCH):
+        ops = []
+        for d in docs[lo:lo + SEED_BATCH]:
+            d = _coerce(db, d)
+            update = {"$set": d}
+            if "deleted" not in d:
+                update["$setOnInsert"] = {"deleted": False}     # modèle de suppression (softdelete.py)
+            ops.append(UpdateOne({key: d[key]}, update, upsert=True))
+        try:
+            res = coll.bulk_write(ops, ordered=False, bypass_document_validation=bypass_validation)
+            written += res.upserted_count + res.matched_count
+        except BulkWriteError as e:
+            det = e.details
+            written += det.get("nUpserted", 0) + det.get("nMatched", 0)
+            errors += len(det.get("writeErrors", []))
+            for err in det.get("writeErrors", [])[:3]:
+                print(f"[seed] {coll_name}: {err.get('errmsg')}")
+    return written, errors
+
+# Références du seed : collection -> [(champ source, champ cible, collection visée, clé de recherche)]
+REFS = {
+    "appointments": [
+        ("patient_email",    "patient_id",      "patients",      "email"),
+        ("doctor_license",   "doctor_id",       "doctors",       "license_number"),
+    ],
+    "notifications": [
+        ("patient_email",    "to_patient_id",   "patients",      "email"),
+        ("doctor_license",   "to_doctor_id",    "doctors",       "license_number"),
+    ],
+    "prescriptions": [
+        ("patient_email",    "patient_id",      "patients",      "email"),
+        ("doctor_license",   "doctor_id",       "doctors",       "license_number"),
+        ("appointment_ref",  "appointment_id",  "appointments",  "_seed_id"),
+        ("consultation_ref", "consultation_id", "consultations", "_seed_id"),
+    ],
+    "payments": [
+        ("patient_email",    "patient_id",      "patients",      "email"),
+        ("appointment_ref",  "appointment_id",  "appointments",  "_seed_id"),
+        ("consultation_ref", "consultation_id", "consultations", "_seed_id"),
+    ],
+}
+
+class RefResolver:
+    """
+    Résout les clés métier (email, licence, _seed_id…) en ObjectId pour un lot entier :
+    une requête $in par (collection visée, clé) et par lot, uniquement pour les
+    valeurs jamais vues. Les résultats (y compris les absences) sont mémorisés
+    entre les lots : les collections visées sont chargées dans une passe antérieure.
+    Les références introuvables sont comptées et rapportées en une fois (report()).
+    """
+
+    def __init__(self, db, refs=REFS):
+        self.db = db
+        self.refs = refs
+        self._memo = {}          # (collection, clé) -> {valeur: _id | None}
+        self._unresolved = {}    # (collection source, champ source) -> [valeurs]
+        self._lock = threading.Lock()
+
+    def _lookup(self, coll, key, values):
+        memo = self._memo.setdefault((coll, key), {})
+        missing = [v for v in values if v not in memo]
+        if missing:
+            found = {d[key]: d["_id"] for d in self.db[coll].find({key: {"$in": missing}}, {key: 1})}
+            with self._lock:
+                for v in missing:
+                    memo[v] = found.get(v)
+        return memo
+
+    def resolve(self, coll_name, docs):
+        rules = self.refs.get(coll_name)
+        if not rules or not docs:
+            return docs
+        docs = [dict(d) for d in docs]
+        for src, dst, coll, key in rules:
+            todo = [d for d in docs if src in d and dst not in d]
+            if not todo:
+                continue
+            memo = self._lookup(coll, key, list({d[src] for d in todo}))
+            misses = []
+            for d in todo:
+                oid = memo.get(d[src])
+                if oid is None:
+                    misses.append(d[src])
+                else:
+                    d[dst] = oid
+            if misses:
+                with self._lock:
+                    self._unresolved.setdefault((coll_name, src), []).extend(misses)
+        return docs
+
+    def report(self):
+        """{"appointments.patient_email": {"count": n, "sample": [...]}, ...}"""
+        return {
+            f"{coll}.{src}": {"count": len(vals), "sample": sorted(set(map(str, vals)))[:5]}
+            for (coll, src), vals in self._unresolved.items()
+        }
+
+# -----------------------------
+# Lecture en flux de seed_data.json
+# -----------------------------
+def iter_seed(path, chunk_size=1 << 16):
+    """
+    Parcourt {"collection": [doc, ...], ...} et produit (collection, doc) au fil de
+    la lecture : seuls le tampon courant et le document en cours sont en mémoire.
+    """
+    dec = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf, pos, eof = "", 0, False
+
+        def fill():
+            nonlocal buf, pos, eof
+            data = f.read(chunk_size)
+            if not data:
+                eof = True
+            buf = buf[pos:] + data
+            pos = 0
+
+        def peek():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos].isspace():
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return buf[pos] if pos < len(buf) else ""
+                fill()
+
+        def expect(ch):
+            nonlocal pos
+            if peek() != ch:
+                raise ValueError(f"{path}: '{ch}' attendu à l'offset {f.tell() - len(buf) + pos}")
+            pos += 1
+
+        def value():
+            nonlocal pos
+            peek()
+            while True:
+                try:
+                    v, end = dec.raw_decode(buf, pos)
+                    # un nombre peut être coupé par la fin du tampon : il doit être suivi d'un délimiteur
+                    if not isinstance(v, (int, float)) or eof or (end < len(buf) and buf[end] in ",]} \t\r\n"):
+                        pos = end
+                        return v
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill()
+
+        expect("{")
+        if peek() == "}":
+            return
+        while True:
+            coll = value()
+            expect(":")
+            if peek() != "[":
+                raise ValueError(f"{path}: '{coll}' doit être un tableau")
+            expect("[")
+            if peek() == "]":
+                pos += 1
+            else:
+                while True:
+                    yield coll, value()
+                    if peek() == ",":
+                        pos += 1
+                        continue
+                    expect("]")
+                    break
+            if peek() == ",":
+                pos += 1
+                continue
+            expect("}")
+            return
 
 # -----------------------------
 # Chargement du seed
 # -----------------------------
-def load_seed(db):
-    if not os.path.exists(SEED_FILE):
-        print(f"[seed] {SEED_FILE} not found. Skip.")
+# Passes de chargement : chaque passe ne référence que des collections des passes précédentes.
+# collection -> (clé d'upsert, normalisation)
+PASSES = [
+    {
+        "patients":          ("email",          normalize_patient),
+        "doctors":           ("license_number", normalize_doctor),
+        "pharmacies":        ("name",           None),
+        "laboratories":      ("name",           None),
+        "healthauthorities": ("name",           None),
+    },
+    {
+        "appointments":      ("_seed_id",       None),
+        "notifications":     ("_seed_id",       normalize_notification),
+    },
+    {
+        "prescriptions":     ("_seed_id",       None),
+        "payments":          ("_seed_id",       None),
+    },
+]
+
+class _BatchLoader:
+    """Regroupe les documents par collection et envoie chaque lot plein au pool de threads."""
+
+    def __init__(self, db, pool, loaders, resolver):
+        self.db = db
+        self.pool = pool
+        self.loaders = loaders
+        self.resolver = resolver
+        self.buffers = {c: [] for c in loaders}
+        self.futures = []
+        self._slots = threading.BoundedSemaphore(SEED_WORKERS * 2)   # lots en vol bornés
+
+    def add(self, coll, doc):
+        if coll not in self.loaders:
+            return
+        buf = self.buffers[coll]
+        buf.append(doc)
+        if len(buf) >= SEED_BATCH:
+            self._submit(coll)
+
+    def _submit(self, coll):
+        docs, self.buffers[coll] = self.buffers[coll], []
+        if docs:
+            self._slots.acquire()
+            self.futures.append((coll, self.pool.submit(self._write, coll, docs)))
+
+    def _write(self, coll, docs):
+        try:
+            key, normalize = self.loaders[coll]
+            if normalize is not None:
+                docs = [normalize(x, self.db) for x in docs]
+            docs = self.resolver.resolve(coll, docs)
+            return upsert_many(self.db, coll, docs, key)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        for coll in self.buffers:
+            self._submit(coll)
+        stats = {}
+        for coll, fut in self.futures:
+            w, e = fut.result()
+            tw, te = stats.get(coll, (0, 0))
+            stats[coll] = (tw + w, te + e)
+        return stats
+
+def load_seed(db, path=None):
+    path = path or SEED_FILE
+    if not os.path.exists(path):
+        print(f"[seed] {path} not found. Skip.")
         return
-    with open(SEED_FILE, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    # patients -> normaliser selon validator
-    patients_raw = data.get("patients", [])
-    patients = [normalize_patient(x, db) for x in patients_raw]
-    upsert_many(db, "patients", patients, "email")
-
-    # doctors -> normaliser selon validator
-    doctors_raw = data.get("doctors", [])
-    doctors = [normalize_doctor(x, db) for x in doctors_raw]
-    upsert_many(db, "doctors", doctors, "license_number")
-
-    # annuaires
-    upsert_many(db, "pharmacies", data.get("pharmacies", []), "name")
-    upsert_many(db, "laboratories", data.get("laboratories", []), "name")
-    upsert_many(db, "healthauthorities", data.get("healthauthorities", []), "name")
-
-   # notifications
-    notifications_raw = data.get("notifications", [])
-    notifications = [normalize_notification(x, db) for x in notifications_raw]
-    upsert_many(db, "notifications", notifications, "_seed_id")
-
-    # appointments (résolution par email/licence)
-    apps = resolve_ids_for_appointments(db, data.get("appointments", []))
-    upsert_many(db, "appointments", apps, "_seed_id")
-
-    # prescriptions / payments
-    upsert_many(db, "prescriptions", data.get("prescriptions", []), "_seed_id")
-    upsert_many(db, "payments", data.get("payments", []), "_seed_id")
-
+    stats = {}
+    resolver = RefResolver(db)
+    with ThreadPoolExecutor(SEED_WORKERS) as pool:
+        for loaders in PASSES:
+            loader = _BatchLoader(db, pool, loaders, resolver)
+            for coll, doc in iter_seed(path):
+                loader.add(coll, doc)
+            stats.update(loader.close())
+    versions.bump(db, "doctors", "facilities")      # instantanés des workers (refcache.py)
+    names.backfill(db, touch=False, log=lambda *_: None)   # noms copiés dans rendez-vous / consultations
+
+    for coll, (w, e) in stats.items():
+        print(f"[seed] {coll}: {w} upsert(s){f', {e} erreur(s)' if e else ''}")
+    for ref, info in resolver.report().items():
+        print(f"[seed] références introuvables {ref}: {info['count']} (ex: {', '.join(info['sample'])})")
     print("[seed] Done.")
 
 # -----------------------------
@@ -0,0 +1,92 @@
+# ===========================================================
+#  sequences.py — compteurs lisibles alloués par blocs (hi/lo)
+#
+#  Les identifiants lisibles (CHADH-PT-00001, numéros de facture…) viennent
+#  de la collection `counters` ({_id: nom, seq: plus haute valeur réservée}).
+#  Plutôt qu'un find_one_and_update par valeur (document unique = point chaud
+#  en écriture + un aller-retour par création), chaque processus réserve un
+#  bloc de N valeurs d'un coup ($inc: N) et les distribue depuis la mémoire.
+#
+#  Conséquences :
+#    - valeurs uniques entre workers, croissantes au sein d'un worker,
+#      mais pas globalement ordonnées dans le temps
+#    - les valeurs non distribuées d'un bloc sont perdues à l'arrêt du worker
+#      (trous d'au plus N-1 valeurs par processus)
+#
+#  Réglages :
+#    SEQ_BLOCK_SIZE=50             taille de bloc par défaut (1 = pas de trous,
+#                                  un aller-retour par valeur comme avant)
+#    SEQ_BLOCK_SIZE_<NOM>=…        taille pour une séquence précise
+#                                  (ex. SEQ_BLOCK_SIZE_PATIENT_IDENT=10)
+#
+#  Après fork (workers gunicorn), un bloc hérité du master est abandonné :
+#  deux workers ne distribuent jamais les mêmes valeurs.
+# ===========================================================
+
+import os
+import threading
+
+from pymongo import ReturnDocument
+
+import metrics
+
+SEQ_BLOCK_SIZE = int(os.getenv("SEQ_BLOCK_SIZE", "50"))
+
+
+class BlockSequence:
+    """Séquence `name` de la collection counters, distribuée par blocs de `block_size`."""
+
+    def __init__(self, name, block_size=None, fmt="{}"):
+        self.name = name
+        env = os.getenv(f"SEQ_BLOCK_SIZE_{name.upper()}")
+        self.block_size = max(1, int(block_size or env or SEQ_BLOCK_SIZE))
+        self.fmt = fmt
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next = 1
+        self._hi = 0          # bloc courant : [_next, _hi]
+
+    def _reserve(self, db):
+        doc = db.counters.find_one_and_update(
+            {"_id": self.name},
+            {"$inc": {"seq": self.block_size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self._hi = int(doc["seq"])
+        self._next = self._hi - self.block_size + 1
+        metrics.SEQ_BLOCKS.labels(self.name).inc()
+        metrics.SEQ_AVAILABLE.labels(self.name).set(self.block_size)
+
+    def next(self, db) -> int:
+        with self._lock:
+            if self._pid != os.getpid():          # processus neuf (fork) : bloc hérité abandonné
+                self._pid = os.getpid()
+                self._next, self._hi = 1, 0
+            if self._next > self._hi:
+                self._reserve(db)
+            n = self._next
+            self._next += 1
+            left = self._hi - n
+        metrics.SEQ_ISSUED.labels(self.name).inc()
+        metrics.SEQ_AVAILABLE.labels(self.name).set(left)
+        return n
+
+    def next_str(self, db) -> str:
+        return self.fmt.format(self.next(db))
+
+
+# -------------------------------
+# Registre : une instance par nom et par processus
+# -------------------------------
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def sequence(name, block_size=None, fmt="{}"):
+    """Séquence partagée `name` (créée au premier appel)."""
+    seq = _registry.get(name)
+    if seq is None:
+        with _registry_lock:
+            seq = _registry.setdefault(name, BlockSequence(name, block_size, fmt))
+    return seq
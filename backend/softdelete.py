@@ -0,0 +1,52 @@
+# ===========================================================
+#  softdelete.py — suppression logique uniforme
+#
+#  Modèle : chaque document porte `deleted` explicitement.
+#    vivant     {deleted: false}
+#    supprimé   {deleted: true, deleted_at: <date>}
+#
+#  Toutes les lectures « vivantes » passent par live(q) (Mongo) / is_live(doc)
+#  (instantanés en mémoire, cf. refcache.py), un seul prédicat :
+#    - migrations bloquantes terminées (backfilled()) : LIVE, égalité
+#      {deleted: false} (et non plus {$ne: true}, négation que le planificateur
+#      ne borne pas). Les index des listes sont PARTIELS sur ce filtre
+#      (cf. indexes.py) : les documents supprimés n'y figurent pas, et seule
+#      une requête qui contient {deleted: false} peut les utiliser.
+#    - avant (ou migration en échec) : LEGACY, {deleted: {$ne: true}} ; les
+#      documents sans `deleted` restent listés.
+#
+#  Écritures :
+#    - création : "deleted": False posé par chaque route (et par seed/gen_data)
+#    - DELETE   : mark_deleted() (payments compris : le statut n'est plus
+#                 détourné en "cancelled")
+#
+#  Documents antérieurs (sans `deleted`, ou null) : migrations 0002_soft_delete_*
+#  (cf. migrations.py), bloquantes : les index partiels et le filtre strict
+#  n'entrent en jeu qu'une fois qu'elles sont terminées (cf. app.py).
+# ===========================================================
+
+LIVE = {"deleted": False}
+LEGACY = {"deleted": {"$ne": True}}
+
+_state = {"strict": False}      # par processus ; posé par backfilled()
+
+
+def backfilled():
+    """Migrations bloquantes terminées : `deleted` explicite partout -> filtre strict (LIVE)."""
+    _state["strict"] = True
+
+
+def live(q=None) -> dict:
+    """Filtre `q` restreint aux documents vivants."""
+    return {**(q or {}), **(LIVE if _state["strict"] else LEGACY)}
+
+
+def is_live(doc) -> bool:
+    """Même prédicat que live(), sur un document lu (projection avec `deleted`)."""
+    deleted = doc.get("deleted")
+    return deleted is False if _state["strict"] else deleted is not True
+
+
+def mark_deleted(coll, oid, now):
+    """Suppression logique d'un document (updated_at et deleted_at = now)."""
+    return coll.update_one({"_id": oid}, {"$set": {"deleted": True, "deleted_at": now, "updated_at": now}})
@@ -0,0 +1,171 @@
+# ===========================================================
+#  static_assets.py — service du front (SPA) depuis un manifeste
+#
+#  Au démarrage (dans le master en preload), STATIC_DIR est parcouru une
+#  fois : chemin -> fichier, type MIME, ETag (taille + mtime) et variantes
+#  pré-compressées (.br / .gz posées à côté du fichier par
+#  `python static_assets.py precompress static`, cf. Dockerfile).
+#  Une requête = un lookup de dict : plus de Path.exists() par requête,
+#  aucune compression à la volée.
+#
+#  Cache :
+#    assets/<nom>-<hash>.<ext>  (sorties hachées de vite build)
+#        Cache-Control: public, max-age=31536000, immutable
+#    le reste (index.html, public/…)
+#        Cache-Control: no-cache + ETag -> revalidation, 304 si inchangé
+#
+#  Chemin inconnu : index.html (routes du SPA), sauf sous assets/ -> 404
+#  (un bundle absent ne doit pas être servi comme du HTML).
+#
+#  Le manifeste reflète le build présent au démarrage : redémarrer après
+#  un nouveau build (l'image Docker embarque le build, donc rien à faire).
+# ===========================================================
+
+import mimetypes
+import os
+import re
+import sys
+import zlib
+from pathlib import Path
+
+from flask import abort, request, send_file
+
+try:
+    import brotli
+except ImportError:  # dépendance optionnelle : variantes .gz seulement
+    brotli = None
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+_HASHED = re.compile(r"^assets/.+-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$")
+
+# encodage -> suffixe de la variante, par ordre de préférence
+_VARIANTS = {"br": ".br", "gzip": ".gz"}
+
+# types à pré-compresser (les images raster / polices woff2 le sont déjà)
+_PRECOMPRESS_EXT = {".html", ".js", ".mjs", ".css", ".json", ".map", ".svg", ".txt", ".xml", ".ico", ".webmanifest"}
+PRECOMPRESS_MIN_BYTES = 1024
+
+
+def _etag(st):
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+class Asset:
+    __slots__ = ("path", "mimetype", "etag", "immutable", "variants")
+
+    def __init__(self, path, rel):
+        self.path = str(path)
+        self.mimetype = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        self.etag = _etag(path.stat())
+        self.immutable = bool(_HASHED.match(rel))
+        self.variants = {}              # encodage -> chemin
+
+
+class Manifest:
+    """Fichiers de `root` indexés par chemin relatif (posix)."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.assets = {}
+        if not self.root.is_dir():
+            return
+        suffixes = {suffix: enc for enc, suffix in _VARIANTS.items()}
+        variants = []
+        for path in sorted(self.root.rglob("*")):
+            if not path.is_file():
+                continue
+            rel = path.relative_to(self.root).as_posix()
+            if path.suffix in suffixes:
+                variants.append((rel[: -len(path.suffix)], suffixes[path.suffix], path))
+            else:
+                self.assets[rel] = Asset(path, rel)
+        for rel, enc, path in variants:
+            asset = self.assets.get(rel)
+            if asset is not None:
+                asset.variants[enc] = str(path)
+            else:                                   # vrai fichier .gz / .br, servi tel quel
+                self.assets[rel + _VARIANTS[enc]] = Asset(path, rel + _VARIANTS[enc])
+
+    def __len__(self):
+        return len(self.assets)
+
+    def get(self, rel):
+        return self.assets.get(rel)
+
+
+def _pick(asset):
+    """Variante acceptée par le client (q-values respectées, ordre de _VARIANTS à q égal)."""
+    best, best_q = None, 0
+    for enc in _VARIANTS:
+        if enc in asset.variants:
+            q = request.accept_encodings[enc]
+            if q > best_q:
+                best, best_q = enc, q
+    return best
+
+
+def serve(manifest, path):
+    """Réponse pour GET /<path> (catch-all du front)."""
+    asset = manifest.get(path) if path else None
+    if asset is None:
+        if path.startswith("assets/"):
+            abort(404)
+        asset = manifest.get("index.html")
+        if asset is None:
+            abort(404)
+
+    enc = _pick(asset)
+    file = asset.variants[enc] if enc else asset.path
+    etag = f"{asset.etag}-{enc}" if enc else asset.etag
+    resp = send_file(
+        file, mimetype=asset.mimetype, etag=etag, conditional=True,
+        max_age=IMMUTABLE_MAX_AGE if asset.immutable else None,
+    )
+    if asset.immutable:
+        resp.cache_control.immutable = True
+    else:
+        resp.cache_control.no_cache = True
+        resp.cache_control.public = True
+    if enc:
+        resp.headers["Content-Encoding"] = enc
+    if asset.variants:
+        resp.vary.add("Accept-Encoding")
+    return resp
+
+
+# -------------------------------
+# Pré-compression (build)
+# -------------------------------
+def precompress(root, log=print):
+    """Écrit <fichier>.gz (et <fichier>.br si brotli est installé), compression maximale."""
+    written = 0
+    for path in sorted(Path(root).rglob("*")):
+        if not path.is_file() or path.suffix not in _PRECOMPRESS_EXT:
+            continue
+        data = path.read_bytes()
+        if len(data) < PRECOMPRESS_MIN_BYTES:
+            continue
+        outputs = {".gz": _gzip(data)}
+        if brotli is not None:
+            outputs[".br"] = brotli.compress(data, quality=11)
+        for suffix, out in outputs.items():
+            if len(out) < len(data) * 0.9:              # gain négligeable : pas de variante
+                target = path.with_name(path.name + suffix)
+                target.write_bytes(out)
+                os.utime(target, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns))
+                written += 1
+    log(f"[static] {written} variantes écrites dans {root}")
+    return written
+
+
+def _gzip(data):
+    c = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return c.compress(data) + c.flush()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["precompress"]:
+        print("usage: python static_assets.py precompress [répertoire]")
+        sys.exit(2)
+    precompress(sys.argv[2] if len(sys.argv) > 2 else Path(__file__).resolve().parent / "static")
@@ -0,0 +1,85 @@
+# ===========================================================
+#  streaming.py — réponses de liste en streaming (opt-in)
+#
+#  Par défaut, une route list_ renvoie un tableau JSON classique.
+#  Le client peut demander un rendu en flux, encodé document par document
+#  directement depuis le curseur pymongo (mémoire bornée, premier octet
+#  envoyé dès le premier batch) :
+#
+#    Accept: application/x-ndjson   -> un document JSON par ligne
+#    ?stream=1                      -> tableau JSON envoyé en chunks
+#
+#  STREAM_BATCH_SIZE (100) : taille des batchs Mongo (getMore) et nombre
+#  de documents encodés par chunk HTTP.
+# ===========================================================
+
+import os
+
+from flask import Response, current_app, request
+
+NDJSON = "application/x-ndjson"
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "100"))
+
+
+def stream_mode():
+    """'ndjson', 'array' ou None selon la requête courante."""
+    if NDJSON in request.headers.get("Accept", ""):
+        return "ndjson"
+    if request.args.get("stream", "").lower() in ("1", "true", "yes"):
+        return "array"
+    return None
+
+
+def _chunks(cursor, dumps, sep, batch):
+    """Encode le curseur par paquets de `batch` documents ; ferme le curseur en fin (ou abandon client)."""
+    buf = []
+    try:
+        for doc in cursor:
+            buf.append(dumps(doc))
+            if len(buf) >= batch:
+                yield sep.join(buf)
+                buf = []
+        if buf:
+            yield sep.join(buf)
+    finally:
+        close = getattr(cursor, "close", None)      # itérables en mémoire (refcache) : rien à fermer
+        if close is not None:
+            close()
+
+
+def _ndjson(cursor, dumps, batch):
+    for chunk in _chunks(cursor, dumps, b"\n", batch):
+        yield chunk + b"\n"
+
+
+def _array(cursor, dumps, batch):
+    yield b"["
+    first = True
+    for chunk in _chunks(cursor, dumps, b",", batch):
+        yield chunk if first else b"," + chunk
+        first = False
+    yield b"]"
+
+
+def list_response(cursor, status=200, headers=None):
+    """
+    Réponse d'une route list_ à partir d'un curseur (find ou aggregate) ou d'un
+    itérable de documents. Sans streaming demandé : tableau JSON classique.
+    """
+    mode = stream_mode()
+    if mode is None:
+        return list(cursor), status, headers or {}
+
+    batch = STREAM_BATCH_SIZE
+    if hasattr(cursor, "batch_size"):
+        cursor.batch_size(batch)
+    dumps = current_app.json.dumps_bytes
+
+    if mode == "ndjson":
+        body, mimetype = _ndjson(cursor, dumps, batch), NDJSON
+    else:
+        body, mimetype = _array(cursor, dumps, batch), "application/json"
+
+    resp = Response(body, status=status, mimetype=mimetype, headers=headers)
+    resp.headers["X-Accel-Buffering"] = "no"   # pas de bufferisation côté reverse proxy
+    return resp
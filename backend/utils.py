@@ -1,13 +1,60 @@
-from flask import current_app
+import os
+import threading
+import time
+from flask import current_app, request, abort
 from bson import ObjectId
 from bson.errors import InvalidId
 from datetime import datetime, timezone
 from functools import wraps
 
+import invalidation
+
+# Cache d'existence (optionnel) : ids vus récemment, par processus.
+# EXISTS_CACHE_TTL=0 (défaut) -> désactivé. Seules les existences sont mises en cache
+# (un id absent est toujours revérifié) ; les suppressions étant logiques (deleted),
+# un id existant le reste. Une suppression physique (mongo-express…) vue par le
+# change stream retire l'id du cache (cf. invalidation.py).
+EXISTS_CACHE_TTL = float(os.getenv("EXISTS_CACHE_TTL", "0"))
+EXISTS_CACHE_SIZE = int(os.getenv("EXISTS_CACHE_SIZE", "10000"))
+EXISTS_CACHE_COLLECTIONS = set(os.getenv("EXISTS_CACHE_COLLECTIONS", "patients,doctors").split(","))
+_exists_cache = {}    # (collection, _id) -> échéance (time.monotonic)
+_exists_lock = threading.Lock()     # threads des requêtes + thread d'invalidation
+
+
+def _on_delete(coll, ids):
+    with _exists_lock:
+        if ids is None:
+            for k in [k for k in _exists_cache if k[0] == coll]:
+                _exists_cache.pop(k, None)
+        else:
+            for i in ids:
+                _exists_cache.pop((coll, i), None)
+
+
+if EXISTS_CACHE_TTL > 0:
+    for _coll in EXISTS_CACHE_COLLECTIONS:
+        invalidation.subscribe(_coll, _on_delete, ops=("delete",))
+
 def strip_none(d: dict) -> dict:
     """Supprime les clés dont la valeur est None."""
     return {k: v for k, v in d.items() if v is not None}
 
+def json_body(silent: bool = False):
+    """
+    Corps JSON de la requête, décodé par le provider de l'app (orjson).
+    Ignore le Content-Type (comme get_json(force=True)).
+    Corps vide -> {} ; JSON invalide -> 400 (ou {} si silent=True).
+    """
+    data = request.get_data(cache=True)
+    if not data:
+        return {}
+    try:
+        return current_app.json.loads(data)
+    except ValueError:
+        if silent:
+            return {}
+        abort(400, description="JSON invalide")
+
 def iso_to_dt(val, field_name: str | None = None):
     """
     Convertit une chaîne ISO (ou datetime) en datetime aware UTC.
@@ -44,7 +91,73 @@ def validate_objectid(id_str: str, field_name: str = "ID"):
     except InvalidId:
         raise ValueError(f"{field_name} invalide")
 
+def _cache_hit(coll, doc_id, now):
+    with _exists_lock:
+        exp = _exists_cache.get((coll, doc_id))
+    return exp is not None and exp > now
+
+def _cache_put(coll, doc_id, now):
+    with _exists_lock:
+        if len(_exists_cache) >= EXISTS_CACHE_SIZE:
+            # purge des entrées expirées, sinon des plus anciennes (ordre d'insertion)
+            for k in [k for k, exp in _exists_cache.items() if exp <= now] or list(_exists_cache)[:EXISTS_CACHE_SIZE // 10 or 1]:
+                _exists_cache.pop(k, None)
+        _exists_cache[(coll, doc_id)] = now + EXISTS_CACHE_TTL
+
+def existing_refs(refs):
+    """
+    Références existantes parmi refs (tuples (collection, _id, …)) -> set de (collection, _id).
+    Une seule requête quel que soit le nombre de collections : aggregate sur la première,
+    les autres jointes par $unionWith, projection _id seulement.
+    """
+    now = time.monotonic()
+    use_cache = EXISTS_CACHE_TTL > 0
+    found, by_coll = set(), {}
+    for coll, doc_id, *_ in refs:
+        if coll is None or doc_id is None:
+            continue
+        if use_cache and coll in EXISTS_CACHE_COLLECTIONS and _cache_hit(coll, doc_id, now):
+            found.add((coll, doc_id))
+        else:
+            by_coll.setdefault(coll, set()).add(doc_id)
+    if not by_coll:
+        return found
+
+    db = current_app.db
+    colls = list(by_coll)
+    if len(colls) == 1 and len(by_coll[colls[0]]) == 1:
+        coll, doc_id = colls[0], next(iter(by_coll[colls[0]]))
+        fetched = {(coll, doc_id)} if db[coll].find_one({"_id": doc_id}, {"_id": 1}) else set()
+    else:
+        stages = [
+            [{"$match": {"_id": {"$in": list(by_coll[c])}}}, {"$project": {"_id": 1, "c": {"$literal": c}}}]
+            for c in colls
+        ]
+        pipeline = stages[0] + [{"$unionWith": {"coll": c, "pipeline": st}} for c, st in zip(colls[1:], stages[1:])]
+        fetched = {(d["c"], d["_id"]) for d in db[colls[0]].aggregate(pipeline)}
+
+    if use_cache:
+        for coll, doc_id in fetched:
+            if coll in EXISTS_CACHE_COLLECTIONS:
+                _cache_put(coll, doc_id, now)
+    return found | fetched
+
+def missing_refs(*refs):
+    """
+    Vérifie en un seul aller-retour l'existence de plusieurs références.
+    refs : tuples (collection, _id, libellé) ; les _id (ou collections) None sont ignorés.
+    Retourne les libellés des références absentes, dans l'ordre des refs.
+    """
+    found = existing_refs(refs)
+    return [label for coll, doc_id, label in refs
+            if coll is not None and doc_id is not None and (coll, doc_id) not in found]
+
+def check_refs(*refs):
+    """Comme missing_refs, mais lève FileNotFoundError("<libellé> introuvable") pour la première absente."""
+    missing = missing_refs(*refs)
+    if missing:
+        raise FileNotFoundError(f"{missing[0]} introuvable")
+
 def check_exists(coll: str, doc_id: ObjectId, field_name: str):
     """Vérifie l'existence d'un document, lève une exception 404 si absent."""
-    if not current_app.db[coll].find_one({"_id": doc_id}, {"_id": 1}):
-        raise FileNotFoundError(f"{field_name} introuvable")
\ No newline at end of file
+    check_refs((coll, doc_id, field_name))
\ No newline at end of file
@@ -0,0 +1,30 @@
+# ===========================================================
+#  versions.py — numéros de version des données de référence
+#
+#  Collection `cache_versions` : {_id: <nom>, v: N, updated_at}
+#  Chaque écriture sur une donnée mise en cache par les workers (doctors,
+#  facilities…) incrémente sa version ; les caches de refcache.py comparent
+#  leur version chargée à celle en base pour savoir s'ils sont périmés.
+#
+#  Lecture : un find sur quelques _id (index _id), au plus une fois par
+#  REFCACHE_CHECK_SECONDS et par cache dans chaque worker.
+# ===========================================================
+
+from datetime import datetime, timezone
+
+COLLECTION = "cache_versions"
+
+
+def bump(db, *names):
+    """Incrémente la version de chaque nom (après une écriture)."""
+    now = datetime.now(timezone.utc)
+    for name in names:
+        db[COLLECTION].update_one({"_id": name}, {"$inc": {"v": 1}, "$set": {"updated_at": now}}, upsert=True)
+
+
+def current(db, names):
+    """{nom: version} (0 si jamais incrémentée) en une requête."""
+    out = {n: 0 for n in names}
+    for d in db[COLLECTION].find({"_id": {"$in": list(names)}}, {"v": 1}):
+        out[d["_id"]] = int(d.get("v", 0))
+    return out
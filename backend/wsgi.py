@@ -0,0 +1,9 @@
+# wsgi.py — point d'entrée production
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Avec preload_app=True, ce module est importé une seule fois dans le master,
+# puis chaque worker forké recrée ses ressources (MongoClient…) via post_fork.
+from app import create_app
+
+app = create_app()